@@ -29,6 +29,7 @@ def make_il_agent(obs_shape, action_shape, args, dynamics_input_shape):
         num_layers=args.num_layers,
         num_shared_layers=args.num_shared_layers,
         num_filters=args.num_filters,
+        device=args.device,
     )
 
 
@@ -169,7 +170,9 @@ class SacSSAgent(object):
         num_layers=4,
         num_shared_layers=4,
         num_filters=32,
+        device=None,
     ):
+        self.device = utils.get_device(device)
         self.encoder_tau = encoder_tau
         self.actor_update_freq = actor_update_freq
         self.ss_update_freq = ss_update_freq
@@ -181,10 +184,10 @@ class SacSSAgent(object):
             obs_shape, action_shape, dynamics_output_shape, hidden_dim,
             encoder_feature_dim,
             num_layers, num_filters, num_layers
-        ).cuda()
+        ).to(self.device)
 
         # Domain specific part
-        self.domain_spe = DomainSpecific(dynamics_input_shape, dynamics_output_shape).cuda()
+        self.domain_spe = DomainSpecific(dynamics_input_shape, dynamics_output_shape).to(self.device)
         # Initialize feat_vect
         self.dynamics_output_shape = dynamics_output_shape
         self.feat_vect = None
@@ -193,10 +196,10 @@ class SacSSAgent(object):
         self.ss_encoder = make_encoder(
             obs_shape, encoder_feature_dim, num_layers,
             num_filters, num_shared_layers
-        ).cuda()
+        ).to(self.device)
 
         self.ss_encoder.copy_conv_weights_from(self.actor.encoder, num_shared_layers)
-        self.inv = InvFunction(encoder_feature_dim, action_shape[0], dynamics_output_shape, hidden_dim).cuda()
+        self.inv = InvFunction(encoder_feature_dim, action_shape[0], dynamics_output_shape, hidden_dim).to(self.device)
         self.inv.apply(weight_init)
 
         # actor optimizers
@@ -215,7 +218,7 @@ class SacSSAgent(object):
         self.train()
 
     def init_feat_vect(self, init_value):
-        self.feat_vect = torch.tensor(init_value).unsqueeze(0).float().cuda()
+        self.feat_vect = torch.tensor(init_value).unsqueeze(0).float().to(self.device)
         self.feat_vect.requires_grad = True
         self.feat_vect_optimizer = torch.optim.Adam(
             [self.feat_vect], lr=1e-3
@@ -242,14 +245,14 @@ class SacSSAgent(object):
     def select_action(self, obs, mass=None, force = None):
         with torch.no_grad():
                 if isinstance(obs, np.ndarray):
-                    obs = torch.FloatTensor(obs).cuda()
+                    obs = torch.FloatTensor(obs).to(self.device)
                 obs = obs.unsqueeze(0)
                 if mass is not None: # If we're in the training phase
-                    mass = torch.FloatTensor(mass).cuda()
+                    mass = torch.FloatTensor(mass).to(self.device)
                     mass = mass.unsqueeze(0)
                     dyn_feat = self.domain_spe(mass)
                 elif force is not None:
-                    force = torch.FloatTensor(force).cuda()
+                    force = torch.FloatTensor(force).to(self.device)
                     force = force.unsqueeze(0)
                     dyn_feat = self.domain_spe(force)
                 else: # If we're at test phase
@@ -272,13 +275,13 @@ class SacSSAgent(object):
         # TODO should we move obs to cuda ?
 
         if mass is not None:
-            mass = torch.FloatTensor(mass).cuda()
+            mass = torch.FloatTensor(mass).to(self.device)
             mass = mass.repeat(obs.shape[0], 1) # create a batch of masses
 
             dyn_feat = self.domain_spe(mass) # compute dynamics features
         
         elif force is not None:
-            force = torch.FloatTensor(force).cuda()
+            force = torch.FloatTensor(force).to(self.device)
             force = force.repeat(obs.shape[0], 1) # create a batch of forces
             
             dyn_feat = self.domain_spe(force) # compute dynamics features
@@ -352,10 +355,10 @@ class SacSSAgent(object):
     def extract_feat_vect(self, mass= None, force = None):
         """Extract dynamics feature vector to check if stays constant"""
         if mass is not None:
-            mass = torch.as_tensor(mass).float().unsqueeze(0).cuda()
+            mass = torch.as_tensor(mass).float().unsqueeze(0).to(self.device)
             return self.domain_spe(mass).cpu().data.numpy().flatten()
         else:
-            force = torch.as_tensor(force).float().unsqueeze(0).cuda()
+            force = torch.as_tensor(force).float().unsqueeze(0).to(self.device)
             return self.domain_spe(force).cpu().data.numpy().flatten()
 
     def save(self, model_dir, step):
@@ -383,17 +386,17 @@ class SacSSAgent(object):
 
     def load(self, model_dir, step):
         self.actor.load_state_dict(
-            torch.load('%s/actor_%s.pt' % (model_dir, step))
+            torch.load('%s/actor_%s.pt' % (model_dir, step), map_location=self.device)
         )
 
         self.inv.load_state_dict(
-            torch.load('%s/inv_%s.pt' % (model_dir, step))
+            torch.load('%s/inv_%s.pt' % (model_dir, step), map_location=self.device)
         )
 
         self.ss_encoder.load_state_dict(
-            torch.load('%s/ss_encoder_%s.pt' % (model_dir, step))
+            torch.load('%s/ss_encoder_%s.pt' % (model_dir, step), map_location=self.device)
         )
 
         self.domain_spe.load_state_dict(
-            torch.load('%s/domain_specific_%s.pt' % (model_dir, step))
+            torch.load('%s/domain_specific_%s.pt' % (model_dir, step), map_location=self.device)
         )
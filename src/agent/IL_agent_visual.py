@@ -37,6 +37,7 @@ def make_il_agent_visual(obs_shape, action_shape, args, dynamics_output_shape=10
         num_layers=args.num_layers,
         num_shared_layers=args.num_shared_layers,
         num_filters=args.num_filters,
+        device=args.device,
     )
 
 
@@ -229,7 +230,9 @@ class SacSSAgent(object):
             num_layers=4,
             num_shared_layers=4,
             num_filters=32,
+            device=None,
     ):
+        self.device = utils.get_device(device)
         self.encoder_tau = encoder_tau
         self.actor_update_freq = actor_update_freq
         self.ss_update_freq = ss_update_freq
@@ -241,24 +244,24 @@ class SacSSAgent(object):
             obs_shape, action_shape, dynamics_output_shape, hidden_dim,
             encoder_feature_dim,
             num_layers, num_filters, num_layers
-        ).cuda()
+        ).to(self.device)
 
         # Domain specific part
         # self.domain_spe = DomainSpecificTemporal(obs_shape, action_shape, encoder_feature_dim,
         #                                        num_layers, num_filters, num_shared_layers,
-        #                                        dynamics_output_shape).cuda()
+        #                                        dynamics_output_shape).to(self.device)
         self.domain_spe = DomainSpecificVisual(obs_shape, action_shape, encoder_feature_dim,
-                                               num_layers, num_filters, num_shared_layers, dynamics_output_shape).cuda()
+                                               num_layers, num_filters, num_shared_layers, dynamics_output_shape).to(self.device)
         self.domain_spe.encoder.copy_conv_weights_from(self.actor.encoder, num_shared_layers)
 
         # Self-supervision
         self.ss_encoder = make_encoder(
             obs_shape, encoder_feature_dim, num_layers,
             num_filters, num_shared_layers
-        ).cuda()
+        ).to(self.device)
 
         self.ss_encoder.copy_conv_weights_from(self.actor.encoder, num_shared_layers)
-        self.inv = InvFunction(encoder_feature_dim, action_shape[0], dynamics_output_shape, hidden_dim).cuda()
+        self.inv = InvFunction(encoder_feature_dim, action_shape[0], dynamics_output_shape, hidden_dim).to(self.device)
         self.inv.apply(weight_init)
 
         # actor optimizers
@@ -297,7 +300,7 @@ class SacSSAgent(object):
     def select_action(self, obs, traj):
         with torch.no_grad():
             if isinstance(obs, np.ndarray):
-                obs = torch.FloatTensor(obs).cuda()
+                obs = torch.FloatTensor(obs).to(self.device)
             obs = obs.unsqueeze(0)
 
             dyn_feat = self.domain_spe(*traj) # *traj is equivalent to obs1, act1, obs2, act2, obs3
@@ -419,17 +422,17 @@ class SacSSAgent(object):
 
     def load(self, model_dir, step):
         self.actor.load_state_dict(
-            torch.load('%s/actor_%s.pt' % (model_dir, step))
+            torch.load('%s/actor_%s.pt' % (model_dir, step), map_location=self.device)
         )
 
         self.inv.load_state_dict(
-            torch.load('%s/inv_%s.pt' % (model_dir, step))
+            torch.load('%s/inv_%s.pt' % (model_dir, step), map_location=self.device)
         )
 
         self.ss_encoder.load_state_dict(
-            torch.load('%s/ss_encoder_%s.pt' % (model_dir, step))
+            torch.load('%s/ss_encoder_%s.pt' % (model_dir, step), map_location=self.device)
         )
 
         self.domain_spe.load_state_dict(
-            torch.load('%s/domain_specific_%s.pt' % (model_dir, step))
+            torch.load('%s/domain_specific_%s.pt' % (model_dir, step), map_location=self.device)
         )
@@ -1,3 +1,4 @@
+import re
 import numpy as np
 import torch
 import torch.nn as nn
@@ -39,6 +40,11 @@ def make_agent(obs_shape, action_shape, args):
         num_shared_layers=args.num_shared_layers,
         num_filters=args.num_filters,
         curl_latent_dim=args.curl_latent_dim,
+        device=args.device,
+        channels_last=args.channels_last,
+        share_features=args.share_features,
+        num_q=args.num_q,
+        fused_critic=args.fused_critic,
     )
 
 
@@ -101,9 +107,9 @@ class Actor(nn.Module):
         self.apply(weight_init)
 
     def forward(
-        self, obs, compute_pi=True, compute_log_pi=True, detach_encoder=False
+        self, obs, compute_pi=True, compute_log_pi=True, detach_encoder=False, shared_conv=None
     ):
-        obs = self.encoder(obs, detach=detach_encoder)
+        obs = self.encoder(obs, detach=detach_encoder, shared_conv=shared_conv)
 
         mu, log_std = self.trunk(obs).chunk(2, dim=-1)
 
@@ -149,6 +155,67 @@ class QFunction(nn.Module):
         return self.trunk(obs_action)
 
 
+class EnsembleQFunction(nn.Module):
+    """num_q MLPs for q-functions, evaluated together with batched matmuls over a leading ensemble dimension"""
+    def __init__(self, obs_dim, action_dim, hidden_dim, num_q=2):
+        super().__init__()
+        self.num_q = num_q
+        dims = [obs_dim + action_dim, hidden_dim, hidden_dim, 1]
+        self.weights = nn.ParameterList(
+            [nn.Parameter(torch.empty(num_q, d_in, d_out)) for d_in, d_out in zip(dims[:-1], dims[1:])]
+        )
+        self.biases = nn.ParameterList(
+            [nn.Parameter(torch.zeros(num_q, 1, d_out)) for d_out in dims[1:]]
+        )
+        # orthogonal init of every q-function, as weight_init does for the layers of QFunction
+        with torch.no_grad():
+            for weight in self.weights:
+                for q in range(num_q):
+                    weight[q].copy_(nn.init.orthogonal_(torch.empty(weight.shape[2], weight.shape[1])).t())
+
+    def forward(self, obs, action):
+        assert obs.size(0) == action.size(0)
+
+        obs_action = torch.cat([obs, action], dim=1)
+        h = obs_action.unsqueeze(0).expand(self.num_q, *obs_action.shape)
+        for i, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            h = torch.baddbmm(bias, h, weight)
+            if i < len(self.weights) - 1:
+                h = torch.relu(h)
+        return h
+
+
+def pack_q_functions(state_dict):
+    """Returns a Critic state dict with its Q1, ..., QN QFunction weights stacked as the EnsembleQFunction Q"""
+    num_q = sum(re.fullmatch(r'Q\d+\.trunk\.0\.weight', key) is not None for key in state_dict)
+    if num_q == 0:
+        return state_dict
+    state_dict = dict(state_dict)
+    layer = 0
+    while f'Q1.trunk.{2 * layer}.weight' in state_dict:
+        weights = [state_dict.pop(f'Q{q}.trunk.{2 * layer}.weight') for q in range(1, num_q + 1)]
+        biases = [state_dict.pop(f'Q{q}.trunk.{2 * layer}.bias') for q in range(1, num_q + 1)]
+        state_dict[f'Q.weights.{layer}'] = torch.stack([w.t() for w in weights])
+        state_dict[f'Q.biases.{layer}'] = torch.stack(biases).unsqueeze(1)
+        layer += 1
+    return state_dict
+
+
+def unpack_q_functions(state_dict):
+    """Returns a Critic state dict with its EnsembleQFunction Q split into the Q1, ..., QN QFunction weights"""
+    if 'Q.weights.0' not in state_dict:
+        return state_dict
+    state_dict = dict(state_dict)
+    layers = []
+    while f'Q.weights.{len(layers)}' in state_dict:
+        layers.append((state_dict.pop(f'Q.weights.{len(layers)}'), state_dict.pop(f'Q.biases.{len(layers)}')))
+    for q in range(layers[0][0].shape[0]):
+        for layer, (weights, biases) in enumerate(layers):
+            state_dict[f'Q{q + 1}.trunk.{2 * layer}.weight'] = weights[q].t().contiguous()
+            state_dict[f'Q{q + 1}.trunk.{2 * layer}.bias'] = biases[q, 0].clone()
+    return state_dict
+
+
 class RotFunction(nn.Module):
     """MLP for rotation prediction."""
     def __init__(self, obs_dim, hidden_dim):
@@ -190,12 +257,12 @@ class CURL(nn.Module):
         self.W = nn.Parameter(torch.rand(z_dim, z_dim))
         self.output_type = output_type
 
-    def encode(self, x, detach=False, ema=False):
+    def encode(self, x, detach=False, ema=False, shared_conv=None):
         if ema:
             with torch.no_grad():
                 z_out = self.encoder_target(x)
         else:
-            z_out = self.encoder(x)
+            z_out = self.encoder(x, shared_conv=shared_conv)
 
         if detach:
             z_out = z_out.detach()
@@ -209,10 +276,12 @@ class CURL(nn.Module):
 
 
 class Critic(nn.Module):
-    """Critic network, employes two q-functions."""
+    """Critic network, employes num_q q-functions, two by default.
+    With fused, the q-functions are a single EnsembleQFunction Q instead of QFunctions Q1, ..., QN.
+    load_state_dict accepts the state dicts of both."""
     def __init__(
         self, obs_shape, action_shape, hidden_dim,
-        encoder_feature_dim, num_layers, num_filters, num_shared_layers
+        encoder_feature_dim, num_layers, num_filters, num_shared_layers, num_q=2, fused=False
     ):
         super().__init__()
 
@@ -221,22 +290,31 @@ class Critic(nn.Module):
             num_filters, num_shared_layers
         )
 
-        self.Q1 = QFunction(
-            self.encoder.feature_dim, action_shape[0], hidden_dim
-        )
-        self.Q2 = QFunction(
-            self.encoder.feature_dim, action_shape[0], hidden_dim
-        )
+        self.fused = fused
+        if fused:
+            self.Q = EnsembleQFunction(
+                self.encoder.feature_dim, action_shape[0], hidden_dim, num_q
+            )
+            self.q_functions = [self.Q]
+        else:
+            for q in range(1, num_q + 1):
+                setattr(self, f'Q{q}', QFunction(
+                    self.encoder.feature_dim, action_shape[0], hidden_dim
+                ))
+            self.q_functions = [getattr(self, f'Q{q}') for q in range(1, num_q + 1)]
         self.apply(weight_init)
 
-    def forward(self, obs, action, detach_encoder=False):
-        # detach_encoder allows to stop gradient propogation to encoder
-        obs = self.encoder(obs, detach=detach_encoder)
+    def load_state_dict(self, state_dict, strict=True, assign=False):
+        state_dict = pack_q_functions(state_dict) if self.fused else unpack_q_functions(state_dict)
+        return super().load_state_dict(state_dict, strict=strict, assign=assign)
 
-        q1 = self.Q1(obs, action)
-        q2 = self.Q2(obs, action)
+    def forward(self, obs, action, detach_encoder=False, shared_conv=None):
+        # detach_encoder allows to stop gradient propogation to encoder
+        obs = self.encoder(obs, detach=detach_encoder, shared_conv=shared_conv)
 
-        return q1, q2
+        if self.fused:
+            return tuple(self.Q(obs, action).unbind(0))
+        return tuple(q(obs, action) for q in self.q_functions)
 
 
 class SacSSAgent(object):
@@ -274,7 +352,13 @@ class SacSSAgent(object):
         num_shared_layers=4,
         num_filters=32,
         curl_latent_dim=128,
+        device=None,
+        channels_last=False,
+        share_features=False,
+        num_q=2,
+        fused_critic=False,
     ):
+        self.device = utils.get_device(device)
         self.discount = discount
         self.critic_tau = critic_tau
         self.encoder_tau = encoder_tau
@@ -285,6 +369,7 @@ class SacSSAgent(object):
         self.use_inv = use_inv
         self.use_curl = use_curl
         self.curl_latent_dim = curl_latent_dim
+        self.share_features = share_features
 
         assert num_layers >= num_shared_layers, 'num shared layers cannot exceed total amount'
 
@@ -292,24 +377,24 @@ class SacSSAgent(object):
             obs_shape, action_shape, hidden_dim,
             encoder_feature_dim, actor_log_std_min, actor_log_std_max,
             num_layers, num_filters, num_layers
-        ).cuda()
+        ).to(self.device)
 
         self.critic = Critic(
             obs_shape, action_shape, hidden_dim,
-            encoder_feature_dim, num_layers, num_filters, num_layers
-        ).cuda()
+            encoder_feature_dim, num_layers, num_filters, num_layers, num_q, fused_critic
+        ).to(self.device)
 
         self.critic_target = Critic(
             obs_shape, action_shape, hidden_dim,
-            encoder_feature_dim, num_layers, num_filters, num_layers
-        ).cuda()
+            encoder_feature_dim, num_layers, num_filters, num_layers, num_q, fused_critic
+        ).to(self.device)
 
         self.critic_target.load_state_dict(self.critic.state_dict())
 
         # tie encoders between actor and critic
         self.actor.encoder.copy_conv_weights_from(self.critic.encoder)
 
-        self.log_alpha = torch.tensor(np.log(init_temperature)).cuda()
+        self.log_alpha = torch.tensor(np.log(init_temperature)).to(self.device)
         self.log_alpha.requires_grad = True
         # set target entropy to -|A|
         self.target_entropy = -np.prod(action_shape)
@@ -319,28 +404,36 @@ class SacSSAgent(object):
         self.inv = None
         self.curl = None
         self.ss_encoder = None
+        self._inv_step_cache = None
 
         if use_rot or use_inv:
             self.ss_encoder = make_encoder(
                 obs_shape, encoder_feature_dim, num_layers,
                 num_filters, num_shared_layers
-            ).cuda()
+            ).to(self.device)
             self.ss_encoder.copy_conv_weights_from(self.critic.encoder, num_shared_layers)
             
             # rotation
             if use_rot:
-                self.rot = RotFunction(encoder_feature_dim, hidden_dim).cuda()
+                self.rot = RotFunction(encoder_feature_dim, hidden_dim).to(self.device)
                 self.rot.apply(weight_init)
 
             # inverse dynamics
             if use_inv:
-                self.inv = InvFunction(encoder_feature_dim, action_shape[0], hidden_dim).cuda()
+                self.inv = InvFunction(encoder_feature_dim, action_shape[0], hidden_dim).to(self.device)
                 self.inv.apply(weight_init)
             
         # curl
         if use_curl:
             self.curl = CURL(obs_shape, encoder_feature_dim,
-                self.curl_latent_dim, self.critic, self.critic_target, output_type='continuous').cuda()
+                self.curl_latent_dim, self.critic, self.critic_target, output_type='continuous').to(self.device)
+
+        # channels-last convolutions are faster on CPU, .to keeps the tied conv weights shared
+        self.channels_last = channels_last
+        if channels_last:
+            for module in [self.actor, self.critic, self.critic_target, self.ss_encoder]:
+                if module is not None:
+                    module.to(memory_format=torch.channels_last)
 
         # ss optimizers
         self.init_ss_optimizers(encoder_lr, ss_lr)
@@ -402,7 +495,7 @@ class SacSSAgent(object):
 
     def select_action(self, obs, mass=None):
         with torch.no_grad():
-            obs = torch.FloatTensor(obs).cuda()
+            obs = torch.FloatTensor(obs).to(self.device)
             obs = obs.unsqueeze(0)
             mu, _, _, _ = self.actor(
                 obs, compute_pi=False, compute_log_pi=False
@@ -411,23 +504,28 @@ class SacSSAgent(object):
 
     def sample_action(self, obs):
         with torch.no_grad():
-            obs = torch.FloatTensor(obs).cuda()
+            obs = torch.FloatTensor(obs).to(self.device)
             obs = obs.unsqueeze(0)
             mu, pi, _, _ = self.actor(obs, compute_log_pi=False)
             return pi.cpu().data.numpy().flatten()
 
+    def sample_actions(self, obs):
+        """Samples one action for each observation of a batch"""
+        with torch.no_grad():
+            obs = torch.FloatTensor(obs).to(self.device)
+            mu, pi, _, _ = self.actor(obs, compute_log_pi=False)
+            return pi.cpu().data.numpy()
+
     def update_critic(self, obs, action, reward, next_obs, not_done, L, step):
         with torch.no_grad():
             _, policy_action, log_pi, _ = self.actor(next_obs)
-            target_Q1, target_Q2 = self.critic_target(next_obs, policy_action)
-            target_V = torch.min(target_Q1,
-                                 target_Q2) - self.alpha.detach() * log_pi
+            target_Qs = self.critic_target(next_obs, policy_action)
+            target_V = torch.stack(target_Qs).min(0)[0] - self.alpha.detach() * log_pi
             target_Q = reward + (not_done * self.discount * target_V)
 
         # get current Q estimates
-        current_Q1, current_Q2 = self.critic(obs, action)
-        critic_loss = F.mse_loss(current_Q1,
-                                 target_Q) + F.mse_loss(current_Q2, target_Q)
+        current_Qs = self.critic(obs, action)
+        critic_loss = sum(F.mse_loss(current_Q, target_Q) for current_Q in current_Qs)
         L.log('train_critic/loss', critic_loss, step)
 
         # Optimize the critic
@@ -436,7 +534,7 @@ class SacSSAgent(object):
         self.critic_optimizer.step()
 
 
-    def update_actor_and_alpha(self, obs, L=None, step=None, update_alpha=True, bca_loss = False, buffer=None, clone=None):
+    def update_actor_and_alpha(self, obs, L=None, step=None, update_alpha=True, bca_loss = False, buffer=None, clone=None, shared_conv=None):
         # detach encoder, so we don't update it with the actor loss
 
         if bca_loss : # If we're in the test phase and want to adapt using clone actions
@@ -457,9 +555,9 @@ class SacSSAgent(object):
             actor_loss = kl_loss(log_pi, log_pi_target)
 
         else : # We're in the training phase
-            _, pi, log_pi, log_std = self.actor(obs, detach_encoder=True)
-            actor_Q1, actor_Q2 = self.critic(obs, pi, detach_encoder=True)
-            actor_Q = torch.min(actor_Q1, actor_Q2)
+            _, pi, log_pi, log_std = self.actor(obs, detach_encoder=True, shared_conv=shared_conv)
+            actor_Qs = self.critic(obs, pi, detach_encoder=True, shared_conv=shared_conv)
+            actor_Q = torch.stack(actor_Qs).min(0)[0]
             actor_loss = (self.alpha.detach() * log_pi - actor_Q).mean()
 
         if L is not None:
@@ -503,11 +601,11 @@ class SacSSAgent(object):
 
         return rot_loss.item()
 
-    def update_inv(self, obs, next_obs, action, L=None, step=None):
+    def update_inv(self, obs, next_obs, action, L=None, step=None, shared_conv=None, next_shared_conv=None):
         assert obs.shape[-1] == 84 and next_obs.shape[-1] == 84
 
-        h = self.ss_encoder(obs)
-        h_next = self.ss_encoder(next_obs)
+        h = self.ss_encoder(obs, shared_conv=shared_conv)
+        h_next = self.ss_encoder(next_obs, shared_conv=next_shared_conv)
 
         pred_action = self.inv(h, h_next)
         inv_loss = F.mse_loss(pred_action, action)
@@ -524,14 +622,51 @@ class SacSSAgent(object):
 
         return inv_loss.item()
 
-    def update_curl(self, obs_anchor, obs_pos, L=None, step=None, ema=False):
+    def update_inv_step(self, obs, next_obs, action, batch_size=32, reuse_features=False):
+        """PAD update of the inverse dynamics model from a single transition of (C,H,W) observations
+        Same update as update_inv on random crops of batch_from_obs batches, but each observation is
+        uploaded once and its crops are gathered from it on device, and obs and next_obs are encoded
+        in one forward pass. next_obs stays on device and is reused when passed as obs of the next step.
+        With reuse_features, the features of next_obs are also reused instead of encoding obs again at
+        the next step: half the encoder cost, but they were computed before the last update and the
+        gradient only flows through next_obs. Without it the encoder passes dominate and the step costs as
+        much as update_inv, which eval.py keeps using unless --pad_reuse_features is given."""
+        cache = self._inv_step_cache
+        if cache is None or cache[0] is not obs:
+            cache = (obs, torch.as_tensor(obs, device=self.device).unsqueeze(0), None)
+        # uint8 obs are uploaded and cropped as uint8, the encoder converts the crops to float
+        next_obs_t = torch.as_tensor(next_obs, device=self.device).unsqueeze(0)
+        shape = (batch_size, *next_obs_t.shape[1:])
+
+        if reuse_features and cache[2] is not None:
+            h = cache[2]
+            h_next = self.ss_encoder(utils.random_crop(next_obs_t.expand(shape)))
+        else:
+            crops = torch.cat([utils.random_crop(cache[1].expand(shape)), utils.random_crop(next_obs_t.expand(shape))])
+            h, h_next = self.ss_encoder(crops).chunk(2)
+
+        pred_action = self.inv(h, h_next)
+        action = torch.as_tensor(action, device=self.device).float().unsqueeze(0).expand(batch_size, -1)
+        inv_loss = F.mse_loss(pred_action, action)
+
+        self.encoder_optimizer.zero_grad()
+        self.inv_optimizer.zero_grad()
+        inv_loss.backward()
+
+        self.encoder_optimizer.step()
+        self.inv_optimizer.step()
+
+        self._inv_step_cache = (next_obs, next_obs_t, h_next.detach())
+        return inv_loss.item()
+
+    def update_curl(self, obs_anchor, obs_pos, L=None, step=None, ema=False, shared_conv=None):
         assert obs_anchor.shape[-1] == 84 and obs_pos.shape[-1] == 84
 
-        z_a = self.curl.encode(obs_anchor)
+        z_a = self.curl.encode(obs_anchor, shared_conv=shared_conv)
         z_pos = self.curl.encode(obs_pos, ema=True)
         
         logits = self.curl.compute_logits(z_a, z_pos)
-        labels = torch.arange(logits.shape[0]).long().cuda()
+        labels = torch.arange(logits.shape[0]).long().to(self.device)
         curl_loss = F.cross_entropy(logits, labels)
         
         self.encoder_optimizer.zero_grad()
@@ -551,25 +686,55 @@ class SacSSAgent(object):
 
         return curl_loss.item()
 
+    def _shared_convs(self, obs, next_obs, curl_kwargs, step):
+        """Conv features of obs computed once after the critic update, for the updates that follow in the same step
+        The actor update detaches its features and does not change the conv weights, which the inverse dynamics
+        and curl updates share with the critic: features computed once are the ones each update would compute.
+        The inverse dynamics model gets the output of the conv layers its ss_encoder shares with the critic, for
+        obs and next_obs, and the actor continues from it. Rotation prediction encodes rotated observations and
+        does not share features."""
+        num_layers = self.critic.encoder.num_layers
+        actor = step % self.actor_update_freq == 0
+        ss_step = step % self.ss_update_freq == 0
+        inv = self.inv is not None and ss_step and all(
+            self.ss_encoder.convs[i].weight is self.critic.encoder.convs[i].weight
+            for i in range(self.ss_encoder.num_shared_layers))
+        curl = self.curl is not None and ss_step and curl_kwargs['obs_anchor'] is obs
+        if not (actor or inv or curl):
+            return {}
+
+        shared = {}
+        shared_layers = self.ss_encoder.num_shared_layers if inv else num_layers
+        with torch.set_grad_enabled(inv or curl):
+            conv = self.critic.encoder.forward_layers(obs, 0, shared_layers)
+            if inv:
+                shared['inv'] = (conv, self.critic.encoder.forward_layers(next_obs, 0, shared_layers))
+            if curl:
+                shared['curl'] = conv
+        if actor:
+            with torch.no_grad():
+                shared['actor'] = self.critic.encoder.forward_layers(conv, shared_layers, num_layers)
+        return shared
+
     def update(self, replay_buffer, L, step):
         if self.use_curl:
             obs, action, reward, next_obs, not_done, curl_kwargs = replay_buffer.sample_curl()
         else:
             obs, action, reward, next_obs, not_done = replay_buffer.sample()
+            curl_kwargs = None
         
         L.log('train/batch_reward', reward.mean(), step)
 
         self.update_critic(obs, action, reward, next_obs, not_done, L, step)
 
+        shared = self._shared_convs(obs, next_obs, curl_kwargs, step) if self.share_features else {}
+
         if step % self.actor_update_freq == 0:
-            self.update_actor_and_alpha(obs, L, step)
+            self.update_actor_and_alpha(obs, L, step, shared_conv=shared.get('actor'))
 
         if step % self.critic_target_update_freq == 0:
             utils.soft_update_params(
-                self.critic.Q1, self.critic_target.Q1, self.critic_tau
-            )
-            utils.soft_update_params(
-                self.critic.Q2, self.critic_target.Q2, self.critic_tau
+                self.critic.q_functions, self.critic_target.q_functions, self.critic_tau
             )
             utils.soft_update_params(
                 self.critic.encoder, self.critic_target.encoder,
@@ -580,18 +745,89 @@ class SacSSAgent(object):
             self.update_rot(obs, L, step)
 
         if self.inv is not None and step % self.ss_update_freq == 0:
-            self.update_inv(obs, next_obs, action, L, step)
+            shared_conv, next_shared_conv = shared.get('inv', (None, None))
+            self.update_inv(obs, next_obs, action, L, step, shared_conv=shared_conv, next_shared_conv=next_shared_conv)
 
         if self.curl is not None and step % self.ss_update_freq == 0:
             obs_anchor, obs_pos = curl_kwargs["obs_anchor"], curl_kwargs["obs_pos"]
-            self.update_curl(obs_anchor, obs_pos, L, step)
+            self.update_curl(obs_anchor, obs_pos, L, step, shared_conv=shared.get('curl'))
+
+    def _adapted_state(self, actor=False):
+        """Parameters and optimizers updated during deployment, the actor ones only for behavioural cloning"""
+        modules, optimizers = [], []
+        if self.ss_encoder is not None:
+            modules.append(self.ss_encoder)
+            optimizers.append(self.encoder_optimizer)
+        if self.rot is not None:
+            modules.append(self.rot)
+            optimizers.append(self.rot_optimizer)
+        if self.inv is not None:
+            modules.append(self.inv)
+            optimizers.append(self.inv_optimizer)
+        if self.curl is not None:
+            modules.append(self.curl)  # includes the critic encoder and its ema target
+            optimizers += [self.encoder_optimizer, self.curl_optimizer]
+        if actor:
+            modules.append(self.actor)
+            optimizers += [self.actor_optimizer, self.log_alpha_optimizer]
+
+        # tied conv layers appear in several modules
+        params = {id(p): p for module in modules for p in module.parameters()}
+        if actor:
+            params[id(self.log_alpha)] = self.log_alpha
+        optimizers = {id(o): o for o in optimizers}
+        return list(params.values()), list(optimizers.values())
+
+    def snapshot(self, actor=False):
+        """Copies the parameters and optimizer state that PAD updates, to be restored in place by restore
+        Cheaper than a deepcopy of the agent per episode, as all other parameters stay fixed."""
+        params, optimizers = self._adapted_state(actor)
+        return dict(
+            params=[(p, p.detach().clone()) for p in params],
+            optimizers=[(o, {p: {k: v.clone() if torch.is_tensor(v) else v for k, v in state.items()}
+                             for p, state in o.state.items()}) for o in optimizers]
+        )
+
+    def restore(self, snapshot):
+        """Restores a snapshot, copying into the existing tensors"""
+        self._inv_step_cache = None
+        with torch.no_grad():
+            for param, saved in snapshot['params']:
+                param.copy_(saved)
+        for optimizer, saved_state in snapshot['optimizers']:
+            for param, state in optimizer.state.items():
+                saved = saved_state.get(param)
+                for k, v in state.items():
+                    if not torch.is_tensor(v):
+                        state[k] = saved[k] if saved is not None else 0
+                    elif saved is not None:
+                        v.copy_(saved[k])
+                    else:
+                        # state created after the snapshot, zeros are the state of a fresh Adam
+                        v.zero_()
+            for param, saved in saved_state.items():
+                if param not in optimizer.state:
+                    optimizer.state[param] = {k: v.clone() if torch.is_tensor(v) else v for k, v in saved.items()}
+
+    def copy_adapted_state(self, source, actor=False):
+        """Copies in place the parameters and optimizer state that PAD updates from source, an agent with the
+        same architecture, e.g. to reset an agent adapted during deployment to one updated by BCA"""
+        snapshot = source.snapshot(actor)
+        params, optimizers = self._adapted_state(actor)
+        to_self = {id(src): dst for (src, _), dst in zip(snapshot['params'], params)}
+        self.restore(dict(
+            params=[(dst, saved) for dst, (_, saved) in zip(params, snapshot['params'])],
+            optimizers=[(optimizer, {to_self[id(p)]: state for p, state in saved_state.items()})
+                        for optimizer, (_, saved_state) in zip(optimizers, snapshot['optimizers'])]
+        ))
 
     def save(self, model_dir, step):
         torch.save(
             self.actor.state_dict(), '%s/actor_%s.pt' % (model_dir, step)
         )
+        # the critic is saved with QFunctions Q1, ..., QN, also when fused
         torch.save(
-            self.critic.state_dict(), '%s/critic_%s.pt' % (model_dir, step)
+            unpack_q_functions(self.critic.state_dict()), '%s/critic_%s.pt' % (model_dir, step)
         )
         if self.rot is not None:
             torch.save(
@@ -616,24 +852,24 @@ class SacSSAgent(object):
 
     def load(self, model_dir, step):
         self.actor.load_state_dict(
-            torch.load('%s/actor_%s.pt' % (model_dir, step))
+            torch.load('%s/actor_%s.pt' % (model_dir, step), map_location=self.device)
         )
         self.critic.load_state_dict(
-            torch.load('%s/critic_%s.pt' % (model_dir, step))
+            torch.load('%s/critic_%s.pt' % (model_dir, step), map_location=self.device)
         )
         if self.rot is not None:
             self.rot.load_state_dict(
-                torch.load('%s/rot_%s.pt' % (model_dir, step))
+                torch.load('%s/rot_%s.pt' % (model_dir, step), map_location=self.device)
             )
         if self.inv is not None:
             self.inv.load_state_dict(
-                torch.load('%s/inv_%s.pt' % (model_dir, step))
+                torch.load('%s/inv_%s.pt' % (model_dir, step), map_location=self.device)
             )
         if self.curl is not None:
             self.curl.load_state_dict(
-                torch.load('%s/curl_%s.pt' % (model_dir, step))
+                torch.load('%s/curl_%s.pt' % (model_dir, step), map_location=self.device)
             )
         if self.ss_encoder is not None:
             self.ss_encoder.load_state_dict(
-                torch.load('%s/ss_encoder_%s.pt' % (model_dir, step))
+                torch.load('%s/ss_encoder_%s.pt' % (model_dir, step), map_location=self.device)
             )
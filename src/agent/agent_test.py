@@ -0,0 +1,86 @@
+"""Tests for agent.py, against the unfused and unshared computations they replace."""
+import copy
+import tempfile
+
+from absl.testing import absltest
+from absl.testing import parameterized
+import numpy as np
+import torch
+
+import utils
+from arguments import parse_args
+from agent.agent import make_agent, Critic, unpack_q_functions
+from logger import Logger
+
+
+class FixedBatches(object):
+    """Returns the same batches in the same order to every agent"""
+    def __init__(self, batches):
+        self._batches = iter(batches)
+
+    def sample(self):
+        return next(self._batches)
+
+
+class SharedFeaturesTest(parameterized.TestCase):
+
+    @parameterized.parameters(2, 4)
+    def test_shared_features_match_separate_updates(self, num_shared_layers):
+        args = parse_args(['--seed', '0', '--work_dir', tempfile.mkdtemp(), '--device', 'cpu', '--use_inv',
+                           '--num_layers', '4', '--num_shared_layers', str(num_shared_layers),
+                           '--hidden_dim', '64', '--batch_size', '8'])
+        agent = make_agent(obs_shape=(9, 84, 84), action_shape=(6,), args=args)
+        L = Logger(args.work_dir, use_tb=False)
+
+        rng = np.random.RandomState(0)
+        replay_buffer = utils.ReplayBuffer((9, 100, 100), (6,), 16, args.batch_size, device='cpu')
+        for _ in range(16):
+            obs = rng.randint(0, 256, size=(9, 100, 100)).astype(np.uint8)
+            replay_buffer.add(obs, rng.uniform(-1, 1, size=6), rng.rand(), obs, False)
+        batches = [replay_buffer.sample() for _ in range(3)]
+
+        agents = dict(separate=agent, shared=copy.deepcopy(agent))
+        agents['shared'].share_features = True
+        params = {}
+        for name, a in agents.items():
+            torch.manual_seed(0)
+            buffer = FixedBatches(batches)
+            for step in range(len(batches)):
+                a.update(buffer, L, step)
+            params[name] = [p.detach().clone() for p in list(a.critic.parameters()) + list(a.actor.parameters())
+                            + list(a.ss_encoder.parameters()) + list(a.inv.parameters())]
+
+        for p, q in zip(params['separate'], params['shared']):
+            np.testing.assert_allclose(p.numpy(), q.numpy(), atol=1e-6)
+
+
+class CriticTest(parameterized.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        torch.manual_seed(0)
+        self.critics = {fused: Critic((9, 84, 84), (6,), 64, 50, 4, 32, 4, 2, fused) for fused in [False, True]}
+        self.critics[True].load_state_dict(self.critics[False].state_dict())
+
+    def test_fused_q_functions_match_separate_ones(self):
+        h = torch.rand(8, 50)
+        action = torch.rand(8, 6)
+        for q, fused_q in zip(self.critics[False].q_functions, self.critics[True].Q(h, action)):
+            np.testing.assert_allclose(q(h, action).detach().numpy(), fused_q.detach().numpy(), atol=1e-5)
+
+    def test_unpacked_weights_match_unfused_critic(self):
+        unpacked = unpack_q_functions(self.critics[True].state_dict())
+        state_dict = self.critics[False].state_dict()
+        self.assertCountEqual(state_dict.keys(), unpacked.keys())
+        for k, v in state_dict.items():
+            torch.testing.assert_close(unpacked[k], v, rtol=0, atol=0)
+
+    def test_load_state_dict_forwards_assign(self):
+        state_dict = {k: v.clone() for k, v in self.critics[False].state_dict().items()}
+        self.critics[False].load_state_dict(state_dict, assign=True)
+        for k, v in self.critics[False].state_dict().items():
+            self.assertEqual(v.data_ptr(), state_dict[k].data_ptr())
+
+
+if __name__ == '__main__':
+    absltest.main()
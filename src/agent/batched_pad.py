@@ -0,0 +1,120 @@
+import torch
+import torch.nn.functional as F
+from torch.func import functional_call, grad_and_value, vmap
+
+import utils
+
+
+class BatchedPadAgent(object):
+    """
+    Runs PAD with the inverse dynamics model for several independent episodes at once.
+    Every episode owns a functional copy of the parameters that PAD mutates (ss_encoder and inv),
+    stacked along a leading episode dimension, together with its own Adam state. The actor reads
+    the shared conv layers from these copies, so each episode acts with its own adapted encoder.
+    """
+    def __init__(self, agent, num_envs, batch_size=32):
+        assert agent.ss_encoder is not None and agent.inv is not None, \
+            'batched PAD requires an agent trained with the inverse dynamics model'
+        self.agent = agent
+        self.num_envs = num_envs
+        self.batch_size = batch_size
+        self.device = next(agent.actor.parameters()).device
+
+        # Actor parameters that are tied to the ss_encoder (shared conv layers)
+        enc_params = dict(agent.ss_encoder.named_parameters())
+        self._tied = {
+            a_name: e_name for a_name, a_param in agent.actor.named_parameters()
+            for e_name, e_param in enc_params.items()
+            if a_name.startswith('encoder.') and a_param is e_param
+        }
+
+        # Preallocated per-episode parameters and Adam moments
+        self.enc_params = self._stack(agent.ss_encoder)
+        self.inv_params = self._stack(agent.inv)
+        self.enc_state = self._init_adam_state(self.enc_params, agent.encoder_optimizer)
+        self.inv_state = self._init_adam_state(self.inv_params, agent.inv_optimizer)
+
+        self._loss_and_grad = vmap(grad_and_value(self._inv_loss, argnums=(0, 1)))
+        self._act = vmap(self._actor_mu)
+
+    def _stack(self, module):
+        return {name: param.detach().unsqueeze(0).repeat(self.num_envs, *([1] * param.dim())).clone()
+                for name, param in module.named_parameters()}
+
+    def _init_adam_state(self, params, optimizer):
+        group = optimizer.param_groups[0]
+        return {
+            'lr': group['lr'],
+            'betas': group['betas'],
+            'eps': group['eps'],
+            'step': torch.zeros(self.num_envs, device=self.device),
+            'exp_avg': {k: torch.zeros_like(v) for k, v in params.items()},
+            'exp_avg_sq': {k: torch.zeros_like(v) for k, v in params.items()},
+        }
+
+    def reset(self, idx=None):
+        """Restore the pre-trained weights (and a fresh optimizer) for all episodes, or episode idx"""
+        idx = slice(None) if idx is None else idx
+        for params, state, module in [(self.enc_params, self.enc_state, self.agent.ss_encoder),
+                                      (self.inv_params, self.inv_state, self.agent.inv)]:
+            for name, param in module.named_parameters():
+                params[name][idx] = param.detach()
+                state['exp_avg'][name][idx] = 0
+                state['exp_avg_sq'][name][idx] = 0
+            state['step'][idx] = 0
+
+    def _actor_mu(self, enc_params, obs):
+        params = {a_name: enc_params[e_name] for a_name, e_name in self._tied.items()}
+        mu, _, _, _ = functional_call(
+            self.agent.actor, params, (obs,), dict(compute_pi=False, compute_log_pi=False), strict=False
+        )
+        return mu
+
+    def select_action(self, obs):
+        """obs: (N,C,H,W) stacked observations, one per episode"""
+        with torch.no_grad():
+            obs = torch.as_tensor(obs, device=self.device).float().unsqueeze(1)
+            mu = self._act(self.enc_params, obs)
+            return mu.squeeze(1).cpu().data.numpy()
+
+    def _inv_loss(self, enc_params, inv_params, obs, next_obs, action):
+        h = functional_call(self.agent.ss_encoder, enc_params, (obs,))
+        h_next = functional_call(self.agent.ss_encoder, enc_params, (next_obs,))
+        pred_action = functional_call(self.agent.inv, inv_params, (h, h_next))
+        return F.mse_loss(pred_action, action)
+
+    def _adam_step(self, params, grads, state):
+        """Batched equivalent of torch.optim.Adam.step, with a step count per episode"""
+        beta1, beta2 = state['betas']
+        state['step'] += 1
+        for name, grad in grads.items():
+            shape = (-1,) + (1,) * (grad.dim() - 1)
+            bias_correction1 = (1 - beta1 ** state['step']).view(shape)
+            bias_correction2 = (1 - beta2 ** state['step']).view(shape)
+            exp_avg, exp_avg_sq = state['exp_avg'][name], state['exp_avg_sq'][name]
+            exp_avg.mul_(beta1).add_(grad, alpha=1 - beta1)
+            exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+            denom = (exp_avg_sq.sqrt() / bias_correction2.sqrt()).add_(state['eps'])
+            params[name].addcdiv_(exp_avg * (-state['lr'] / bias_correction1), denom)
+
+    def _prepare_batch(self, obs):
+        """Converts (N,C,H,W) obs to (N,B,C,84,84) independently cropped batches"""
+        obs = torch.as_tensor(obs, device=self.device).float()
+        batch = utils.random_crop(obs.repeat_interleave(self.batch_size, dim=0))
+        return batch.reshape(self.num_envs, self.batch_size, *batch.shape[1:])
+
+    def update_inv(self, obs, next_obs, action):
+        """Makes one inverse dynamics update per episode, returns the per-episode losses"""
+        batch_obs = self._prepare_batch(obs)
+        batch_next_obs = self._prepare_batch(next_obs)
+        batch_action = torch.as_tensor(action, device=self.device).float()
+        batch_action = batch_action.unsqueeze(1).repeat(1, self.batch_size, 1)
+
+        (enc_grads, inv_grads), inv_loss = self._loss_and_grad(
+            self.enc_params, self.inv_params, batch_obs, batch_next_obs, batch_action
+        )
+        with torch.no_grad():
+            self._adam_step(self.enc_params, enc_grads, self.enc_state)
+            self._adam_step(self.inv_params, inv_grads, self.inv_state)
+
+        return inv_loss.cpu().numpy()
@@ -30,7 +30,7 @@ class CenterCrop(nn.Module):
 
 
 class NormalizeImg(nn.Module):
-	"""Normalize observation"""
+	"""Normalize observation, uint8 observations are converted to float"""
 	def forward(self, x):
 		return x/255.
 
@@ -59,20 +59,26 @@ class PixelEncoder(nn.Module):
 		self.fc = nn.Linear(num_filters * out_dim * out_dim, self.feature_dim)
 		self.ln = nn.LayerNorm(self.feature_dim)
 
-	def forward_conv(self, obs, detach=False):
-		obs = self.preprocess(obs)
-		conv = torch.relu(self.convs[0](obs))
-
-		for i in range(1, self.num_layers):
-			conv = torch.relu(self.convs[i](conv))
-			if i == self.num_shared_layers-1 and detach:
-				conv = conv.detach()
-
-		h = conv.view(conv.size(0), -1)
+	def forward_layers(self, x, start, stop):
+		"""Applies the conv layers start to stop-1, to obs if start is 0"""
+		if start == 0:
+			x = self.preprocess(x)
+		for i in range(start, stop):
+			x = torch.relu(self.convs[i](x))
+		return x
+
+	def forward_conv(self, obs, detach=False, shared_conv=None):
+		"""shared_conv: output of the num_shared_layers first layers, computed by an encoder they are tied to"""
+		conv = self.forward_layers(obs, 0, self.num_shared_layers) if shared_conv is None else shared_conv
+		if detach:
+			conv = conv.detach()
+		conv = self.forward_layers(conv, self.num_shared_layers, self.num_layers)
+
+		h = conv.reshape(conv.size(0), -1) # channels-last output is not viewable
 		return h
 
-	def forward(self, obs, detach=False):
-		h = self.forward_conv(obs, detach)
+	def forward(self, obs, detach=False, shared_conv=None):
+		h = self.forward_conv(obs, detach, shared_conv)
 		h_fc = self.fc(h)
 		h_norm = self.ln(h_fc)
 		out = torch.tanh(h_norm)
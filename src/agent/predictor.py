@@ -2,6 +2,7 @@ import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from utils import get_device
 #from utils import moving_average_reward
 
 class Predictor(object) :
@@ -27,23 +28,25 @@ class HardcodedPredictor(Predictor):
     Dynamics it can handle are allowed to change in a time-dependent way only
     """
 
-    def __init__(self, dynamics_shape, init_dynamics):
+    def __init__(self, dynamics_shape, init_dynamics, device=None):
         super().__init__()
         self.forecasting_steps = dynamics_shape
         self.dynamics = init_dynamics
+        self.device = get_device(device)
 
     def __call__(self, x):
         pred_dynamics = torch.as_tensor(self.dynamics.sample_window(self.step, self.forecasting_steps))
-        return pred_dynamics.unsqueeze(0).float().cuda()
+        return pred_dynamics.unsqueeze(0).float().to(self.device)
 
     def sample_dynamics(self):
-        return torch.as_tensor(self.dynamics.init_value()).unsqueeze(0).float().cuda()
+        return torch.as_tensor(self.dynamics.init_value()).unsqueeze(0).float().to(self.device)
 
 def build_predictor(predictor, args) :
 
     if predictor == 'cart_mass' and args.domain_name == 'cartpole':
         return HardcodedPredictor(args.dynamics_shape,
-                                  CartMass(args.window))
+                                  CartMass(args.window),
+                                  device=args.device)
     else:
         raise NotImplementedError(f'{predictor} for {args.domain_name} is not handled yet')
 
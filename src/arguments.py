@@ -2,7 +2,7 @@ import argparse
 import numpy as np
 
 
-def parse_args():
+def parse_args(args=None):
 	parser = argparse.ArgumentParser()
 
 	# environment
@@ -23,6 +23,10 @@ def parse_args():
 	parser.add_argument('--train_steps', default=500000, type=int)
 	parser.add_argument('--batch_size', default=128, type=int)
 	parser.add_argument('--hidden_dim', default=1024, type=int)
+	parser.add_argument('--replay_storage', default='stacks', type=str) # stacks or frames (store each frame once)
+	parser.add_argument('--replay_mmap', default=False, action='store_true') # memory-map the frame store to work_dir/buffer_mmap
+	parser.add_argument('--prefetch_batches', default=0, type=int) # batches sampled ahead in a background thread, 0 to disable
+	parser.add_argument('--num_envs', default=1, type=int) # envs stepped in lockstep to collect training data
 
 	# eval
 	parser.add_argument('--save_freq', default=100000, type=int)
@@ -39,6 +43,8 @@ def parse_args():
 	parser.add_argument('--rd', default=False, action='store_true')
 
 	# critic
+	parser.add_argument('--num_q', default=2, type=int) # number of q-functions of the critic
+	parser.add_argument('--fused_critic', default=False, action='store_true') # evaluate the q-functions with batched matmuls
 	parser.add_argument('--critic_lr', default=1e-3, type=float)
 	parser.add_argument('--critic_beta', default=0.9, type=float)
 	parser.add_argument('--critic_tau', default=0.01, type=float)
@@ -79,14 +85,30 @@ def parse_args():
 	parser.add_argument('--save_dir', default=None, type=str)
 	parser.add_argument('--save_model', default=False, action='store_true')
 	parser.add_argument('--save_video', default=False, action='store_true')
+	parser.add_argument('--video_size', default=448, type=int) # resolution of evaluation videos
+	parser.add_argument('--video_every', default=1, type=int) # record every n-th step
+	parser.add_argument('--video_states', default=False, action='store_true') # record physics states, render videos with render_videos.py
+	parser.add_argument('--log_interval', default=1, type=int) # log update losses every n-th step
+	parser.add_argument('--save_buffer', default=False, action='store_true') # save replay buffer with the model, to resume
+	parser.add_argument('--results_storage', default='csv', type=str) # csv or columns (episodes appended as they end, see utils.load_results)
+	parser.add_argument('--device', default=None, type=str) # cuda if available, else cpu
+	parser.add_argument('--num_threads', default=0, type=int) # torch CPU threads, 0 to keep the default
+	parser.add_argument('--share_features', default=False, action='store_true') # encode obs once per update for the actor and ss updates
+	parser.add_argument('--channels_last', default=False, action='store_true') # channels-last convolutions, faster on CPU
 
 	# test
 	parser.add_argument('--pad_checkpoint', default=None, type=str)
 	parser.add_argument('--pad_batch_size', default=32, type=int)
+	parser.add_argument('--pad_reuse_features', default=False, action='store_true') # reuse next_obs features as obs features of the next step
 	parser.add_argument('--pad_num_episodes', default=100, type=int)
+	parser.add_argument('--pad_num_envs', default=1, type=int) # episodes run in lockstep during evaluation
+	parser.add_argument('--subproc_envs', default=False, action='store_true') # host the envs of batched evaluation and of data collection in worker processes
 
-	args = parser.parse_args()
+	args = parser.parse_args(args)
 
+	assert args.replay_storage in {'stacks', 'frames'}, f'unrecognized replay storage "{args.replay_storage}"'
+	assert args.results_storage in {'csv', 'columns'}, f'unrecognized results storage "{args.results_storage}"'
+	assert not args.replay_mmap or args.replay_storage == 'frames', 'replay_mmap requires frames replay storage'
 	assert args.mode in {'train', 'color_easy', 'color_hard'} or 'video' in args.mode, f'unrecognized mode "{args.mode}"'
 	#assert args.predictor in {'cart_mass', 'force_walker'}, f'unrecognized dynamics "{args.predictor}"'
 	assert args.seed is not None, 'must provide seed for experiment'
@@ -3,7 +3,7 @@ import torch
 import os
 import itertools
 from agent.agent import make_agent
-from utils import make_dir, EnvtRecorder
+from utils import make_dir, setup_device, EnvtRecorder
 from eval import evaluate, init_env
 from video import VideoRecorder
 from arguments import parse_args
@@ -21,7 +21,7 @@ def main(args):
     env = init_env(args)
 
     # Prepare agent
-    assert torch.cuda.is_available(), 'must have cuda enabled'
+    setup_device(args.device, args.num_threads)
     cropped_obs_shape = (3 * args.frame_stack, 84, 84)
     model_dir = make_dir(os.path.join(args.work_dir, 'model'))
     agent = make_agent(
@@ -41,12 +41,12 @@ def evaluate_seq(envs, agent, args, video, recorder, exp_type, clone=None, buffe
 
     assert(not (bca and reload)), "Either reload or bca mode is allowed"
     episode_rewards = []
+    # PAD adapts ep_agent, which is reset to agent at every episode, while BCA keeps updating agent itself
+    ep_agent = deepcopy(agent)
 
     def run_episode(env):
         if reload:
-            ep_agent = deepcopy(agent)
-        else :
-            ep_agent = episode_agent
+            ep_agent.copy_adapted_state(agent, actor=bca)
         ep_rew = 0
         obs = env.reset()
         done = False
@@ -64,9 +64,9 @@ def evaluate_seq(envs, agent, args, video, recorder, exp_type, clone=None, buffe
             recorder.update(change, reward)
 
             # Prepare batch of observations
-            batch_obs = utils.batch_from_obs(torch.Tensor(obs).cuda(), batch_size=args.pad_batch_size)
-            batch_next_obs = utils.batch_from_obs(torch.Tensor(next_obs).cuda(), batch_size=args.pad_batch_size)
-            batch_action = torch.Tensor(action).cuda().unsqueeze(0).repeat(args.pad_batch_size, 1)
+            batch_obs = utils.batch_from_obs(obs, batch_size=args.pad_batch_size, device=ep_agent.device)
+            batch_next_obs = utils.batch_from_obs(next_obs, batch_size=args.pad_batch_size, device=ep_agent.device)
+            batch_action = torch.Tensor(action).to(ep_agent.device).unsqueeze(0).repeat(args.pad_batch_size, 1)
 
             # Adapt using inverse dynamics prediction
             losses.append(ep_agent.update_inv(utils.random_crop(batch_obs), utils.random_crop(batch_next_obs),
@@ -85,7 +85,7 @@ def evaluate_seq(envs, agent, args, video, recorder, exp_type, clone=None, buffe
 
     for i in tqdm(range(args.pad_num_episodes)):
 
-        episode_agent = deepcopy(agent)
+        ep_agent.copy_adapted_state(agent, actor=bca)
         video.init(enabled=True)
         episode_reward = 0
 
@@ -119,7 +119,7 @@ def main(args):
         dependent=False)
 
     # Prepare agent
-    assert torch.cuda.is_available(), 'must have cuda enabled'
+    utils.setup_device(args.device, args.num_threads)
     cropped_obs_shape = (3 * args.frame_stack, 84, 84)
     agent = make_agent(
         obs_shape=cropped_obs_shape,
@@ -134,7 +134,8 @@ def main(args):
         obs_shape=training_env.observation_space.shape,
         action_shape=training_env.action_space.shape,
         capacity=args.train_steps,
-        batch_size=args.pad_batch_size
+        batch_size=args.pad_batch_size,
+        device=args.device
     )
     prepare_BCA(training_env, clone, replay_buffer, args.pad_num_episodes)
 
@@ -53,9 +53,11 @@ def prepare_BCA(env, agent, buffer, num_episodes) :
 
 def evaluate(env, agent, clone, buffer, args, video, recorder, exp_type="", adapt=False, bca=False, reload=False):
     episode_rewards = []
+    # PAD adapts ep_agent, which is reset to agent at every episode, while BCA keeps updating agent itself
+    ep_agent = deepcopy(agent)
 
     for i in tqdm(range(args.pad_num_episodes)):
-        ep_agent = deepcopy(agent)  # make a new copy
+        ep_agent.copy_adapted_state(agent, actor=bca)
 
         video.init(enabled=True)
         obs = env.reset()
@@ -81,9 +83,9 @@ def evaluate(env, agent, clone, buffer, args, video, recorder, exp_type="", adap
                 if args.use_inv:  # inverse dynamics model
 
                     # Prepare batch of observations
-                    batch_obs = utils.batch_from_obs(torch.Tensor(obs).cuda(), batch_size=args.pad_batch_size)
-                    batch_next_obs = utils.batch_from_obs(torch.Tensor(next_obs).cuda(), batch_size=args.pad_batch_size)
-                    batch_action = torch.Tensor(action).cuda().unsqueeze(0).repeat(args.pad_batch_size, 1)
+                    batch_obs = utils.batch_from_obs(obs, batch_size=args.pad_batch_size, device=ep_agent.device)
+                    batch_next_obs = utils.batch_from_obs(next_obs, batch_size=args.pad_batch_size, device=ep_agent.device)
+                    batch_action = torch.Tensor(action).to(ep_agent.device).unsqueeze(0).repeat(args.pad_batch_size, 1)
 
                     # Adapt using inverse dynamics prediction
                     losses.append(ep_agent.update_inv(utils.random_crop(batch_obs), utils.random_crop(batch_next_obs),
@@ -99,7 +101,7 @@ def evaluate(env, agent, clone, buffer, args, video, recorder, exp_type="", adap
             step += 1
 
             if has_changed and reload :
-                ep_agent = deepcopy(agent)
+                ep_agent.copy_adapted_state(agent, actor=bca)
 
         video.save(f'{args.mode}_pad_{i}.mp4' if adapt else f'{args.mode}_eval_{i}.mp4')
         episode_rewards.append(episode_reward)
@@ -126,7 +128,7 @@ def main(args):
     video = VideoRecorder(video_dir if args.save_video else None, height=448, width=448)
 
     # Prepare agents
-    assert torch.cuda.is_available(), 'must have cuda enabled'
+    utils.setup_device(args.device, args.num_threads)
     cropped_obs_shape = (3 * args.frame_stack, 84, 84)
     agent = make_agent(
         obs_shape=cropped_obs_shape,
@@ -148,7 +150,8 @@ def main(args):
         obs_shape=training_env.observation_space.shape,
         action_shape=training_env.action_space.shape,
         capacity=args.train_steps,
-        batch_size=args.pad_batch_size
+        batch_size=args.pad_batch_size,
+        device=args.device
     )
     prepare_BCA(training_env, expert, replay_buffer, args.pad_num_episodes)
 
@@ -0,0 +1,408 @@
+import argparse
+import time
+import numpy as np
+import torch
+
+
+def timeit(fn, repeats=100, warmup=5):
+    """Returns mean wall time per call of fn in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def report(name, ms, baseline_ms=None):
+    line = f'{name:<40} {ms:10.3f} ms'
+    if baseline_ms is not None:
+        line += f'   x{baseline_ms / ms:.1f}'
+    print(line)
+
+
+def bench_green_screen(args):
+    """Per-frame cost of green screen compositing at observation size"""
+    from env.wrappers import do_green_screen, do_green_screen_torch
+    from references import do_green_screen_reference
+
+    rng = np.random.RandomState(args.seed)
+    x = rng.randint(0, 256, size=(3, args.size, args.size)).astype(np.uint8)
+    x[:, :args.size // 2] = np.array([51, 204, 51], dtype=np.uint8)[:, None, None]  # green half
+    bg = rng.randint(0, 256, size=(3, args.size, args.size)).astype(np.uint8)
+
+    slow = timeit(lambda: do_green_screen_reference(x, bg), repeats=5, warmup=1)
+    report('do_green_screen_reference (per frame)', slow)
+    report('do_green_screen (per frame)', timeit(lambda: do_green_screen(x, bg)), slow)
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    xs = torch.from_numpy(x).unsqueeze(0).repeat(args.batch_size, 1, 1, 1).to(device)
+    bgs = torch.from_numpy(bg).unsqueeze(0).repeat(args.batch_size, 1, 1, 1).to(device)
+    batched = timeit(lambda: do_green_screen_torch(xs, bgs)) / args.batch_size
+    report(f'do_green_screen_torch ({device}, per frame)', batched, slow)
+
+
+def _filled_replay_buffer(args, obs_shape=(9, 100, 100), action_shape=(6,)):
+    import utils
+
+    rng = np.random.RandomState(args.seed)
+    replay_buffer = utils.ReplayBuffer(obs_shape, action_shape, args.capacity, args.batch_size)
+    obs = rng.randint(0, 256, size=obs_shape).astype(np.uint8)
+    for _ in range(args.capacity):
+        replay_buffer.add(obs, rng.uniform(-1, 1, size=action_shape), rng.rand(), obs, False)
+    return replay_buffer
+
+
+def bench_replay_sample(args):
+    """Cost of sampling a cropped training batch, synchronously and with the prefetching sampler"""
+    import utils
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    replay_buffer = _filled_replay_buffer(args)
+    sync = timeit(lambda: replay_buffer._process([torch.as_tensor(x).to(device) for x in replay_buffer._gather()]))
+    report(f'ReplayBuffer sample ({device})', sync)
+    sampler = utils.PrefetchSampler(replay_buffer, num_batches=args.prefetch_batches, seed=args.seed, device=device)
+    report(f'PrefetchSampler sample ({device})', timeit(sampler.sample), sync)
+    sampler.close()
+
+
+def bench_uint8_crop(args):
+    """Cost of cropping and normalizing a sampled batch, cropped as float or as uint8"""
+    import utils
+
+    agent, _ = _make_agent(args)
+    encoder = agent.critic.encoder
+    replay_buffer = _filled_replay_buffer(args)
+    batch = [torch.as_tensor(x).to(agent.device) for x in replay_buffer._gather()]
+
+    baseline = timeit(lambda: encoder.preprocess(utils.random_crop(batch[0].float())), repeats=20)
+    report(f'float crop + normalize ({agent.device})', baseline)
+    report(f'uint8 crop + normalize ({agent.device})',
+           timeit(lambda: encoder.preprocess(utils.random_crop(batch[0])), repeats=20), baseline)
+
+
+def _make_agent(args, *flags):
+    """Builds an agent with the default hyperparameters of arguments.py, returns it with its arguments"""
+    import tempfile
+    import utils
+    from arguments import parse_args
+    from agent.agent import make_agent
+
+    train_args = parse_args(['--seed', str(args.seed), '--work_dir', tempfile.mkdtemp(),
+                             '--batch_size', str(args.batch_size), '--num_threads', str(args.num_threads)]
+                            + (['--channels_last'] if args.channels_last else []) + list(flags))
+    utils.setup_device(train_args.device, train_args.num_threads)
+    return make_agent(obs_shape=(9, 84, 84), action_shape=(6,), args=train_args), train_args
+
+
+def bench_updates(args):
+    """Updates/sec of the SAC + inverse dynamics update loop of train.py"""
+    import utils
+    from logger import Logger
+
+    agent, train_args = _make_agent(args, '--use_inv')
+    L = Logger(train_args.work_dir, use_tb=False)
+    replay_buffer = _filled_replay_buffer(args)
+    sampler = utils.PrefetchSampler(replay_buffer, num_batches=args.prefetch_batches, seed=args.seed)
+
+    for name, buffer in [('sync', replay_buffer), (f'prefetch {args.prefetch_batches}', sampler)]:
+        step = iter(range(10 ** 9))
+        ms = timeit(lambda: agent.update(buffer, L, next(step)), repeats=args.updates, warmup=10)
+        print(f'{"updates/sec (" + name + ")":<40} {1000 / ms:10.1f}')
+    sampler.close()
+
+
+def bench_shared_features(args):
+    """Updates/sec of the SAC + inverse dynamics update loop of train.py, with and without shared conv features"""
+    import copy
+    from logger import Logger
+
+    agent, train_args = _make_agent(args, '--use_inv', '--num_shared_layers', str(args.num_shared_layers))
+    L = Logger(train_args.work_dir, use_tb=False)
+    replay_buffer = _filled_replay_buffer(args)
+    agents = dict(separate=agent, shared=copy.deepcopy(agent))
+    agents['shared'].share_features = True
+
+    for name, a in agents.items():
+        step = iter(range(10 ** 9))
+        ms = timeit(lambda: a.update(replay_buffer, L, next(step)), repeats=args.updates, warmup=10)
+        print(f'{"updates/sec (" + name + ")":<40} {1000 / ms:10.1f}')
+
+
+def bench_critic(args):
+    """Cost of a forward and backward pass of the q-functions of the critic, one at a time or fused"""
+    from agent.agent import Critic
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    critics = {}
+    for fused in [False, True]:
+        critics[fused] = Critic((9, 84, 84), (6,), args.hidden_dim, 50, 4, 32, 4, args.num_q, fused).to(device)
+    critics[True].load_state_dict(critics[False].state_dict())
+    h = torch.rand(args.batch_size, 50, device=device)
+    action = torch.rand(args.batch_size, 6, device=device)
+
+    def step(fused):
+        qs = critics[fused].Q(h, action).unbind(0) if fused else [q(h, action) for q in critics[fused].q_functions]
+        sum(q.mean() for q in qs).backward()
+
+    baseline = timeit(lambda: step(False), repeats=20)
+    report(f'{args.num_q} QFunctions (hidden {args.hidden_dim}, {device})', baseline)
+    report(f'EnsembleQFunction (hidden {args.hidden_dim}, {device})', timeit(lambda: step(True), repeats=20), baseline)
+
+
+def bench_soft_update(args):
+    """Cost of the critic target update of SacSSAgent.update, per parameter or with foreach kernels"""
+    import copy
+    import utils
+    from references import soft_update_params_reference
+    from agent.agent import Critic
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    critic = Critic((9, 84, 84), (6,), args.hidden_dim, 50, 11, 32, 11, args.num_q).to(device)
+    critic_target = copy.deepcopy(critic)
+
+    def update_reference():
+        for q, q_target in zip(critic.q_functions, critic_target.q_functions):
+            soft_update_params_reference(q, q_target, 0.01)
+        soft_update_params_reference(critic.encoder, critic_target.encoder, 0.05)
+
+    def update_foreach():
+        utils.soft_update_params(critic.q_functions, critic_target.q_functions, 0.01)
+        utils.soft_update_params(critic.encoder, critic_target.encoder, 0.05)
+
+    baseline = timeit(update_reference)
+    report(f'soft_update_params_reference ({device})', baseline)
+    report(f'soft_update_params ({device})', timeit(update_foreach), baseline)
+
+
+def bench_pad_step(args):
+    """Per-step latency of the PAD inverse dynamics update in eval.py"""
+    import utils
+
+    agent, _ = _make_agent(args, '--use_inv')
+    rng = np.random.RandomState(args.seed)
+    frames = [rng.randint(0, 256, size=(9, args.size, args.size)).astype(np.uint8) for _ in range(8)]
+    actions = [rng.uniform(-1, 1, size=6) for _ in range(8)]
+    snapshot = agent.snapshot()
+
+    def transitions():
+        # new next_obs arrays every step, obs is the previous next_obs as in evaluate
+        obs, i = frames[0].copy(), 0
+        while True:
+            i += 1
+            next_obs = frames[i % len(frames)].copy()
+            yield obs, next_obs, actions[i % len(actions)]
+            obs = next_obs
+
+    def update_inv(steps):
+        obs, next_obs, action = next(steps)
+        batch_obs = utils.batch_from_obs(obs, batch_size=args.batch_size, device=agent.device)
+        batch_next_obs = utils.batch_from_obs(next_obs, batch_size=args.batch_size, device=agent.device)
+        batch_action = torch.Tensor(action).to(agent.device).unsqueeze(0).repeat(args.batch_size, 1)
+        agent.update_inv(utils.random_crop(batch_obs), utils.random_crop(batch_next_obs), batch_action)
+
+    steps = transitions()
+    baseline = timeit(lambda: update_inv(steps), repeats=args.updates)
+    report('update_inv (batch_from_obs)', baseline)
+    for reuse_features in [False, True]:
+        agent.restore(snapshot)
+        steps = transitions()
+        ms = timeit(lambda: agent.update_inv_step(*next(steps), batch_size=args.batch_size,
+                                                  reuse_features=reuse_features), repeats=args.updates)
+        report(f'update_inv_step (reuse_features={reuse_features})', ms, baseline)
+
+
+def bench_render(args):
+    """Renders/sec of Physics.render at observation and video size, against a new camera per call"""
+    from dm_control import suite
+    from dm_control.mujoco import engine
+
+    physics = suite.load(args.domain_name, args.task_name, task_kwargs={'random': args.seed}).physics
+    for size in [args.size, 448]:
+        def render_uncached():
+            camera = engine.Camera(physics, height=size, width=size, camera_id=0)
+            camera.render().copy()
+            camera.scene.free()
+
+        uncached = timeit(render_uncached)
+        cached = timeit(lambda: physics.render(height=size, width=size, camera_id=0))
+        print(f'{"renders/sec (" + str(size) + "px, camera per call)":<40} {1000 / uncached:10.1f}')
+        print(f'{"renders/sec (" + str(size) + "px, cached camera)":<40} {1000 / cached:10.1f}   x{uncached / cached:.1f}')
+
+
+def bench_color_reset(args):
+    """Reset latency of the color_hard environment, recompiling the model or applying colors in place"""
+    from env.wrappers import make_pad_env
+
+    env = make_pad_env(args.domain_name, args.task_name, seed=args.seed, mode='color_hard')
+    env._recompile = True
+    recompiled = timeit(env.reset, repeats=20, warmup=2)
+    report('reset (recompile, model cache)', recompiled)
+    env._recompile = False
+    report('reset (in place)', timeit(env.reset, repeats=20, warmup=2), recompiled)
+
+
+def bench_moving_average(args):
+    """Cost of the dependent mode moving average reward over an episode, recomputed or streamed"""
+    import utils
+
+    rewards = list(np.random.RandomState(args.seed).rand(args.episode_steps))
+    tracker = utils.MovingAverageReward(args.window)
+
+    def recompute_episode():
+        for i in range(len(rewards)):
+            utils.moving_average_reward(rewards[:i + 1], current_ep=i, wind_lgth=args.window)
+
+    def stream_episode():
+        tracker.reset()
+        for r in rewards:
+            tracker.update(r)
+
+    baseline = timeit(recompute_episode, repeats=5, warmup=1)
+    report('moving_average_reward (per episode)', baseline)
+    report('MovingAverageReward (per episode)', timeit(stream_episode, repeats=5, warmup=1), baseline)
+
+
+def bench_env_step(args):
+    """Per-step overhead of DMCWrapper from state observations, with eager and lazy info"""
+    import dmc2gym
+
+    for lazy_info in [False, True]:
+        env = dmc2gym.make(args.domain_name, args.task_name, seed=args.seed, visualize_reward=False,
+                           frame_skip=1, lazy_info=lazy_info)
+        env.reset()
+        action = env.action_space.sample()
+        ms = timeit(lambda: env.step(action), repeats=args.updates)
+        if lazy_info:
+            report('DMCWrapper.step (lazy_info)', ms, eager)
+        else:
+            eager = ms
+            report('DMCWrapper.step', ms)
+
+
+def bench_logger(args):
+    """Per-episode cost of logging the update losses of train.py, every step or every other step"""
+    import contextlib
+    import io
+    import tempfile
+    from logger import Logger
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    keys = ['train_critic/loss', 'train_actor/loss', 'train_actor/target_entropy', 'train_actor/entropy',
+            'train_alpha/loss', 'train_alpha/value', 'train/inv_loss', 'train/batch_reward']
+    losses = torch.rand(len(keys), device=device)
+
+    for log_interval in [1, 2]:
+        L = Logger(tempfile.mkdtemp(), use_tb=True, log_interval=log_interval)
+
+        def log_episode():
+            for step in range(args.episode_steps):
+                for i, key in enumerate(keys):
+                    L.log(key, losses[i] * 1, step)
+            L.dump(args.episode_steps)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            ms = timeit(log_episode, repeats=5, warmup=1)
+            L.close()
+        report(f'Logger.log (log_interval {log_interval}, per episode)', ms)
+
+
+def bench_results(args):
+    """Cost of recording, saving and loading the per-step results of eval.py, as csv or columns"""
+    import glob
+    import os
+    import tempfile
+    import pandas as pd
+    import utils
+
+    rng = np.random.RandomState(args.seed)
+    rewards = rng.rand(args.episodes, args.episode_steps)
+    changes = rng.rand(args.episodes, args.episode_steps)
+
+    def record(recorder_cls, save_dir):
+        recorder = recorder_cls(save_dir, 'color_hard')
+        for i in range(args.episodes):
+            for change, reward in zip(changes[i], rewards[i]):
+                recorder.update(change, reward)
+            recorder.end_episode()
+        recorder.save('performance_', adapt=True)
+
+    def load_csv(save_dir):
+        return [pd.read_csv(p, index_col=0) for p in glob.glob(os.path.join(save_dir, '*.csv'))]
+
+    def load_columns(save_dir):
+        return [r.episode_rewards() for r in utils.load_results(os.path.join(save_dir, '*')).values()]
+
+    csv_dir, columns_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    record(utils.AdaptRecorder, csv_dir)
+    record(utils.ColumnarRecorder, columns_dir)
+
+    baseline = timeit(lambda: record(utils.AdaptRecorder, tempfile.mkdtemp()), repeats=3, warmup=1)
+    report('AdaptRecorder (record + save)', baseline)
+    report('ColumnarRecorder (record + save)',
+           timeit(lambda: record(utils.ColumnarRecorder, tempfile.mkdtemp()), repeats=3, warmup=1), baseline)
+    baseline = timeit(lambda: [df.sum() for df in load_csv(csv_dir)], repeats=3, warmup=1)
+    report('read_csv (episode rewards)', baseline)
+    report('load_results (episode rewards)', timeit(lambda: load_columns(columns_dir), repeats=3, warmup=1), baseline)
+
+
+def bench_rotate(args):
+    """Cost of rotating a batch of cropped observations for rotation prediction, per image or batched"""
+    import utils
+    from references import rotate_reference
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    for batch_size in [32, 128, 512]:
+        x = torch.rand(batch_size, 9, 84, 84, device=device)
+        baseline = timeit(lambda: rotate_reference(x), repeats=20)
+        report(f'rotate_reference (batch {batch_size}, {device})', baseline)
+        report(f'rotate (batch {batch_size}, {device})', timeit(lambda: utils.rotate(x), repeats=20), baseline)
+
+
+BENCHMARKS = {
+    'green_screen': bench_green_screen,
+    'replay_sample': bench_replay_sample,
+    'updates': bench_updates,
+    'pad_step': bench_pad_step,
+    'render': bench_render,
+    'color_reset': bench_color_reset,
+    'moving_average': bench_moving_average,
+    'env_step': bench_env_step,
+    'logger': bench_logger,
+    'results': bench_results,
+    'rotate': bench_rotate,
+    'uint8_crop': bench_uint8_crop,
+    'shared_features': bench_shared_features,
+    'critic': bench_critic,
+    'soft_update': bench_soft_update,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmarks', nargs='*', default=list(BENCHMARKS.keys()))
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('--size', default=100, type=int)
+    parser.add_argument('--batch_size', default=32, type=int)
+    parser.add_argument('--capacity', default=10000, type=int)
+    parser.add_argument('--prefetch_batches', default=2, type=int)
+    parser.add_argument('--updates', default=200, type=int)
+    parser.add_argument('--num_threads', default=0, type=int)
+    parser.add_argument('--channels_last', default=False, action='store_true')
+    parser.add_argument('--domain_name', default='cartpole')
+    parser.add_argument('--task_name', default='swingup')
+    parser.add_argument('--episode_steps', default=250, type=int)
+    parser.add_argument('--window', default=3, type=int)
+    parser.add_argument('--episodes', default=100, type=int)
+    parser.add_argument('--num_shared_layers', default=8, type=int)
+    parser.add_argument('--hidden_dim', default=1024, type=int)
+    parser.add_argument('--num_q', default=2, type=int)
+    args = parser.parse_args()
+
+    for name in args.benchmarks:
+        print(f'--- {name} ---')
+        BENCHMARKS[name](args)
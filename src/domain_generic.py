@@ -65,7 +65,8 @@ def collect_expert_samples(agent, env, args, label = None): # OK
         action_shape=env.action_space.shape,
         capacity=args.train_steps,
         batch_size=args.batch_size,
-        label=label
+        label=label,
+        device=args.device
     )
 
     ep_rewards, obses, actions = evaluate_agent(agent, env, args)
@@ -89,7 +90,7 @@ def load_agent(label, action_shape, args): # OK
     print(f'Load agent from {work_dir}')
 
     # Prepare agent
-    assert torch.cuda.is_available(), 'must have cuda enabled'
+    utils.setup_device(args.device, args.num_threads)
     cropped_obs_shape = (3 * args.frame_stack, 84, 84)
     agent = make_agent(
         obs_shape=cropped_obs_shape,
@@ -142,7 +143,8 @@ def main(args):
         obs_shape=envs[0].observation_space.shape,
         action_shape=envs[0].action_space.shape,
         capacity=args.train_steps,
-        batch_size=args.batch_size
+        batch_size=args.batch_size,
+        device=args.device
     ) 
 
     for expert, env, label in zip(experts, envs, labels):
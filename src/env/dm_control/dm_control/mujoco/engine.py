@@ -80,6 +80,10 @@ _INVALID_PHYSICS_STATE = (
     'Physics state is invalid. Warning(s) raised: {warning_names}')
 _OVERLAYS_NOT_SUPPORTED_FOR_DEPTH_OR_SEGMENTATION = (
     'Overlays are not supported with depth or segmentation rendering.')
+_OUT_NOT_SUPPORTED_FOR_DEPTH_OR_SEGMENTATION = (
+    '`out` is not supported with depth or segmentation rendering.')
+_INVALID_OUT_SHAPE = (
+    '`out` must have shape {hwc} or {chw}, got {shape}.')
 
 
 class Physics(_control.Physics):
@@ -112,6 +116,7 @@ class Physics(_control.Physics):
     # a number of existing subclasses that override `__init__` without calling
     # the `__init__` method of the  superclass.
     obj._contexts_lock = threading.Lock()  # pylint: disable=protected-access
+    obj._cameras = {}  # pylint: disable=protected-access
     return obj
 
   def __init__(self, data):
@@ -165,7 +170,7 @@ class Physics(_control.Physics):
       mjlib.mj_step1(self.model.ptr, self.data.ptr)
 
   def render(self, height=240, width=320, camera_id=-1, overlays=(),
-             depth=False, segmentation=False, scene_option=None):
+             depth=False, segmentation=False, scene_option=None, out=None):
     """Returns a camera view as a NumPy array of pixel values.
 
     Args:
@@ -186,18 +191,57 @@ class Physics(_control.Physics):
       scene_option: An optional `wrapper.MjvOption` instance that can be used to
         render the scene with custom visualization options. If None then the
         default options will be used.
+      out: An optional uint8 array of shape (height, width, 3), or
+        (3, height, width) for channels-first images, into which the RGB image
+        is written. Not supported if `depth` or `segmentation` is True.
 
     Returns:
-      The rendered RGB, depth or segmentation image.
+      The rendered RGB, depth or segmentation image, or `out` if specified.
     """
-    camera = Camera(
-        physics=self, height=height, width=width, camera_id=camera_id)
+    camera = self._get_camera(height, width, camera_id)
     image = camera.render(
         overlays=overlays, depth=depth, segmentation=segmentation,
-        scene_option=scene_option)
-    camera._scene.free()  # pylint: disable=protected-access
+        scene_option=scene_option, out=out)
+    if out is not None:
+      return image
+    if segmentation:
+      # The camera is reused, restore the default rendering flags.
+      camera.scene.flags[enums.mjtRndFlag.mjRND_SEGMENT] = False
+      camera.scene.flags[enums.mjtRndFlag.mjRND_IDCOLOR] = False
+    elif not depth:
+      # The RGB image is a view of the camera buffer, overwritten by the next
+      # call.
+      image = image.copy()
     return image
 
+  def _get_camera(self, height, width, camera_id):
+    """Returns a cached `Camera` for the given viewport and camera.
+
+    Creating a `Camera` allocates a new `MjvScene` and pixel buffers, which
+    dominates the cost of rendering small images. Cameras are kept until the
+    model is reloaded or the `Physics` is freed.
+
+    Args:
+      height: Viewport height (number of pixels).
+      width: Viewport width (number of pixels).
+      camera_id: Camera name or index.
+
+    Returns:
+      A `Camera` instance.
+    """
+    key = (height, width, camera_id)
+    camera = self._cameras.get(key)
+    if camera is None:
+      camera = Camera(
+          physics=self, height=height, width=width, camera_id=camera_id)
+      self._cameras[key] = camera
+    return camera
+
+  def _free_cameras(self):
+    for camera in six.itervalues(self._cameras):
+      camera._scene.free()  # pylint: disable=protected-access
+    self._cameras = {}
+
   def get_state(self):
     """Returns the physics state.
 
@@ -304,6 +348,7 @@ class Physics(_control.Physics):
     # Note: `_contexts_lock` is normally created in `__new__`, but `__new__` is
     #       not invoked during unpickling.
     self._contexts_lock = threading.Lock()
+    self._cameras = {}
     self._reload_from_data(data)
 
   def _reload_from_model(self, model):
@@ -338,6 +383,9 @@ class Physics(_control.Physics):
     self._warnings_before = np.empty_like(self._warnings)
     self._new_warnings = np.empty(dtype=bool, shape=self._warnings.shape)
 
+    # Cached cameras hold scenes allocated for the previous model.
+    self._free_cameras()
+
     # Forcibly free any previous GL context in order to avoid problems with GL
     # implementations that do not support multiple contexts on a given device.
     with self._contexts_lock:
@@ -363,6 +411,7 @@ class Physics(_control.Physics):
     necessary. This `Physics` object MUST NOT be used after this function has
     been called.
     """
+    self._free_cameras()
     with self._contexts_lock:
       if self._contexts:
         self._free_rendering_contexts()
@@ -376,7 +425,7 @@ class Physics(_control.Physics):
     return cls(data)
 
   @classmethod
-  def from_xml_string(cls, xml_string, assets=None):
+  def from_xml_string(cls, xml_string, assets=None, cache=None):
     """A named constructor from a string containing an MJCF XML file.
 
     Args:
@@ -385,11 +434,16 @@ class Physics(_control.Physics):
         (such as additional XML files, textures, meshes etc.), in the form of
         `{filename: contents_string}` pairs. The keys should correspond to the
         filenames specified in the model XML.
+      cache: Optional `model_cache.ModelCache` from which the compiled model
+        is copied, if the same XML and assets were compiled before.
 
     Returns:
       A new `Physics` instance.
     """
-    model = wrapper.MjModel.from_xml_string(xml_string, assets=assets)
+    if cache is not None:
+      model = cache.from_xml_string(xml_string, assets=assets)
+    else:
+      model = wrapper.MjModel.from_xml_string(xml_string, assets=assets)
     return cls.from_model(model)
 
   @classmethod
@@ -424,7 +478,7 @@ class Physics(_control.Physics):
     model = wrapper.MjModel.from_binary_path(file_path)
     return cls.from_model(model)
 
-  def reload_from_xml_string(self, xml_string, assets=None):
+  def reload_from_xml_string(self, xml_string, assets=None, cache=None):
     """Reloads the `Physics` instance from a string containing an MJCF XML file.
 
     After calling this method, the state of the `Physics` instance is the same
@@ -437,8 +491,13 @@ class Physics(_control.Physics):
         (such as additional XML files, textures, meshes etc.), in the form of
         `{filename: contents_string}` pairs. The keys should correspond to the
         filenames specified in the model XML.
+      cache: Optional `model_cache.ModelCache` from which the compiled model
+        is copied, if the same XML and assets were compiled before.
     """
-    new_model = wrapper.MjModel.from_xml_string(xml_string, assets=assets)
+    if cache is not None:
+      new_model = cache.from_xml_string(xml_string, assets=assets)
+    else:
+      new_model = wrapper.MjModel.from_xml_string(xml_string, assets=assets)
     self._reload_from_model(new_model)
 
   def reload_from_xml_path(self, file_path):
@@ -682,7 +741,7 @@ class Camera(object):
         self._physics.contexts.mujoco.ptr)
 
   def render(self, overlays=(), depth=False, segmentation=False,
-             scene_option=None):
+             scene_option=None, out=None):
     """Renders the camera view as a numpy array of pixel values.
 
     Args:
@@ -695,9 +754,13 @@ class Camera(object):
         True.
       scene_option: A custom `wrapper.MjvOption` instance to use to render
         the scene instead of the default.  If None, will use the default.
+      out: An optional uint8 array of shape (height, width, 3), or
+        (3, height, width) for channels-first images, into which the flipped
+        RGB image is written, avoiding any intermediate copy. Not supported if
+        `depth` or `segmentation` is True.
 
     Returns:
-      The rendered scene.
+      The rendered scene, or `out` if specified.
         * If `depth` and `segmentation` are both False (default), this is a
           (height, width, 3) uint8 numpy array containing RGB values.
         * If `depth` is True, this is a (height, width) float32 numpy array
@@ -711,6 +774,8 @@ class Camera(object):
     Raises:
       ValueError: If overlays are requested with depth rendering.
       ValueError: If both depth and segmentation flags are set together.
+      ValueError: If `out` is given with depth or segmentation rendering, or
+        has an invalid shape.
     """
 
     if overlays and (depth or segmentation):
@@ -719,6 +784,15 @@ class Camera(object):
     if depth and segmentation:
       raise ValueError(_BOTH_SEGMENTATION_AND_DEPTH_ENABLED)
 
+    if out is not None:
+      if depth or segmentation:
+        raise ValueError(_OUT_NOT_SUPPORTED_FOR_DEPTH_OR_SEGMENTATION)
+      hwc = (self._height, self._width, 3)
+      chw = (3, self._height, self._width)
+      if out.shape not in (hwc, chw):
+        raise ValueError(_INVALID_OUT_SHAPE.format(
+            hwc=hwc, chw=chw, shape=out.shape))
+
     # Enable flags to compute segmentation labels
     if segmentation:
       self._scene.flags[enums.mjtRndFlag.mjRND_SEGMENT] = True
@@ -758,7 +832,13 @@ class Camera(object):
       image = self._rgb_buffer
 
     # The first row in the buffer is the bottom row of pixels in the image.
-    return np.flipud(image)
+    image = np.flipud(image)
+    if out is not None:
+      if out.shape[0] == 3 and out.shape != image.shape:
+        image = image.transpose(2, 0, 1)
+      np.copyto(out, image)
+      return out
+    return image
 
   def select(self, cursor_position):
     """Returns bodies and geoms visible at given coordinates in the frame.
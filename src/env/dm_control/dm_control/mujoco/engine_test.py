@@ -241,6 +241,62 @@ class MujocoEngineTest(parameterized.TestCase):
                                         segmentation=True)
     self.assertEqual(segmentation.shape, (height, width, 2))
 
+  def testPhysicsRenderReusesCamera(self):
+    self._physics.render(height=64, width=48, camera_id=0)
+    camera = self._physics._cameras[(64, 48, 0)]
+    self._physics.render(height=64, width=48, camera_id=0, depth=True)
+    self.assertIs(camera, self._physics._cameras[(64, 48, 0)])
+    self._physics.render(height=48, width=64, camera_id=0)
+    self.assertLen(self._physics._cameras, 2)
+
+  def testPhysicsRenderReturnsIndependentImages(self):
+    image = self._physics.render(height=64, width=48, camera_id=0)
+    expected = image.copy()
+    with self._physics.reset_context():
+      self._physics.named.data.qpos['slider'] = 0.5
+    self._physics.render(height=64, width=48, camera_id=0)
+    np.testing.assert_array_equal(image, expected)
+
+  def testPhysicsRenderAfterSegmentation(self):
+    image = self._physics.render(height=64, width=48, camera_id=0)
+    self._physics.render(height=64, width=48, camera_id=0, segmentation=True)
+    np.testing.assert_array_equal(
+        image, self._physics.render(height=64, width=48, camera_id=0))
+
+  def testPhysicsRenderIntoOut(self):
+    image = self._physics.render(height=64, width=48, camera_id=0)
+    out = np.zeros((64, 48, 3), dtype=np.uint8)
+    self.assertIs(
+        out, self._physics.render(height=64, width=48, camera_id=0, out=out))
+    np.testing.assert_array_equal(image, out)
+    out = np.zeros((2, 3, 64, 48), dtype=np.uint8)
+    self._physics.render(height=64, width=48, camera_id=0, out=out[1])
+    np.testing.assert_array_equal(image.transpose(2, 0, 1), out[1])
+    self.assertFalse(out[0].any())
+
+  def testExceptionIfOutHasInvalidShape(self):
+    with self.assertRaises(ValueError):
+      self._physics.render(height=64, width=48,
+                           out=np.empty((48, 64, 3), dtype=np.uint8))
+
+  def testExceptionIfOutAndDepthOrSegmentation(self):
+    out = np.empty((64, 48, 3), dtype=np.uint8)
+    with self.assertRaisesWithLiteralMatch(
+        ValueError, engine._OUT_NOT_SUPPORTED_FOR_DEPTH_OR_SEGMENTATION):
+      self._physics.render(height=64, width=48, depth=True, out=out)
+    with self.assertRaisesWithLiteralMatch(
+        ValueError, engine._OUT_NOT_SUPPORTED_FOR_DEPTH_OR_SEGMENTATION):
+      self._physics.render(height=64, width=48, segmentation=True, out=out)
+
+  def testCamerasFreedOnReload(self):
+    self._physics.render(height=64, width=48, camera_id=0)
+    scene = self._physics._cameras[(64, 48, 0)].scene
+    with mock.patch.object(scene, 'free', wraps=scene.free) as mock_free_scene:
+      self._physics.reload_from_xml_path(MODEL_PATH)
+    mock_free_scene.assert_called_once()
+    self.assertEmpty(self._physics._cameras)
+    self._physics.render(height=64, width=48, camera_id=0)
+
   def testExceptionIfBothDepthAndSegmentation(self):
     with self.assertRaisesWithLiteralMatch(
         ValueError, engine._BOTH_SEGMENTATION_AND_DEPTH_ENABLED):
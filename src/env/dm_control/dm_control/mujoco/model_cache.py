@@ -0,0 +1,147 @@
+# Copyright 2017 The dm_control Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or  implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+
+"""Cache of compiled MuJoCo models, keyed by their XML and assets.
+
+Compiling an MJCF model is much slower than copying a compiled one. A
+`ModelCache` keeps the most recently compiled `MjModel`s in memory and,
+optionally, as MJB binaries in a directory shared by several processes.
+
+```python
+cache = ModelCache(max_size=16, cache_dir='/tmp/mjb')
+physics.reload_from_xml_string(xml_string, assets, cache=cache)
+```
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import copy
+import hashlib
+import os
+import threading
+
+from dm_control.mujoco import wrapper
+import six
+
+# Environment variable holding the directory of the MJB binaries of the
+# default cache. If unset the default cache is in memory only.
+_CACHE_DIR_ENV = 'DM_CONTROL_MODEL_CACHE_DIR'
+
+_DEFAULT_CACHE = None
+_DEFAULT_CACHE_LOCK = threading.Lock()
+
+
+def _to_bytes(value):
+  return value.encode('utf-8') if isinstance(value, six.text_type) else value
+
+
+def model_key(xml_string, assets=None):
+  """Returns a hash of an XML string and its assets.
+
+  Args:
+    xml_string: String containing an MJCF model description.
+    assets: Optional dict of `{filename: contents_string}` assets.
+
+  Returns:
+    A hexadecimal string.
+  """
+  digest = hashlib.sha1(_to_bytes(xml_string))
+  for filename, contents in sorted((assets or {}).items()):
+    for value in (filename, contents):
+      value = _to_bytes(value)
+      # Length prefixes make the concatenation unambiguous.
+      digest.update(str(len(value)).encode('ascii') + b':' + value)
+  return digest.hexdigest()
+
+
+class ModelCache(object):
+  """LRU cache of compiled `MjModel`s keyed by their XML and assets.
+
+  Cached models are never handed out: every lookup returns a copy, which the
+  caller may modify or free freely.
+  """
+
+  def __init__(self, max_size=16, cache_dir=None):
+    """Initializes a new `ModelCache`.
+
+    Args:
+      max_size: Maximum number of models held in memory.
+      cache_dir: Optional directory in which compiled models are saved as MJB
+        binaries, so that they are reused across processes.
+    """
+    self._max_size = max_size
+    self._cache_dir = cache_dir
+    self._models = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self._models)
+
+  def from_xml_string(self, xml_string, assets=None):
+    """Returns a copy of the model compiled from an XML string and assets.
+
+    Args:
+      xml_string: String containing an MJCF model description.
+      assets: Optional dict of `{filename: contents_string}` assets.
+
+    Returns:
+      An `MjModel` instance owned by the caller.
+    """
+    key = model_key(xml_string, assets)
+    with self._lock:
+      model = self._models.pop(key, None)
+      if model is None:
+        model = self._load(key, xml_string, assets)
+      self._models[key] = model
+      while len(self._models) > self._max_size:
+        self._models.popitem(last=False)
+      return copy.copy(model)
+
+  def clear(self):
+    """Removes all models held in memory."""
+    with self._lock:
+      self._models.clear()
+
+  def _load(self, key, xml_string, assets):
+    """Reads the model from the cache directory, or compiles it."""
+    if self._cache_dir is None:
+      return wrapper.MjModel.from_xml_string(xml_string, assets=assets)
+    binary_path = os.path.join(self._cache_dir, key + '.mjb')
+    if os.path.exists(binary_path):
+      return wrapper.MjModel.from_binary_path(binary_path)
+    model = wrapper.MjModel.from_xml_string(xml_string, assets=assets)
+    if not os.path.isdir(self._cache_dir):
+      os.makedirs(self._cache_dir)
+    # Other processes may compile the same model concurrently.
+    tmp_path = '{}.{}.tmp'.format(binary_path, os.getpid())
+    model.save_binary(tmp_path)
+    os.rename(tmp_path, binary_path)
+    return model
+
+
+def get_default_cache():
+  """Returns the process-wide `ModelCache`.
+
+  Its MJB binaries are saved in the directory given by the
+  `DM_CONTROL_MODEL_CACHE_DIR` environment variable, if set.
+  """
+  global _DEFAULT_CACHE
+  with _DEFAULT_CACHE_LOCK:
+    if _DEFAULT_CACHE is None:
+      _DEFAULT_CACHE = ModelCache(cache_dir=os.environ.get(_CACHE_DIR_ENV))
+    return _DEFAULT_CACHE
@@ -0,0 +1,98 @@
+# Copyright 2017 The dm_control Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or  implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+
+"""Tests for `dm_control.mujoco.model_cache`."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+# Internal dependencies.
+
+from absl.testing import absltest
+from dm_control.mujoco import engine
+from dm_control.mujoco import model_cache
+from dm_control.mujoco import wrapper
+from dm_control.mujoco.testing import assets
+import mock
+import numpy as np
+
+MODEL = assets.get_contents('cartpole.xml')
+MODEL_WITH_ASSETS = assets.get_contents('model_with_assets.xml')
+ASSETS = {
+    'texture.png': assets.get_contents('deepmind.png'),
+    'mesh.stl': assets.get_contents('cube.stl'),
+    'included.xml': assets.get_contents('sphere.xml')
+}
+
+
+class ModelCacheTest(absltest.TestCase):
+
+  def testModelKey(self):
+    self.assertEqual(model_cache.model_key(MODEL_WITH_ASSETS, ASSETS),
+                     model_cache.model_key(MODEL_WITH_ASSETS, dict(ASSETS)))
+    self.assertNotEqual(model_cache.model_key(MODEL),
+                        model_cache.model_key(MODEL_WITH_ASSETS, ASSETS))
+    renamed = {'texture.png': ASSETS['mesh.stl'],
+               'mesh.stl': ASSETS['texture.png'],
+               'included.xml': ASSETS['included.xml']}
+    self.assertNotEqual(model_cache.model_key(MODEL_WITH_ASSETS, ASSETS),
+                        model_cache.model_key(MODEL_WITH_ASSETS, renamed))
+
+  def testReturnsIndependentCopies(self):
+    cache = model_cache.ModelCache()
+    with mock.patch.object(wrapper.MjModel, 'from_xml_string',
+                           wraps=wrapper.MjModel.from_xml_string) as compile_:
+      first = cache.from_xml_string(MODEL)
+      first.body_mass[1] = 123.
+      second = cache.from_xml_string(MODEL)
+    compile_.assert_called_once()
+    self.assertIsNot(first, second)
+    self.assertNotEqual(second.body_mass[1], 123.)
+
+  def testEvictsLeastRecentlyUsed(self):
+    cache = model_cache.ModelCache(max_size=1)
+    cache.from_xml_string(MODEL)
+    cache.from_xml_string(MODEL_WITH_ASSETS, ASSETS)
+    self.assertLen(cache, 1)
+    with mock.patch.object(wrapper.MjModel, 'from_xml_string',
+                           wraps=wrapper.MjModel.from_xml_string) as compile_:
+      cache.from_xml_string(MODEL)
+    compile_.assert_called_once()
+
+  def testReusesBinariesAcrossCaches(self):
+    cache_dir = self.create_tempdir().full_path
+    expected = model_cache.ModelCache(cache_dir=cache_dir).from_xml_string(
+        MODEL_WITH_ASSETS, ASSETS)
+    self.assertLen(os.listdir(cache_dir), 1)
+    with mock.patch.object(wrapper.MjModel, 'from_xml_string') as compile_:
+      model = model_cache.ModelCache(cache_dir=cache_dir).from_xml_string(
+          MODEL_WITH_ASSETS, ASSETS)
+    compile_.assert_not_called()
+    np.testing.assert_array_equal(model.tex_rgb, expected.tex_rgb)
+
+  def testPhysicsReloadFromCache(self):
+    cache = model_cache.ModelCache()
+    physics = engine.Physics.from_xml_string(MODEL, cache=cache)
+    physics.model.body_mass[1] = 123.
+    physics.reload_from_xml_string(MODEL, cache=cache)
+    self.assertNotEqual(physics.model.body_mass[1], 123.)
+    self.assertLen(cache, 1)
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -1,5 +1,7 @@
 import os
 import numpy as np
+from dm_control.mujoco import wrapper
+from dm_control.mujoco.wrapper.mjbindings import mjlib
 from dm_control.suite import common
 from dm_control.utils import io as resources
 import xmltodict
@@ -34,6 +36,10 @@ def get_model_and_assets_from_setting_kwargs(model_fname, setting_kwargs=None):
         assert isinstance(setting_kwargs['grid_rgb2'], (list, tuple, np.ndarray))
         materials['mujoco']['asset']['texture']['@rgb2'] = \
             f'{setting_kwargs["grid_rgb2"][0]} {setting_kwargs["grid_rgb2"][1]} {setting_kwargs["grid_rgb2"][2]}'
+    if 'grid_markrgb' in setting_kwargs:
+        assert isinstance(setting_kwargs['grid_markrgb'], (list, tuple, np.ndarray))
+        materials['mujoco']['asset']['texture']['@markrgb'] = \
+            f'{setting_kwargs["grid_markrgb"][0]} {setting_kwargs["grid_markrgb"][1]} {setting_kwargs["grid_markrgb"][2]}'
 
     # Edit self
     if 'self_rgb' in setting_kwargs:
@@ -61,3 +67,90 @@ def get_model_and_assets_from_setting_kwargs(model_fname, setting_kwargs=None):
     assets['./common/skybox.xml'] = xmltodict.unparse(skybox)
 
     return model_xml, assets
+
+
+# Setting kwargs of the (rgb1, rgb2, markrgb) colors of the builtin textures, with the asset defining them
+_TEXTURES = {
+    'grid': ('./common/materials.xml', ('grid_rgb1', 'grid_rgb2', 'grid_markrgb')),
+    'skybox': ('./common/skybox.xml', ('skybox_rgb', 'skybox_rgb2', 'skybox_markrgb')),
+}
+
+# Per-pixel weights of the (rgb1, rgb2, markrgb) colors of the builtin textures, keyed by model file name
+_TEXTURE_WEIGHTS = {}
+
+# Default colors of the self material and builtin textures, parsed once from the common assets
+_DEFAULT_COLORS = {}
+
+
+def _default_colors(name):
+    """Returns the rgb color of the self material, or the (rgb1, rgb2, markrgb) colors of a builtin texture"""
+    if not _DEFAULT_COLORS:
+        def parse(filename):
+            return xmltodict.parse(resources.GetResource(os.path.join(_SUITE_DIR, filename)))['mujoco']['asset']
+
+        def rgb(s):
+            return np.array([float(c) for c in s.split()[:3]])
+
+        _DEFAULT_COLORS['self'] = rgb(parse('./common/materials.xml')['material'][1]['@rgba'])
+        for texture_name, (filename, _) in _TEXTURES.items():
+            texture = parse(filename)['texture']
+            _DEFAULT_COLORS[texture_name] = np.stack([rgb(texture[key]) for key in ('@rgb1', '@rgb2', '@markrgb')])
+    return _DEFAULT_COLORS[name].copy()
+
+
+def _texture_rgb(model, name):
+    """Returns a writable (height * width, 3) view of the pixels of a texture of the compiled model"""
+    tex_id = model.name2id(name, 'texture')
+    adr, size = model.tex_adr[tex_id], 3 * model.tex_height[tex_id] * model.tex_width[tex_id]
+    return model.tex_rgb[adr:adr + size].reshape(-1, 3)
+
+
+def _texture_weights(model_fname):
+    """Returns the per-pixel weights of the (rgb1, rgb2, markrgb) colors of the builtin textures of a model
+    Builtin textures are a per-pixel mix of their three colors, the weights are read back from a single
+    model compiled with pure red, green and blue colors."""
+    if model_fname not in _TEXTURE_WEIGHTS:
+        probe = {}
+        for _, keys in _TEXTURES.values():
+            probe.update(zip(keys, np.eye(3)))
+        model = wrapper.MjModel.from_xml_string(*get_model_and_assets_from_setting_kwargs(model_fname, probe))
+        _TEXTURE_WEIGHTS[model_fname] = {name: _texture_rgb(model, name) / 255. for name in _TEXTURES}
+    return _TEXTURE_WEIGHTS[model_fname]
+
+
+def apply_setting_kwargs(physics, model_fname, setting_kwargs=None):
+    """Applies setting_kwargs to the compiled model of physics in place, without recompiling it
+    Matches reloading physics from get_model_and_assets_from_setting_kwargs(model_fname, setting_kwargs)
+    for models compiled from the common assets, with one exception: the per-pixel weights of the skybox
+    gradient are only known to 8 bits, so its pixels may differ by one level per channel (the self color
+    and the checker grid are exact). Settings that are not given are restored to their default, so that
+    nothing applied by a previous setting remains. Other model fields are left as they are, while a
+    recompile would reset them. Textures are re-uploaded to existing rendering contexts, none are created."""
+    if setting_kwargs is None:
+        setting_kwargs = {}
+    model = physics.model
+
+    # Edit self
+    self_id = model.name2id('self', 'material')
+    model.mat_rgba[self_id, :3] = setting_kwargs.get('self_rgb', _default_colors('self'))
+    model.mat_rgba[self_id, 3] = 1
+
+    # Edit grid floor and skybox
+    weights = _texture_weights(model_fname)
+    for name, (_, keys) in _TEXTURES.items():
+        colors = _default_colors(name)
+        for i, key in enumerate(keys):
+            if key in setting_kwargs:
+                assert isinstance(setting_kwargs[key], (list, tuple, np.ndarray))
+                colors[i] = setting_kwargs[key]
+        # Colors are truncated to bytes as by the MuJoCo compiler
+        _texture_rgb(model, name)[:] = np.clip(255 * weights[name].dot(colors), 0, 255).astype(np.uint8)
+
+        # Only re-upload to existing contexts, physics.contexts would create them
+        contexts = physics._contexts  # pylint: disable=protected-access
+        if contexts:
+            with contexts.gl.make_current() as ctx:
+                ctx.call(mjlib.mjr_uploadTexture,
+                         model.ptr,
+                         contexts.mujoco.ptr,
+                         model.name2id(name, 'texture'))
@@ -0,0 +1,114 @@
+# Copyright 2017 The dm_control Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or  implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+
+"""Tests for the dm_control.suite color settings."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+# Internal dependencies.
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from dm_control import mujoco
+from dm_control.suite.common import settings
+import numpy as np
+
+_SETTING_KWARGS = {
+    'grid_rgb1': np.array([0.109165, 0.11903745, 0.18573619]),
+    'grid_rgb2': np.array([0.209165, 0.21903745, 0.28573619]),
+    'self_rgb': np.array([0.74018287, 0.53282315, 0.47178415]),
+    'skybox_rgb': np.array([0.25139271, 0.5831122, 0.88217072]),
+}
+
+_GREEN_SCREEN_KWARGS = {
+    'skybox_rgb': [.2, .8, .2],
+    'skybox_rgb2': [.2, .8, .2],
+    'skybox_markrgb': [.2, .8, .2],
+}
+
+
+def _compiled(model_fname, setting_kwargs=None):
+  return mujoco.Physics.from_xml_string(
+      *settings.get_model_and_assets_from_setting_kwargs(
+          model_fname, setting_kwargs))
+
+
+class ApplySettingKwargsTest(parameterized.TestCase):
+
+  @parameterized.parameters(
+      ('cartpole.xml', _SETTING_KWARGS, None),
+      ('walker.xml', _SETTING_KWARGS, None),
+      ('cartpole.xml', _GREEN_SCREEN_KWARGS, _SETTING_KWARGS),
+      ('cartpole.xml', None, _SETTING_KWARGS),
+      ('walker.xml', _SETTING_KWARGS, _GREEN_SCREEN_KWARGS))
+  def test_matches_recompiled_model(self, model_fname, setting_kwargs,
+                                    previous_setting_kwargs):
+    expected = _compiled(model_fname, setting_kwargs)
+    physics = _compiled(model_fname)
+    # Nothing applied by a previous setting remains.
+    if previous_setting_kwargs is not None:
+      settings.apply_setting_kwargs(physics, model_fname,
+                                    previous_setting_kwargs)
+    settings.apply_setting_kwargs(physics, model_fname, setting_kwargs)
+
+    np.testing.assert_array_equal(physics.model.mat_rgba,
+                                  expected.model.mat_rgba)
+    np.testing.assert_array_equal(
+        settings._texture_rgb(physics.model, 'grid'),
+        settings._texture_rgb(expected.model, 'grid'))
+    # The skybox gradient weights are only known to 8 bits, see
+    # apply_setting_kwargs: its pixels may be one level off per channel.
+    np.testing.assert_allclose(
+        settings._texture_rgb(physics.model, 'skybox').astype(int),
+        settings._texture_rgb(expected.model, 'skybox').astype(int), atol=1)
+
+    # Which, once rendered, is below one level on average.
+    image = physics.render(height=84, width=84, camera_id=0).astype(float)
+    expected_image = expected.render(height=84, width=84, camera_id=0)
+    self.assertLess(np.abs(image - expected_image).mean(), 1.)
+
+  def test_restores_defaults(self):
+    physics = _compiled('cartpole.xml')
+    mat_rgba = physics.model.mat_rgba.copy()
+    tex_rgb = physics.model.tex_rgb.copy()
+    settings.apply_setting_kwargs(physics, 'cartpole.xml', _SETTING_KWARGS)
+    self.assertFalse(np.array_equal(tex_rgb, physics.model.tex_rgb))
+    settings.apply_setting_kwargs(physics, 'cartpole.xml')
+    np.testing.assert_array_equal(physics.model.mat_rgba, mat_rgba)
+    np.testing.assert_array_equal(
+        settings._texture_rgb(physics.model, 'grid'),
+        settings._texture_rgb(_compiled('cartpole.xml').model, 'grid'))
+    np.testing.assert_allclose(physics.model.tex_rgb.astype(int),
+                               tex_rgb.astype(int), atol=1)
+
+  def test_does_not_create_contexts(self):
+    physics = _compiled('cartpole.xml')
+    settings.apply_setting_kwargs(physics, 'cartpole.xml', _SETTING_KWARGS)
+    self.assertIsNone(physics._contexts)
+
+  def test_uploads_textures_to_existing_contexts(self):
+    expected = _compiled('cartpole.xml', _GREEN_SCREEN_KWARGS)
+    physics = _compiled('cartpole.xml')
+    physics.render(height=84, width=84, camera_id=0)
+    settings.apply_setting_kwargs(physics, 'cartpole.xml', _GREEN_SCREEN_KWARGS)
+    image = physics.render(height=84, width=84, camera_id=0).astype(float)
+    expected_image = expected.render(height=84, width=84, camera_id=0)
+    self.assertLess(np.abs(image - expected_image).mean(), 1.)
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -16,9 +16,10 @@ def make(
         environment_kwargs=None,
         setting_kwargs=None,
         time_limit=None,
-        channels_first=True
+        channels_first=True,
+        lazy_info=False
 ):
-    env_id = 'dmc_%s_%s-v1' % (domain_name, task_name)
+    env_id = 'dmc_%s_%s%s-v1' % (domain_name, task_name, '_lazy' if lazy_info else '')
 
     if from_pixels:
         assert not visualize_reward, 'cannot use visualize reward when learning from pixels'
@@ -27,12 +28,14 @@ def make(
     max_episode_steps = (episode_length + frame_skip - 1) // frame_skip
     time_limit = 1e6
 
+    # the task seed differs between envs of the same id, so it is passed to every instance
+    task_kwargs = {}
+    if seed is not None:
+        task_kwargs['random'] = seed
+    if time_limit is not None:
+        task_kwargs['time_limit'] = time_limit
+
     if not env_id in gym.envs.registry.env_specs:
-        task_kwargs = {}
-        if seed is not None:
-            task_kwargs['random'] = seed
-        if time_limit is not None:
-            task_kwargs['time_limit'] = time_limit
         register(
             id=env_id,
             entry_point='dmc2gym.wrappers:DMCWrapper',
@@ -49,7 +52,8 @@ def make(
                 camera_id=camera_id,
                 frame_skip=frame_skip,
                 channels_first=channels_first,
+                lazy_info=lazy_info,
             ),
             max_episode_steps=max_episode_steps,
         )
-    return gym.make(env_id)
+    return gym.make(env_id, task_kwargs=task_kwargs)
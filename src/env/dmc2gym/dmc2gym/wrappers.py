@@ -1,3 +1,4 @@
+from collections.abc import MutableMapping
 from gym import core, spaces
 from dm_control import suite
 from dm_env import specs
@@ -34,6 +35,39 @@ def _flatten_obs(obs):
     return np.concatenate(obs_pieces, axis=0)
 
 
+class LazyInfo(MutableMapping):
+    """Info dict whose entries are computed by their factory on first access
+    Pickled as a plain dict, e.g. when sent back by a vec env worker"""
+
+    def __init__(self, **factories):
+        self._values = {}
+        self._factories = factories
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            self._values[key] = self._factories.pop(key)()
+        return self._values[key]
+
+    def __setitem__(self, key, value):
+        self._factories.pop(key, None)
+        self._values[key] = value
+
+    def __delitem__(self, key):
+        if key in self._values:
+            del self._values[key]
+        else:
+            del self._factories[key]
+
+    def __iter__(self):
+        return iter(list(self._values) + list(self._factories))
+
+    def __len__(self):
+        return len(self._values) + len(self._factories)
+
+    def __reduce__(self):
+        return dict, (dict(self.items()),)
+
+
 class DMCWrapper(core.Env):
     def __init__(
         self,
@@ -48,8 +82,11 @@ class DMCWrapper(core.Env):
         frame_skip=1,
         environment_kwargs=None,
         setting_kwargs=None,
-        channels_first=True
+        channels_first=True,
+        lazy_info=False
     ):
+        """With lazy_info, the info of step is a LazyInfo computing discount and physics on access,
+        and does not hold internal_state, the physics state before the step"""
         assert 'random' in task_kwargs, 'please specify a seed, for deterministic behaviour'
         self._domain_name = domain_name
         self._task_name = task_name
@@ -59,6 +96,7 @@ class DMCWrapper(core.Env):
         self._camera_id = camera_id
         self._frame_skip = frame_skip
         self._channels_first = channels_first
+        self._lazy_info = lazy_info
 
         # create task
         self._env = suite.load(
@@ -94,7 +132,9 @@ class DMCWrapper(core.Env):
                 self._env.observation_spec().values()
         )
         
-        self.current_state = None
+        self._time_step = None
+        self._current_state = None
+        self._obs_out = None
 
         # set seed
         self.seed(seed=task_kwargs.get('random', 1))
@@ -102,17 +142,28 @@ class DMCWrapper(core.Env):
     def __getattr__(self, name):
         return getattr(self._env, name)
 
+    def set_obs_out(self, out):
+        """Sets the array into which the next observation of step or reset is written, the
+        observation returned is then out itself. Pixels are rendered into it without intermediate copy"""
+        assert out.shape == self._observation_space.shape, 'out must match the observation space'
+        self._obs_out = out
+
     def _get_obs(self, time_step):
+        out, self._obs_out = self._obs_out, None
         if self._from_pixels:
+            if out is None:
+                out = np.empty(self._observation_space.shape, dtype=np.uint8)
             obs = self.render(
                 height=self._height,
                 width=self._width,
-                camera_id=self._camera_id
+                camera_id=self._camera_id,
+                out=out
             )
-            if self._channels_first:
-                obs = obs.transpose(2, 0, 1).copy()
         else:
             obs = _flatten_obs(time_step.observation)
+            if out is not None:
+                out[:] = obs
+                obs = out
         return obs
 
     def _convert_action(self, action):
@@ -124,6 +175,17 @@ class DMCWrapper(core.Env):
         action = action.astype(np.float32)
         return action
 
+    @property
+    def current_state(self):
+        """Flattened state observation of the last time step, computed on access"""
+        if self._current_state is None and self._time_step is not None:
+            self._current_state = _flatten_obs(self._time_step.observation)
+        return self._current_state
+
+    def _set_time_step(self, time_step):
+        self._time_step = time_step
+        self._current_state = None
+
     @property
     def observation_space(self):
         return self._observation_space
@@ -146,7 +208,8 @@ class DMCWrapper(core.Env):
         action = self._convert_action(action)
         assert self._true_action_space.contains(action)
         reward = 0
-        extra = {'internal_state': self._env.physics.get_state().copy()}
+        if not self._lazy_info:
+            extra = {'internal_state': self._env.physics.get_state().copy()}
 
         for _ in range(self._frame_skip):
             time_step = self._env.step(action)
@@ -155,22 +218,25 @@ class DMCWrapper(core.Env):
             if done:
                 break
         obs = self._get_obs(time_step)
-        self.current_state = _flatten_obs(time_step.observation)
-        extra['discount'] = time_step.discount
-        extra['physics'] = time_step.observation
+        self._set_time_step(time_step)
+        if self._lazy_info:
+            extra = LazyInfo(discount=lambda: time_step.discount, physics=lambda: time_step.observation)
+        else:
+            extra['discount'] = time_step.discount
+            extra['physics'] = time_step.observation
         return obs, reward, done, extra
 
     def reset(self):
         time_step = self._env.reset()
-        self.current_state = _flatten_obs(time_step.observation)
+        self._set_time_step(time_step)
         obs = self._get_obs(time_step)
         return obs
 
-    def render(self, mode='rgb_array', height=None, width=None, camera_id=0):
+    def render(self, mode='rgb_array', height=None, width=None, camera_id=0, out=None):
         assert mode == 'rgb_array', 'only support rgb_array mode, given %s' % mode
         height = height or self._height
         width = width or self._width
         camera_id = camera_id or self._camera_id
         return self._env.physics.render(
-            height=height, width=width, camera_id=camera_id
+            height=height, width=width, camera_id=camera_id, out=out
         )
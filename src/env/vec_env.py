@@ -0,0 +1,181 @@
+import multiprocessing as mp
+import numpy as np
+
+from env.wrappers import make_pad_env
+import utils
+
+
+class VecEnv(object):
+    """Steps several PAD environments at once
+    step(actions, rewards) keeps the 6-tuple contract of ColorWrapper.step, batched over environments;
+    rewards is an optional list of per-env reward lists, extended in place like the single env version.
+    Environments that are done are no longer stepped and keep returning their last observation."""
+
+    def __init__(self, num_envs, observation_space, action_space, max_episode_steps):
+        self.num_envs = num_envs
+        self.observation_space = observation_space
+        self.action_space = action_space
+        self._max_episode_steps = max_episode_steps
+
+    def reset(self):
+        raise NotImplementedError
+
+    def step(self, actions, rewards=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class DummyVecEnv(VecEnv):
+    """Runs all environments sequentially in the current process"""
+
+    def __init__(self, envs):
+        self.envs = envs
+        super().__init__(len(envs), envs[0].observation_space, envs[0].action_space, envs[0]._max_episode_steps)
+        self._obs = np.empty((self.num_envs, *self.observation_space.shape), dtype=self.observation_space.dtype)
+        self._dones = np.zeros(self.num_envs, dtype=bool)
+        self._changes = np.zeros(self.num_envs)
+        self._rewards = [[] for _ in envs]
+
+    def reset(self):
+        for i, env in enumerate(self.envs):
+            self._obs[i] = env.reset()
+            self._rewards[i] = []
+        self._dones[:] = False
+        return self._obs.copy()
+
+    def step(self, actions, rewards=None):
+        step_rewards = np.zeros(self.num_envs)
+        infos = [{} for _ in self.envs]
+        has_changed = np.zeros(self.num_envs, dtype=bool)
+        for i, env in enumerate(self.envs):
+            if self._dones[i]:
+                continue
+            self._obs[i], step_rewards[i], self._dones[i], infos[i], self._changes[i], has_changed[i] = \
+                env.step(actions[i], self._rewards[i])
+            if rewards is not None:
+                rewards[i].append(step_rewards[i])
+        return self._obs.copy(), step_rewards, self._dones.copy(), infos, self._changes.copy(), has_changed
+
+
+def _worker(remote, parent_remote, env_kwargs, obs_shm, obs_shape, num_envs, ring_size, idx):
+    """Hosts the full make_pad_env stack, writes observations into the shared-memory ring"""
+    parent_remote.close()
+    # spawned workers start with unseeded global RNGs, which the color modes draw from
+    utils.set_seed_everywhere(env_kwargs['seed'])
+    env = make_pad_env(**env_kwargs)
+    obs_ring = np.frombuffer(obs_shm, dtype=np.uint8).reshape(ring_size, num_envs, *obs_shape)
+    rewards, done, change = [], False, None
+
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                action, slot = data
+                if done:
+                    np.copyto(obs_ring[slot, idx], obs_ring[(slot - 1) % ring_size, idx])
+                    remote.send((0., True, {}, change, False))
+                    continue
+                obs, reward, done, info, change, has_changed = env.step(action, rewards)
+                np.copyto(obs_ring[slot, idx], obs)
+                remote.send((reward, done, info, change, has_changed))
+            elif cmd == 'reset':
+                rewards, done = [], False
+                np.copyto(obs_ring[data, idx], env.reset())
+                remote.send(None)
+            elif cmd == 'spaces':
+                remote.send((env.observation_space, env.action_space, env._max_episode_steps))
+            elif cmd == 'call':
+                name, args, kwargs = data
+                remote.send(getattr(env, name)(*args, **kwargs))
+            elif cmd == 'close':
+                remote.close()
+                break
+            else:
+                raise NotImplementedError(f'unknown command {cmd}')
+    except KeyboardInterrupt:
+        pass
+
+
+class SubprocVecEnv(VecEnv):
+    """Hosts each make_pad_env stack (DMCWrapper, GreenScreen, FrameStack, ColorWrapper) in a worker process
+    Actions are sent over pipes and frame-stacked uint8 observations come back through a preallocated
+    shared-memory ring of ring_size slots. The returned observation batch is a view on the current slot,
+    it stays valid for ring_size - 1 further calls to step/reset, so obs and next_obs can be held at once."""
+
+    def __init__(self, env_kwargs_list, obs_shape, ring_size=3, context='spawn'):
+        assert ring_size >= 2, 'ring must hold at least obs and next_obs'
+        self._ring_size = ring_size
+        self._slot = 0
+        self._closed = False
+        num_envs = len(env_kwargs_list)
+        self._dones = np.zeros(num_envs, dtype=bool)
+
+        ctx = mp.get_context(context)
+        self._obs_shm = ctx.RawArray('B', int(ring_size * num_envs * np.prod(obs_shape)))
+        self._obs_ring = np.frombuffer(self._obs_shm, dtype=np.uint8).reshape(ring_size, num_envs, *obs_shape)
+
+        self._remotes, self._work_remotes = zip(*[ctx.Pipe() for _ in range(num_envs)])
+        self._processes = []
+        for idx, (work_remote, remote, env_kwargs) in enumerate(zip(self._work_remotes, self._remotes, env_kwargs_list)):
+            process = ctx.Process(
+                target=_worker,
+                args=(work_remote, remote, env_kwargs, self._obs_shm, obs_shape, num_envs, ring_size, idx),
+                daemon=True
+            )
+            process.start()
+            self._processes.append(process)
+            work_remote.close()
+
+        self._remotes[0].send(('spaces', None))
+        observation_space, action_space, max_episode_steps = self._remotes[0].recv()
+        assert observation_space.shape == tuple(obs_shape), \
+            f'expected observations of shape {tuple(obs_shape)}, received {observation_space.shape}'
+        super().__init__(num_envs, observation_space, action_space, max_episode_steps)
+
+    def _next_slot(self):
+        self._slot = (self._slot + 1) % self._ring_size
+        return self._slot
+
+    def reset(self):
+        slot = self._next_slot()
+        for remote in self._remotes:
+            remote.send(('reset', slot))
+        for remote in self._remotes:
+            remote.recv()
+        self._dones[:] = False
+        return self._obs_ring[slot]
+
+    def step_async(self, actions):
+        slot = self._next_slot()
+        for remote, action in zip(self._remotes, actions):
+            remote.send(('step', (action, slot)))
+
+    def step_wait(self, rewards=None):
+        results = [remote.recv() for remote in self._remotes]
+        step_rewards, dones, infos, changes, has_changed = zip(*results)
+        if rewards is not None:
+            for i in np.flatnonzero(~self._dones):
+                rewards[i].append(step_rewards[i])
+        self._dones = np.array(dones)
+        return self._obs_ring[self._slot], np.array(step_rewards), self._dones.copy(), list(infos), \
+            np.array(changes), np.array(has_changed)
+
+    def step(self, actions, rewards=None):
+        self.step_async(actions)
+        return self.step_wait(rewards)
+
+    def call(self, idx, name, *args, **kwargs):
+        """Calls method name on the environment hosted by worker idx"""
+        self._remotes[idx].send(('call', (name, args, kwargs)))
+        return self._remotes[idx].recv()
+
+    def close(self):
+        if self._closed:
+            return
+        for remote in self._remotes:
+            remote.send(('close', None))
+        for process in self._processes:
+            process.join()
+        self._closed = True
@@ -10,10 +10,10 @@ import torchvision.transforms.functional as TF
 from torchvision.transforms import Grayscale, ColorJitter
 from PIL import Image
 import dmc2gym
+from dm_control.mujoco import model_cache
 from dm_control.suite import common
 import cv2
-from collections import deque
-from utils import moving_average_reward
+from utils import MovingAverageReward
 
 
 def make_pad_env(
@@ -40,7 +40,8 @@ def make_pad_env(
         height=100,
         width=100,
         episode_length=episode_length,
-        frame_skip=action_repeat
+        frame_skip=action_repeat,
+        lazy_info=True
     )
     env.seed(seed)
 
@@ -61,9 +62,13 @@ def make_pad_env(
 
 
 class ColorWrapper(gym.Wrapper):
-    """Wrapper for the color experiments"""
+    """Wrapper for the color experiments
+    Colors are applied to the compiled model in place, or by recompiling it if recompile is set.
+    In place, the skybox may differ from the recompiled one by one level per channel, see
+    common.settings.apply_setting_kwargs. Of the other model fields, which a recompile resets, only
+    the body masses and gravity that this wrapper changes are restored to their compiled values."""
 
-    def __init__(self, env, mode, threshold, dependent, window, mass=None, force=None):
+    def __init__(self, env, mode, threshold, dependent, window, mass=None, force=None, recompile=False):
         assert isinstance(env, FrameStack), 'wrapped env must be a framestack'
         gym.Wrapper.__init__(self, env)
         self._max_episode_steps = env._max_episode_steps
@@ -76,6 +81,15 @@ class ColorWrapper(gym.Wrapper):
         self._change = 1
         self.mass = mass
         self.force = force
+        self._recompile = recompile
+        self._setting = None  # color setting applied at the last reset, if any
+        self.reward_average = MovingAverageReward(window)  # over the rewards of the current episode
+        # Resolved once, reloading the model keeps the same physics instance
+        self._dmc_wrapper = self._find_dmc_wrapper()
+        self._dmc_physics = self._find_physics()
+        # compiled values of the fields changed by mass, force and modify_physics_model
+        self._default_body_mass = self._dmc_physics.model.body_mass.copy()
+        self._default_gravity = self._dmc_physics.model.opt.gravity.copy()
         if 'color' in self._mode:
             self._load_colors()
 
@@ -88,11 +102,12 @@ class ColorWrapper(gym.Wrapper):
 
     def reset(self):
         self.time_step = 0
+        self.reward_average.reset()
         if 'color' in self._mode:
             self.randomize()
         if 'video' in self._mode:
             # apply greenscreen
-            self.reload_physics(
+            self.apply_setting(
                 {'skybox_rgb': [.2, .8, .2],
                  'skybox_rgb2': [.2, .8, .2],
                  'skybox_markrgb': [.2, .8, .2]
@@ -112,11 +127,12 @@ class ColorWrapper(gym.Wrapper):
         # Make a step
         next_obs, reward, done, info = self.env.step(action)
         rewards.append(reward)
+        self.reward_average.update(reward)
         has_changed = False # To reload the pre-trained weights whenever a change happened
         _env = self._get_dmc_wrapper()
 
         if self._dependent: # Won't be true in the actual training setting
-            avg_reward = moving_average_reward(rewards, current_ep=len(rewards) - 1, wind_lgth=self._window)
+            avg_reward = self.reward_average.mean
 
             if self.time_step % self._window == 0 :
                 self.modify_physics_model()
@@ -126,7 +142,7 @@ class ColorWrapper(gym.Wrapper):
 
     def randomize(self):
         if 'color' in self._mode :
-            self.reload_physics(self.get_random_color())
+            self.apply_setting(self.get_random_color())
 
     def _load_colors(self):
         assert self._mode in {'color_easy', 'color_hard'}
@@ -136,6 +152,18 @@ class ColorWrapper(gym.Wrapper):
         assert len(self._colors) >= 100, 'env must include at least 100 colors'
         return self._colors[randint(len(self._colors))]
 
+    def apply_setting(self, setting_kwargs=None):
+        """Applies setting_kwargs on top of the default colors, see reload_physics"""
+        self._setting = setting_kwargs
+        if self._recompile:
+            self.reload_physics(setting_kwargs)
+        else:
+            domain_name = self._get_dmc_wrapper()._domain_name
+            model = self._get_physics().model
+            model.body_mass[:] = self._default_body_mass
+            model.opt.gravity[:] = self._default_gravity
+            common.settings.apply_setting_kwargs(self._get_physics(), domain_name + '.xml', setting_kwargs)
+
     def reload_physics(self, setting_kwargs=None, state=None):
         domain_name = self._get_dmc_wrapper()._domain_name
         if setting_kwargs is None:
@@ -164,10 +192,16 @@ class ColorWrapper(gym.Wrapper):
     def get_state(self):
         return self._get_state()
 
+    def get_setting(self):
+        return self._setting
+
     def set_state(self, state):
         self._set_state(state)
 
     def _get_dmc_wrapper(self):
+        return self._dmc_wrapper
+
+    def _find_dmc_wrapper(self):
         _env = self.env
         while not isinstance(_env, dmc2gym.wrappers.DMCWrapper) and hasattr(_env, 'env'):
             _env = _env.env
@@ -176,13 +210,12 @@ class ColorWrapper(gym.Wrapper):
         return _env
 
     def _reload_physics(self, xml_string, assets=None):
-        _env = self.env
-        while not hasattr(_env, '_physics') and hasattr(_env, 'env'):
-            _env = _env.env
-        assert hasattr(_env, '_physics'), 'environment does not have physics attribute'
-        _env.physics.reload_from_xml_string(xml_string, assets=assets)
+        self._get_physics().reload_from_xml_string(xml_string, assets=assets, cache=model_cache.get_default_cache())
 
     def _get_physics(self):
+        return self._dmc_physics
+
+    def _find_physics(self):
         _env = self.env
         while not hasattr(_env, '_physics') and hasattr(_env, 'env'):
             _env = _env.env
@@ -207,13 +240,19 @@ class ColorWrapper(gym.Wrapper):
 
 
 class FrameStack(gym.Wrapper):
-    """Stack frames as observation"""
+    """Stack frames as observation
+    Frames live in a preallocated circular array that holds every frame twice, so that the k latest
+    frames are always contiguous. New frames are rendered directly into their slot of that array.
+    With copy=False the observation is a view on that array, which is only valid until the next step
+    or reset; by default a single copy of it is returned."""
 
-    def __init__(self, env, k):
+    def __init__(self, env, k, copy=True):
         gym.Wrapper.__init__(self, env)
         self._k = k
-        self._frames = deque([], maxlen=k)
+        self._copy = copy
         shp = env.observation_space.shape
+        self._frames = np.empty((2 * k, *shp), dtype=env.observation_space.dtype)
+        self._head = 0  # index of the oldest frame of the stack
         self.observation_space = gym.spaces.Box(
             low=0,
             high=1,
@@ -223,20 +262,21 @@ class FrameStack(gym.Wrapper):
         self._max_episode_steps = env._max_episode_steps
 
     def reset(self):
-        obs = self.env.reset()
-        for _ in range(self._k):
-            self._frames.append(obs)
+        self.env.reset(out=self._frames[0])
+        self._frames[1:] = self._frames[0]
+        self._head = 0
         return self._get_obs()
 
     def step(self, action, rewards=None):
         # Make a step
-        obs, reward, done, info = self.env.step(action, rewards)
-        self._frames.append(obs)
+        obs, reward, done, info = self.env.step(action, rewards, out=self._frames[self._head])
+        self._frames[self._head + self._k] = obs
+        self._head = (self._head + 1) % self._k
         return self._get_obs(), reward, done, info
 
     def _get_obs(self):
-        assert len(self._frames) == self._k
-        return np.concatenate(list(self._frames), axis=0)
+        obs = self._frames[self._head:self._head + self._k].reshape(self.observation_space.shape)
+        return obs.copy() if self._copy else obs
 
 
 def rgb_to_hsv(r, g, b):
@@ -260,37 +300,126 @@ def rgb_to_hsv(r, g, b):
     return h, s, v
 
 
-def do_green_screen(x, bg):
-    """Removes green background from observation and replaces with bg; not optimized for speed"""
-    assert isinstance(x, np.ndarray) and isinstance(bg, np.ndarray), 'inputs must be numpy arrays'
-    assert x.dtype == np.uint8 and bg.dtype == np.uint8, 'inputs must be uint8 arrays'
+# HSV range (h in degrees, s and v in [0, 255]) of the green background that is replaced
+GREEN_SCREEN_HSV_MIN = (100, 80, 70)
+GREEN_SCREEN_HSV_MAX = (185, 255, 255)
 
-    # Get image sizes
-    x_h, x_w = x.shape[1:]
 
-    # Convert to RGBA images
-    im = TF.to_pil_image(torch.ByteTensor(x))
-    im = im.convert('RGBA')
-    pix = im.load()
-    bg = TF.to_pil_image(torch.ByteTensor(bg))
-    bg = bg.convert('RGBA')
-    bg = bg.load()
+def green_screen_mask(x):
+    """Vectorized HSV threshold of a (...,3,H,W) uint8 numpy array, True where the pixel is green screen
+    Uses the same float64 arithmetic as rgb_to_hsv so that the mask is bit-exact"""
+    rgb = x.astype(np.float64) / 255.
+    r, g, b = rgb[..., 0, :, :], rgb[..., 1, :, :], rgb[..., 2, :, :]
+    maxc = rgb.max(axis=-3)
+    minc = rgb.min(axis=-3)
+    delta = maxc - minc
+    grey = delta == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = np.where(grey, 0., delta / maxc)
+        rc = (maxc - r) / delta
+        gc = (maxc - g) / delta
+        bc = (maxc - b) / delta
+    h = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    h = np.where(grey, 0., (h / 6.0) % 1.0)
+    h, s, v = h * 360, s * 255, maxc * 255
 
-    # Replace pixels
-    for x in range(x_w):
-        for y in range(x_h):
-            r, g, b, a = pix[x, y]
-            h_ratio, s_ratio, v_ratio = rgb_to_hsv(r / 255., g / 255., b / 255.)
-            h, s, v = (h_ratio * 360, s_ratio * 255, v_ratio * 255)
+    (min_h, min_s, min_v), (max_h, max_s, max_v) = GREEN_SCREEN_HSV_MIN, GREEN_SCREEN_HSV_MAX
+    return (min_h <= h) & (h <= max_h) & (min_s <= s) & (s <= max_s) & (min_v <= v) & (v <= max_v)
 
-            min_h, min_s, min_v = (100, 80, 70)
-            max_h, max_s, max_v = (185, 255, 255)
-            if min_h <= h <= max_h and min_s <= s <= max_s and min_v <= v <= max_v:
-                pix[x, y] = bg[x, y]
 
-    x = np.moveaxis(np.array(im).astype(np.uint8), -1, 0)[:3]
+def do_green_screen(x, bg):
+    """Removes green background from observation and replaces with bg"""
+    assert isinstance(x, np.ndarray) and isinstance(bg, np.ndarray), 'inputs must be numpy arrays'
+    assert x.dtype == np.uint8 and bg.dtype == np.uint8, 'inputs must be uint8 arrays'
 
-    return x
+    mask = green_screen_mask(x)
+    return np.where(mask[..., None, :, :], bg, x)
+
+
+def green_screen_mask_torch(x):
+    """Batched torch version of green_screen_mask for (B,3,H,W) uint8 tensors, on any device"""
+    rgb = x.double() / 255.
+    r, g, b = rgb.unbind(dim=-3)
+    maxc = rgb.amax(dim=-3)
+    minc = rgb.amin(dim=-3)
+    delta = maxc - minc
+    grey = delta == 0
+    safe_delta = torch.where(grey, torch.ones_like(delta), delta)
+    safe_maxc = torch.where(grey, torch.ones_like(maxc), maxc)
+    s = torch.where(grey, torch.zeros_like(delta), delta / safe_maxc)
+    rc = (maxc - r) / safe_delta
+    gc = (maxc - g) / safe_delta
+    bc = (maxc - b) / safe_delta
+    h = torch.where(r == maxc, bc - gc, torch.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    h = torch.where(grey, torch.zeros_like(h), torch.remainder(h / 6.0, 1.0))
+    h, s, v = h * 360, s * 255, maxc * 255
+
+    (min_h, min_s, min_v), (max_h, max_s, max_v) = GREEN_SCREEN_HSV_MIN, GREEN_SCREEN_HSV_MAX
+    return (min_h <= h) & (h <= max_h) & (min_s <= s) & (s <= max_s) & (min_v <= v) & (v <= max_v)
+
+
+def do_green_screen_torch(x, bg):
+    """Batched torch version of do_green_screen for (B,3,H,W) uint8 tensors"""
+    assert x.dtype == torch.uint8 and bg.dtype == torch.uint8, 'inputs must be uint8 tensors'
+    mask = green_screen_mask_torch(x)
+    return torch.where(mask.unsqueeze(-3), bg, x)
+
+
+# Resized background videos, keyed by (video path, height, width), shared by all env instances of a process
+_BACKGROUNDS = {}
+
+
+def interpolate_bg(bg, size: tuple):
+    """Interpolate (N,3,H,W) or (3,H,W) uint8 background frames to size of observation"""
+    bg = torch.from_numpy(np.ascontiguousarray(bg)).float() / 255
+    squeeze = bg.dim() == 3
+    if squeeze:
+        bg = bg.unsqueeze(0)
+    bg = F.interpolate(bg, size=size, mode='bilinear', align_corners=False)
+    bg = (bg * 255).byte()
+    return (bg.squeeze(0) if squeeze else bg).numpy()
+
+
+def _load_resized_video(video, size: tuple, chunk_size=64):
+    """Decode video and resize its frames to size, returns (N,3,H,W) uint8 array
+    Frames are resized in chunks while decoding so the full resolution video is never held in memory"""
+    cap = cv2.VideoCapture(video)
+    assert cap.get(cv2.CAP_PROP_FRAME_WIDTH) >= 100, 'width must be at least 100 pixels'
+    assert cap.get(cv2.CAP_PROP_FRAME_HEIGHT) >= 100, 'height must be at least 100 pixels'
+    n = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    buf = np.empty((n, 3, *size), dtype=np.uint8)
+    i, chunk = 0, []
+    while i + len(chunk) < n:
+        ret, frame = cap.read()
+        if ret:
+            chunk.append(np.moveaxis(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), -1, 0))
+        if chunk and (not ret or len(chunk) == chunk_size or i + len(chunk) == n):
+            buf[i:i + len(chunk)] = interpolate_bg(np.stack(chunk), size)
+            i, chunk = i + len(chunk), []
+        if not ret:
+            break
+    cap.release()
+    return buf[:i]
+
+
+def load_backgrounds(video, size: tuple, cache_dir=None):
+    """Returns the frames of video resized to size as a read-only (N,3,H,W) uint8 array
+    Resized frames are computed once, saved as .npy under cache_dir and memory-mapped, so that
+    all env instances and worker processes share a single copy through the page cache"""
+    size = tuple(int(s) for s in size)
+    key = (os.path.abspath(video), *size)
+    if key not in _BACKGROUNDS:
+        cache_dir = cache_dir or os.path.join(os.path.dirname(video), 'cache')
+        name = os.path.splitext(os.path.basename(video))[0]
+        cache_path = os.path.join(cache_dir, f'{name}_{size[0]}x{size[1]}.npy')
+        if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < os.path.getmtime(video):
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write to a temporary file first, parallel workers may build the same cache
+            tmp_path = os.path.splitext(cache_path)[0] + f'.{os.getpid()}.tmp.npy'
+            np.save(tmp_path, _load_resized_video(video, size))
+            os.replace(tmp_path, cache_path)
+        _BACKGROUNDS[key] = np.load(cache_path, mmap_mode='r')
+    return _BACKGROUNDS[key]
 
 
 class GreenScreen(gym.Wrapper):
@@ -309,48 +438,36 @@ class GreenScreen(gym.Wrapper):
             if not self._video.endswith('.mp4'):
                 self._video += '.mp4'
             self._video = os.path.join('src/env/data', self._video)
-            self._data = self._load_video(self._video)
+            self._data = load_backgrounds(self._video, env.observation_space.shape[1:])
         else:
             self._video = None
         self._max_episode_steps = env._max_episode_steps
 
-    def _load_video(self, video):
-        """Load video from provided filepath and return as numpy array"""
-        cap = cv2.VideoCapture(video)
-        assert cap.get(cv2.CAP_PROP_FRAME_WIDTH) >= 100, 'width must be at least 100 pixels'
-        assert cap.get(cv2.CAP_PROP_FRAME_HEIGHT) >= 100, 'height must be at least 100 pixels'
-        n = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        buf = np.empty((n, int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3),
-                       np.dtype('uint8'))
-        i, ret = 0, True
-        while (i < n and ret):
-            ret, frame = cap.read()
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            buf[i] = frame
-            i += 1
-        cap.release()
-        return np.moveaxis(buf, -1, 1)
-
-    def reset(self):
+    def reset(self, out=None):
+        """Resets the env, with out the observation is written into that array"""
         self._current_frame = 0
-        return self._greenscreen(self.env.reset())
-
-    def step(self, action, rewards=None):
+        if out is not None:
+            self.env.set_obs_out(out)
+        return self._greenscreen(self.env.reset(), inplace=out is not None)
+
+    def step(self, action, rewards=None, out=None):
+        """Steps the env, with out the observation is written into that array"""
+        if out is not None:
+            self.env.set_obs_out(out)
         obs, reward, done, info = self.env.step(action)
         self._current_frame += 1
-        return self._greenscreen(obs), reward, done, info
-
-    def _interpolate_bg(self, bg, size: tuple):
-        """Interpolate background to size of observation"""
-        bg = torch.from_numpy(bg).float().unsqueeze(0) / 255
-        bg = F.interpolate(bg, size=size, mode='bilinear', align_corners=False)
-        return (bg * 255).byte().squeeze(0).numpy()
+        return self._greenscreen(obs, inplace=out is not None), reward, done, info
 
-    def _greenscreen(self, obs):
-        """Applies greenscreen if video or steady mode is selected, otherwise does nothing"""
+    def _greenscreen(self, obs, inplace=False):
+        """Applies greenscreen if video or steady mode is selected, otherwise does nothing
+        With inplace=True the background is written into obs"""
         if self._video:
-            bg = self._data[self._current_frame % len(self._data)]  # select frame
-            bg = self._interpolate_bg(bg, obs.shape[1:])  # scale bg to observation size
+            data = self._data if obs.shape[1:] == self._data.shape[2:] \
+                else load_backgrounds(self._video, obs.shape[1:])  # e.g. video recording resolution
+            bg = data[self._current_frame % len(data)]  # select pre-resized frame
+            if inplace:
+                np.copyto(obs, bg, where=green_screen_mask(obs)[None])
+                return obs
             return do_green_screen(obs, bg)  # apply greenscreen
         return obs
 
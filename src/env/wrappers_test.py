@@ -0,0 +1,40 @@
+"""Tests for the green screen compositing of wrappers.py."""
+from absl.testing import absltest
+import numpy as np
+import torch
+
+from env.wrappers import do_green_screen, do_green_screen_torch
+from references import do_green_screen_reference
+
+
+def _frames(size=64, seed=0):
+    """Random frame with a green screen half and a grey row, random background"""
+    rng = np.random.RandomState(seed)
+    x = rng.randint(0, 256, size=(3, size, size)).astype(np.uint8)
+    x[:, :size // 2] = np.array([51, 204, 51], dtype=np.uint8)[:, None, None]
+    x[:, -1] = rng.randint(0, 256, size=size).astype(np.uint8)
+    bg = rng.randint(0, 256, size=(3, size, size)).astype(np.uint8)
+    return x, bg
+
+
+class GreenScreenTest(absltest.TestCase):
+
+    def test_matches_reference(self):
+        for seed in range(3):
+            x, bg = _frames(seed=seed)
+            np.testing.assert_array_equal(do_green_screen(x, bg), do_green_screen_reference(x, bg))
+
+    def test_batched_matches_single_frame(self):
+        xs, bgs = zip(*[_frames(seed=seed) for seed in range(4)])
+        xs, bgs = np.stack(xs), np.stack(bgs)
+        np.testing.assert_array_equal(do_green_screen(xs, bgs), [do_green_screen(x, bg) for x, bg in zip(xs, bgs)])
+
+    def test_torch_matches_numpy(self):
+        xs, bgs = zip(*[_frames(seed=seed) for seed in range(4)])
+        xs, bgs = np.stack(xs), np.stack(bgs)
+        composited = do_green_screen_torch(torch.from_numpy(xs), torch.from_numpy(bgs))
+        np.testing.assert_array_equal(composited.numpy(), do_green_screen(xs, bgs))
+
+
+if __name__ == '__main__':
+    absltest.main()
@@ -2,30 +2,33 @@ import numpy as np
 import torch
 import os
 import pandas as pd
-from copy import deepcopy
 from tqdm import tqdm
 import utils
-from video import VideoRecorder
+from video import VideoRecorder, StateRecorder
 
 from arguments import parse_args
 from env.wrappers import make_pad_env
+from env.vec_env import DummyVecEnv, SubprocVecEnv
 from agent.agent import make_agent
-from utils import get_curl_pos_neg, AdaptRecorder
+from agent.batched_pad import BatchedPadAgent
+from utils import get_curl_pos_neg, AdaptRecorder, ColumnarRecorder
 
 
 def evaluate(env, agent, args, buffer=None, video=None, recorder=None, adapt=False, reload=False, exp_type=""):
     """Evaluate an agent, optionally adapt using PAD"""
     episode_rewards = []
+    snapshot = agent.snapshot()  # state updated by PAD, restored after every episode
 
     for i in tqdm(range(args.pad_num_episodes)):
-        ep_agent = deepcopy(agent)  # make a new copy
+        ep_agent = agent  # adapted in place
 
         if args.use_curl:  # initialize replay buffer for CURL
             replay_buffer = utils.ReplayBuffer(
                 obs_shape=env.observation_space.shape,
                 action_shape=env.action_space.shape,
                 capacity=args.train_steps,
-                batch_size=args.pad_batch_size
+                batch_size=args.pad_batch_size,
+                device=args.device
             )
             
         if video: video.init(enabled=True)
@@ -51,18 +54,24 @@ def evaluate(env, agent, args, buffer=None, video=None, recorder=None, adapt=Fal
                 if args.use_rot:  # rotation prediction
 
                     # Prepare batch of cropped observations
-                    batch_next_obs = utils.batch_from_obs(torch.Tensor(next_obs).cuda(), batch_size=args.pad_batch_size)
+                    batch_next_obs = utils.batch_from_obs(next_obs, batch_size=args.pad_batch_size, device=ep_agent.device)
                     batch_next_obs = utils.random_crop(batch_next_obs)
 
                     # Adapt using rotation prediction
                     losses.append(ep_agent.update_rot(batch_next_obs))
 
-                if args.use_inv:  # inverse dynamics model
+                if args.use_inv and args.pad_reuse_features and not buffer:  # inverse dynamics model
+
+                    # Adapt using inverse dynamics prediction, reusing the features of the previous next_obs
+                    losses.append(ep_agent.update_inv_step(obs, next_obs, action, batch_size=args.pad_batch_size,
+                                                           reuse_features=True))
+
+                elif args.use_inv:  # inverse dynamics model
 
                     # Prepare batch of observations
-                    batch_obs = utils.batch_from_obs(torch.Tensor(obs).cuda(), batch_size=args.pad_batch_size)
-                    batch_next_obs = utils.batch_from_obs(torch.Tensor(next_obs).cuda(), batch_size=args.pad_batch_size)
-                    batch_action = torch.Tensor(action).cuda().unsqueeze(0).repeat(args.pad_batch_size, 1)
+                    batch_obs = utils.batch_from_obs(obs, batch_size=args.pad_batch_size, device=ep_agent.device)
+                    batch_next_obs = utils.batch_from_obs(next_obs, batch_size=args.pad_batch_size, device=ep_agent.device)
+                    batch_action = torch.Tensor(action).to(ep_agent.device).unsqueeze(0).repeat(args.pad_batch_size, 1)
 
                     # Adapt using inverse dynamics prediction
                     if buffer:
@@ -94,8 +103,9 @@ def evaluate(env, agent, args, buffer=None, video=None, recorder=None, adapt=Fal
             step += 1
 
             if has_changed and reload:
-                ep_agent = deepcopy(agent)
+                ep_agent.restore(snapshot)
 
+        ep_agent.restore(snapshot)
         if video: video.save(f'{args.mode}_pad_{i}.mp4' if adapt else f'{args.mode}_eval_{i}.mp4')
         episode_rewards.append(episode_reward)
         if recorder: recorder.end_episode()
@@ -104,12 +114,89 @@ def evaluate(env, agent, args, buffer=None, video=None, recorder=None, adapt=Fal
     return np.mean(episode_rewards), np.std(episode_rewards)
 
 
-def init_env(args, mass=None):
-    utils.set_seed_everywhere(args.seed)
+def evaluate_batched(envs, agent, args, video=None, recorder=None, adapt=False, reload=False, exp_type=""):
+    """Evaluate an agent on envs.num_envs episodes stepped in lockstep, optionally adapt using PAD
+    Each episode adapts its own copy of the ss_encoder and inv weights, starting from the pre-trained ones as in evaluate.
+    The episodes are not those of evaluate: env j of make_vec_env runs the episodes of an env seeded args.seed + j,
+    while evaluate runs all episodes in one env seeded args.seed. Both sample episodes from the same distribution,
+    so the results are only statistically equivalent, as checked by eval_test.py."""
+    assert not (args.use_rot or args.use_curl), 'batched evaluation only supports the inverse dynamics model'
+    assert args.pad_num_episodes % envs.num_envs == 0, 'pad_num_episodes must be a multiple of the number of envs'
+    num_envs = envs.num_envs
+    batched_agent = BatchedPadAgent(agent, num_envs, batch_size=args.pad_batch_size)
+    video_env = envs.envs[0] if isinstance(envs, DummyVecEnv) else None
+    episode_rewards = []
+
+    for i in tqdm(range(args.pad_num_episodes // num_envs)):
+        batched_agent.reset()
+
+        if video: video.init(enabled=video_env is not None)
+        obs = envs.reset()
+        dones = np.zeros(num_envs, dtype=bool)
+        ep_rewards = np.zeros(num_envs)
+        rewards = [[] for _ in range(num_envs)]
+        changes = [[] for _ in range(num_envs)]
+        losses = []
+
+        while not dones.all():
+            # Take a step in every env that is still running
+            action = batched_agent.select_action(obs)
+            next_obs, reward, next_dones, info, change, has_changed = envs.step(action, rewards)
+            ep_rewards += reward
+            for j in np.flatnonzero(~dones):
+                changes[j].append(change[j])
+
+            # Make self-supervised update if flag is true
+            if adapt:
+                losses.append(batched_agent.update_inv(obs, next_obs, action))
+
+            if video: video.record(video_env, losses)
+            obs = next_obs
+            dones = next_dones
+
+            if reload:
+                for j in np.flatnonzero(has_changed):
+                    batched_agent.reset(j)
+
+        if video: video.save(f'{args.mode}_pad_{i}.mp4' if adapt else f'{args.mode}_eval_{i}.mp4')
+        episode_rewards.extend(ep_rewards)
+        if recorder:
+            for j in range(num_envs):
+                for change, reward in zip(changes[j], rewards[j]):
+                    recorder.update(change, reward)
+                recorder.end_episode()
+
+    if recorder: recorder.save("performance_"+ exp_type, adapt)
+    return np.mean(episode_rewards), np.std(episode_rewards)
+
+
+def make_vec_env(args):
+    """Make args.pad_num_envs environments with consecutive seeds, hosted in worker processes if requested
+    Env j starts as init_env(args, seed=args.seed + j) does."""
+    if args.subproc_envs:
+        env_kwargs = [dict(
+            domain_name=args.domain_name,
+            task_name=args.task_name,
+            seed=args.seed + j,
+            episode_length=args.episode_length,
+            action_repeat=args.action_repeat,
+            mode=args.mode,
+            dependent=args.dependent,
+            threshold=args.threshold,
+            window=args.window,
+            mass=args.cart_mass
+        ) for j in range(args.pad_num_envs)]
+        return SubprocVecEnv(env_kwargs, obs_shape=(3 * args.frame_stack, 100, 100))
+    return DummyVecEnv([init_env(args, seed=args.seed + j) for j in range(args.pad_num_envs)])
+
+
+def init_env(args, mass=None, seed=None):
+    seed = args.seed if seed is None else seed
+    utils.set_seed_everywhere(seed)
     return make_pad_env(
         domain_name=args.domain_name,
         task_name=args.task_name,
-        seed=args.seed,
+        seed=seed,
         episode_length=args.episode_length,
         action_repeat=args.action_repeat,
         mode=args.mode,
@@ -126,11 +213,14 @@ def main(args):
 
     model_dir = utils.make_dir(os.path.join(args.work_dir, 'model'))
     video_dir = utils.make_dir(os.path.join(args.work_dir, 'video'))
-    video = VideoRecorder(video_dir if args.save_video else None, height=448, width=448)
-    recorder = AdaptRecorder(args.work_dir, args.mode)
+    recorder_cls = StateRecorder if args.video_states else VideoRecorder
+    video = recorder_cls(video_dir if args.save_video else None, height=args.video_size, width=args.video_size,
+                         every=args.video_every)
+    results_cls = ColumnarRecorder if args.results_storage == 'columns' else AdaptRecorder
+    recorder = results_cls(args.work_dir, args.mode)
 
     # Prepare agent
-    assert torch.cuda.is_available(), 'must have cuda enabled'
+    utils.setup_device(args.device, args.num_threads)
     cropped_obs_shape = (3 * args.frame_stack, 84, 84)
     agent = make_agent(
         obs_shape=cropped_obs_shape,
@@ -140,18 +230,34 @@ def main(args):
     agent.load(model_dir, args.pad_checkpoint)
 
 
-    # Evaluate agent without PAD
-    print(f'Evaluating {args.work_dir} for {args.pad_num_episodes} episodes (mode: {args.mode})')
-    eval_reward, std = evaluate(env, agent, args, video, recorder)
-    print('eval reward:', int(eval_reward), ' +/- ', int(std))
+    # Run several episodes in lockstep if requested
+    if args.pad_num_envs > 1:
+        assert args.use_inv, 'batched evaluation requires the inverse dynamics model'
+        print(f'Evaluating {args.work_dir} for {args.pad_num_episodes} episodes (mode: {args.mode}) with {args.pad_num_envs} envs in parallel')
+        envs = make_vec_env(args)
+        eval_reward, std = evaluate_batched(envs, agent, args, video=video, recorder=recorder)
+        print('eval reward:', int(eval_reward), ' +/- ', int(std))
+        envs.close()
 
-    # Evaluate agent with PAD (if applicable)
-    pad_reward = None
-    if args.use_inv or args.use_curl or args.use_rot:
-        env = init_env(args)
-        print( f'Policy Adaptation during Deployment of {args.work_dir} for {args.pad_num_episodes} episodes (mode: {args.mode})')
-        pad_reward, std = evaluate(env, agent, args, video, recorder, adapt=True, exp_type="pad")
+        envs = make_vec_env(args)
+        print(f'Policy Adaptation during Deployment of {args.work_dir} for {args.pad_num_episodes} episodes (mode: {args.mode})')
+        pad_reward, std = evaluate_batched(envs, agent, args, video=video, recorder=recorder, adapt=True, exp_type="pad")
         print('pad reward:', int(pad_reward), ' +/- ', int(std))
+        envs.close()
+
+    else:
+        # Evaluate agent without PAD
+        print(f'Evaluating {args.work_dir} for {args.pad_num_episodes} episodes (mode: {args.mode})')
+        eval_reward, std = evaluate(env, agent, args, video, recorder)
+        print('eval reward:', int(eval_reward), ' +/- ', int(std))
+
+        # Evaluate agent with PAD (if applicable)
+        pad_reward = None
+        if args.use_inv or args.use_curl or args.use_rot:
+            env = init_env(args)
+            print( f'Policy Adaptation during Deployment of {args.work_dir} for {args.pad_num_episodes} episodes (mode: {args.mode})')
+            pad_reward, std = evaluate(env, agent, args, video, recorder, adapt=True, exp_type="pad")
+            print('pad reward:', int(pad_reward), ' +/- ', int(std))
 
         # env = init_env(args)
         # print(
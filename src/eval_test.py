@@ -0,0 +1,61 @@
+"""Tests for the batched evaluation of eval.py, which is statistically equivalent to the sequential one."""
+import tempfile
+
+from absl.testing import absltest
+from absl.testing import parameterized
+import numpy as np
+
+import utils
+from arguments import parse_args
+from agent.agent import make_agent
+from eval import evaluate, evaluate_batched, init_env, make_vec_env
+
+
+def _args(*flags):
+    return parse_args(['--seed', '0', '--work_dir', tempfile.mkdtemp(), '--use_inv',
+                       '--domain_name', 'cartpole', '--task_name', 'swingup', '--action_repeat', '8',
+                       '--hidden_dim', '64', '--pad_num_envs', '4', '--pad_num_episodes', '8'] + list(flags))
+
+
+class BatchedEvaluationTest(parameterized.TestCase):
+
+    @parameterized.parameters(False, True)
+    def test_env_starts_as_sequential_env(self, subproc_envs):
+        args = _args(*(['--subproc_envs'] if subproc_envs else []))
+        envs = make_vec_env(args)
+        obs = np.array(envs.reset())
+        actions = np.random.RandomState(0).uniform(-1, 1, size=(10, args.pad_num_envs, *envs.action_space.shape))
+        batched = [envs.step(action, [[] for _ in range(envs.num_envs)])[:2] for action in actions]
+        batched = [(np.array(next_obs), reward) for next_obs, reward in batched]
+        envs.close()
+
+        # every env runs its own episodes, not those of the first env
+        for j in range(1, args.pad_num_envs):
+            self.assertFalse(np.array_equal(obs[0], obs[j]))
+
+        for j in range(args.pad_num_envs):
+            env = init_env(args, seed=args.seed + j)
+            np.testing.assert_array_equal(env.reset(), obs[j])
+            for action, (next_obs, reward) in zip(actions, batched):
+                env_next_obs, env_reward = env.step(action[j], [])[:2]
+                np.testing.assert_array_equal(env_next_obs, next_obs[j])
+                self.assertEqual(env_reward, reward[j])
+
+    @parameterized.parameters(False, True)
+    def test_rewards_match_sequential_evaluation(self, adapt):
+        args = _args()
+        utils.set_seed_everywhere(args.seed)
+        agent = make_agent(obs_shape=(3 * args.frame_stack, 84, 84), action_shape=(1,), args=args)
+
+        mean, std = evaluate(init_env(args), agent, args, adapt=adapt)
+        envs = make_vec_env(args)
+        batched_mean, batched_std = evaluate_batched(envs, agent, args, adapt=adapt)
+        envs.close()
+
+        # the episodes differ, their mean rewards agree within the standard error of the difference
+        stderr = np.sqrt((std ** 2 + batched_std ** 2) / args.pad_num_episodes)
+        self.assertLess(abs(mean - batched_mean), 4 * stderr + 1e-6)
+
+
+if __name__ == '__main__':
+    absltest.main()
@@ -60,9 +60,9 @@ def evaluate_agent(agent, env, args, exp_type="", buffer=None, step=None, adapt=
 
             # Adaptation
             if adapt:
-                batch_obs = utils.batch_from_obs(torch.Tensor(obs).cuda(), batch_size=args.pad_batch_size)
-                batch_next_obs = utils.batch_from_obs(torch.Tensor(next_obs).cuda(), batch_size=args.pad_batch_size)
-                batch_action = torch.Tensor(action).cuda().unsqueeze(0).repeat(args.pad_batch_size, 1)
+                batch_obs = utils.batch_from_obs(obs, batch_size=args.pad_batch_size, device=ep_agent.device)
+                batch_next_obs = utils.batch_from_obs(next_obs, batch_size=args.pad_batch_size, device=ep_agent.device)
+                batch_action = torch.Tensor(action).to(ep_agent.device).unsqueeze(0).repeat(args.pad_batch_size, 1)
 
                 # Adapt using inverse dynamics prediction
                 losses.append(ep_agent.update_inv(utils.random_crop(batch_obs), utils.random_crop(batch_next_obs),
@@ -102,7 +102,8 @@ def collect_trajectory(RL_reference, env, args):
         obs_shape=env.observation_space.shape,
         action_shape=env.action_space.shape,
         capacity=10000,
-        batch_size=args.batch_size
+        batch_size=args.batch_size,
+        device=args.device
     )
     _, obses, actions = evaluate_agent(RL_reference, env, args)
     buffer.add_path(obses, actions)
@@ -123,7 +124,8 @@ def collect_expert_samples(agent, env, args, label): # OK
         action_shape=env.action_space.shape,
         capacity=args.train_steps,
         batch_size=args.batch_size,
-        label=label
+        label=label,
+        device=args.device
     )
 
     ep_rewards, obses, actions = evaluate_agent(agent, env, args)
@@ -147,7 +149,7 @@ def load_agent(label, action_shape, args): # OK
     print(f'Load agent from {work_dir}')
 
     # Prepare agent
-    assert torch.cuda.is_available(), 'must have cuda enabled'
+    utils.setup_device(args.device, args.num_threads)
     cropped_obs_shape = (3 * args.frame_stack, 84, 84)
     agent = make_agent(
         obs_shape=cropped_obs_shape,
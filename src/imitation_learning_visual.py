@@ -93,7 +93,8 @@ def collect_trajectory(RL_reference, env, args):
         obs_shape=env.observation_space.shape,
         action_shape=env.action_space.shape,
         capacity=10000,
-        batch_size=args.batch_size
+        batch_size=args.batch_size,
+        device=args.device
     )
     _, obses, actions = evaluate_agent(RL_reference, env, args)
     buffer.add_path(obses, actions)
@@ -114,7 +115,8 @@ def collect_expert_samples(agent, env, args, label): # OK
         action_shape=env.action_space.shape,
         capacity=args.train_steps,
         batch_size=args.batch_size,
-        label=label
+        label=label,
+        device=args.device
     )
 
     ep_rewards, obses, actions = evaluate_agent(agent, env, args)
@@ -138,7 +140,7 @@ def load_agent(label, action_shape, args): # OK
     print(f'Load agent from {work_dir}')
 
     # Prepare agent
-    assert torch.cuda.is_available(), 'must have cuda enabled'
+    utils.setup_device(args.device, args.num_threads)
     cropped_obs_shape = (3 * args.frame_stack, 84, 84)
     agent = make_agent(
         obs_shape=cropped_obs_shape,
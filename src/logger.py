@@ -1,8 +1,12 @@
 from torch.utils.tensorboard import SummaryWriter
 from collections import defaultdict
+import atexit
 import json
 import os
+import queue
 import shutil
+import threading
+import traceback
 import torch
 import torchvision
 import numpy as np
@@ -30,7 +34,48 @@ FORMAT_CONFIG = {
     
 }
 
+def _to_numbers(data):
+    """Returns data with its tensor values replaced by python numbers, with a single device to host copy"""
+    keys = [k for k, v in data.items() if isinstance(v, torch.Tensor)]
+    if not keys:
+        return data
+    device = data[keys[0]].device
+    values = torch.stack([data[k].detach().to(device, torch.float64).reshape(()) for k in keys]).cpu().tolist()
+    data = dict(data)
+    data.update(zip(keys, values))
+    return data
+
+
+class BackgroundWriter(object):
+    """Runs write jobs in order in a background thread"""
+
+    def __init__(self):
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            fn, args = self._jobs.get()
+            try:
+                fn(*args)
+            except Exception:
+                # a failed write must not stop the writes that follow
+                traceback.print_exc()
+            finally:
+                self._jobs.task_done()
+
+    def submit(self, fn, *args):
+        self._jobs.put((fn, args))
+
+    def flush(self):
+        """Waits for all submitted jobs"""
+        self._jobs.join()
+
+
 class AverageMeter(object):
+    """Average of values, tensors are summed on their device"""
+
     def __init__(self):
         self._sum = 0
         self._count = 0
@@ -44,8 +89,9 @@ class AverageMeter(object):
 
 
 class MetersGroup(object):
-    def __init__(self, file_name, formating):
+    def __init__(self, file_name, formating, writer=None):
         self._file_name = file_name
+        self._writer = writer
         if os.path.exists(file_name):
             os.remove(file_name)
         self._formating = formating
@@ -89,19 +135,35 @@ class MetersGroup(object):
             pieces.append(self._format(disp_key, value, ty))
         print('| %s' % (' | '.join(pieces)))
 
+    def _dump(self, data, prefix):
+        data = _to_numbers(data)
+        self._dump_to_file(data)
+        self._dump_to_console(data, prefix)
+
     def dump(self, step, prefix):
         if len(self._meters) == 0:
             return
         data = self._prime_meters()
         data['step'] = step
-        self._dump_to_file(data)
-        self._dump_to_console(data, prefix)
+        if self._writer is not None:
+            self._writer.submit(self._dump, data, prefix)
+        else:
+            self._dump(data, prefix)
         self._meters.clear()
 
 
 class Logger(object):
-    def __init__(self, log_dir, use_tb=True, config='rl'):
+    """Logs metrics to TensorBoard, json files and the console
+    Tensors are accumulated on their device and only copied to the host at dump, in a background thread
+    that also does all writes, so that logging never synchronizes the update loop. Tensor values, such as
+    the losses of the update loop, are only logged on steps that are multiples of log_interval."""
+
+    def __init__(self, log_dir, use_tb=True, config='rl', log_interval=1):
         self._log_dir = log_dir
+        self._log_interval = log_interval
+        self._writer = BackgroundWriter()
+        self._sw_scalars = []  # (key, value, step) written to tensorboard at dump
+        atexit.register(self.close)
         if use_tb:
             tb_dir = os.path.join(log_dir, 'tb')
             if os.path.exists(tb_dir):
@@ -111,16 +173,23 @@ class Logger(object):
             self._sw = None
         self._train_mg = MetersGroup(
             os.path.join(log_dir, 'train.log'),
-            formating=FORMAT_CONFIG[config]['train']
+            formating=FORMAT_CONFIG[config]['train'],
+            writer=self._writer
         )
         self._eval_mg = MetersGroup(
             os.path.join(log_dir, 'eval.log'),
-            formating=FORMAT_CONFIG[config]['eval']
+            formating=FORMAT_CONFIG[config]['eval'],
+            writer=self._writer
         )
 
     def _try_sw_log(self, key, value, step):
         if self._sw is not None:
-            self._sw.add_scalar(key, value, step)
+            self._sw_scalars.append((key, value, step))
+
+    def _write_sw_scalars(self, scalars):
+        values = _to_numbers({i: value for i, (_, value, _) in enumerate(scalars)})
+        for i, (key, _, step) in enumerate(scalars):
+            self._sw.add_scalar(key, values[i], step)
 
     def _try_sw_log_image(self, key, image, step):
         if self._sw is not None:
@@ -141,7 +210,9 @@ class Logger(object):
     def log(self, key, value, step, n=1):
         assert key.startswith('train') or key.startswith('eval')
         if type(value) == torch.Tensor:
-            value = value.item()
+            if step % self._log_interval:
+                return
+            value = value.detach()
         self._try_sw_log(key, value / n, step)
         mg = self._train_mg if key.startswith('train') else self._eval_mg
         mg.log(key, value, n)
@@ -168,5 +239,19 @@ class Logger(object):
         self._try_sw_log_histogram(key, histogram, step)
 
     def dump(self, step):
+        if self._sw_scalars:
+            self._writer.submit(self._write_sw_scalars, self._sw_scalars)
+            self._sw_scalars = []
         self._train_mg.dump(step, 'train')
         self._eval_mg.dump(step, 'eval')
+
+    def flush(self):
+        """Waits for all dumped metrics to be written"""
+        self._writer.flush()
+        if self._sw is not None:
+            self._sw.flush()
+
+    def close(self):
+        self.flush()
+        if self._sw is not None:
+            self._sw.close()
@@ -0,0 +1,55 @@
+"""Straightforward implementations of optimized functions, checked against by the tests and timed by benchmark.py"""
+import numpy as np
+import torch
+import torchvision.transforms.functional as TF
+
+from utils import _rotate_single_with_label
+
+
+def do_green_screen_reference(x, bg):
+    """Per-pixel reference implementation of do_green_screen, not optimized for speed"""
+    from env.wrappers import rgb_to_hsv
+
+    # Get image sizes
+    x_h, x_w = x.shape[1:]
+
+    # Convert to RGBA images
+    im = TF.to_pil_image(torch.ByteTensor(x))
+    im = im.convert('RGBA')
+    pix = im.load()
+    bg = TF.to_pil_image(torch.ByteTensor(bg))
+    bg = bg.convert('RGBA')
+    bg = bg.load()
+
+    # Replace pixels
+    for x in range(x_w):
+        for y in range(x_h):
+            r, g, b, a = pix[x, y]
+            h_ratio, s_ratio, v_ratio = rgb_to_hsv(r / 255., g / 255., b / 255.)
+            h, s, v = (h_ratio * 360, s_ratio * 255, v_ratio * 255)
+
+            min_h, min_s, min_v = (100, 80, 70)
+            max_h, max_s, max_v = (185, 255, 255)
+            if min_h <= h <= max_h and min_s <= s <= max_s and min_v <= v <= max_v:
+                pix[x, y] = bg[x, y]
+
+    return np.moveaxis(np.array(im).astype(np.uint8), -1, 0)[:3]
+
+
+def soft_update_params_reference(net, target_net, tau):
+    """Per-parameter reference implementation of soft_update_params"""
+    for param, target_param in zip(net.parameters(), target_net.parameters()):
+        target_param.data.copy_(
+            tau * param.data + (1 - tau) * target_param.data
+        )
+
+
+def rotate_reference(x):
+    """Randomly rotate a batch of images and return labels, one image at a time"""
+    images = []
+    labels = torch.randint(4, (x.size(0),), dtype=torch.long).to(x.device)
+    for img, label in zip(x, labels):
+        img = _rotate_single_with_label(img, label)
+        images.append(img.unsqueeze(0))
+
+    return torch.cat(images), labels
@@ -0,0 +1,62 @@
+import argparse
+import glob
+import json
+import multiprocessing as mp
+import os
+import imageio
+import numpy as np
+
+from env.wrappers import make_pad_env
+
+
+def render_video(path, size=None, camera_id=None):
+    """Renders the video of physics states recorded by StateRecorder next to it, returns its path"""
+    data = np.load(path)
+    meta = json.loads(str(data['meta']))
+    height, width = (size, size) if size else (meta['height'], meta['width'])
+    camera_id = meta['camera_id'] if camera_id is None else camera_id
+
+    env = make_pad_env(domain_name=meta['domain_name'], task_name=meta['task_name'], mode=meta['mode'])
+    env.reset()  # loads the mode, colors are then set to the recorded ones
+    if meta['setting'] is not None:
+        env.apply_setting({k: np.array(v) for k, v in meta['setting'].items()})
+    physics = env._get_physics()
+    greenscreen = env.env.env
+
+    video_path = os.path.splitext(path)[0] + '.mp4'
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    with imageio.get_writer(video_path, fps=meta['fps']) as writer:
+        for state, frame_idx in zip(data['states'], data['frame_idxs']):
+            with physics.reset_context():
+                physics.set_state(state)
+            env.render(mode='rgb_array', height=height, width=width, camera_id=camera_id, out=frame)
+            if 'video' in meta['mode']:
+                greenscreen._current_frame = frame_idx
+                np.copyto(frame, greenscreen.apply_to(frame))
+            writer.append_data(frame)
+    return video_path
+
+
+def _render_video(kwargs):
+    return render_video(**kwargs)
+
+
+def main(args):
+    paths = sorted(p for pattern in args.paths for p in
+                   (glob.glob(os.path.join(pattern, '*.npz')) if os.path.isdir(pattern) else glob.glob(pattern)))
+    jobs = [dict(path=path, size=args.size, camera_id=args.camera_id) for path in paths]
+    print(f'Rendering {len(jobs)} videos with {args.workers} workers')
+    # Rendering contexts must not be inherited by forked workers
+    with mp.get_context('spawn').Pool(args.workers) as pool:
+        for video_path in pool.imap_unordered(_render_video, jobs):
+            print('Saved', video_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render videos from the physics states recorded with --video_states')
+    parser.add_argument('paths', nargs='+')  # .npz files or directories holding them
+    parser.add_argument('--size', default=None, type=int)  # defaults to the recorded resolution
+    parser.add_argument('--camera_id', default=None, type=int)
+    parser.add_argument('--workers', default=os.cpu_count(), type=int)
+    args = parser.parse_args()
+    main(args)
@@ -1,13 +1,15 @@
 import torch
 import os
+import numpy as np
 
 from arguments import parse_args
 from env.wrappers import make_pad_env
+from env.vec_env import DummyVecEnv, SubprocVecEnv
 from agent.agent import make_agent
 import utils
 import time
 from logger import Logger
-from video import VideoRecorder
+from video import VideoRecorder, StateRecorder
 
 
 def evaluate(env, agent, video, num_episodes, L, step):
@@ -31,6 +33,102 @@ def evaluate(env, agent, video, num_episodes, L, step):
 	L.dump(step)
 
 
+def make_collection_envs(args):
+	"""Make args.num_envs training environments with consecutive seeds, hosted in worker processes if requested"""
+	env_kwargs = [dict(
+		domain_name=args.domain_name,
+		task_name=args.task_name,
+		seed=args.seed + j,
+		episode_length=args.episode_length,
+		action_repeat=args.action_repeat,
+		mode=args.mode,
+		force=args.force_walker
+	) for j in range(args.num_envs)]
+	if args.subproc_envs:
+		return SubprocVecEnv(env_kwargs, obs_shape=(3*args.frame_stack, 100, 100))
+	return DummyVecEnv([make_pad_env(**kwargs) for kwargs in env_kwargs])
+
+
+def train_vec(args, envs, env, agent, replay_buffer, L, video, model_dir, buffer_dir):
+	"""Collects training data from envs.num_envs environments stepped in lockstep, env is used for evaluation
+	step counts the transitions of all envs and one update is run per transition, as in the single env loop.
+	Frame replay storage expects the transitions of an episode to be added in a row, so it receives those of
+	each env once its episode has ended; other storages receive them as they are collected. Updates start at
+	init_steps, or once the first transitions have been added if they are still held back at that step."""
+	num_envs = envs.num_envs
+	defer = args.replay_storage == 'frames'
+	episode, step, updating = 0, 0, False
+	next_eval, next_save = 0, args.save_freq
+	start_time = time.time()
+	while step <= args.train_steps:
+		# Evaluate and save agent periodically
+		if step >= next_eval:
+			print('Evaluating:', args.work_dir)
+			L.log('eval/episode', episode, step)
+			evaluate(env, agent, video, args.eval_episodes, L, step)
+			next_eval += args.eval_freq
+		if step >= next_save:
+			if args.save_model:
+				agent.save(model_dir, step + args.pad_checkpoint if args.pad_checkpoint is not None else step)
+			if args.save_buffer:
+				replay_buffer.save(buffer_dir)
+			next_save += args.save_freq
+
+		obs = envs.reset()
+		dones = np.zeros(num_envs, dtype=bool)
+		episode_rewards = np.zeros(num_envs)
+		rewards = [[] for _ in range(num_envs)]
+		first_obs = [obs[j].copy() for j in range(num_envs)] if defer else None
+		transitions = [[] for _ in range(num_envs)]
+		episode_step = 0
+		episode += num_envs
+		L.log('train/episode', episode, step)
+
+		while not dones.all():
+			active = np.flatnonzero(~dones)
+
+			# Sample actions for data collection
+			if step < args.init_steps:
+				actions = np.stack([envs.action_space.sample() for _ in range(num_envs)])
+			else:
+				with utils.eval_mode(agent):
+					actions = agent.sample_actions(obs)
+
+			# Run training updates, one per collected transition, once the buffer has received transitions
+			for k in range(step, step + len(active)):
+				if k >= args.init_steps and (replay_buffer.full or replay_buffer.idx > 0):
+					num_updates = 1 if updating else args.init_steps
+					updating = True
+					for _ in range(num_updates):
+						agent.update(replay_buffer, L, k)
+
+			# Take step
+			next_obs, reward, dones, _, _, _ = envs.step(actions, rewards)
+			for j in active:
+				done_bool = 0 if episode_step + 1 == envs._max_episode_steps else float(dones[j])
+				if defer:
+					transitions[j].append((actions[j], reward[j], next_obs[j].copy(), done_bool))
+				else:
+					replay_buffer.add(obs[j], actions[j], reward[j], next_obs[j], done_bool, first=episode_step == 0)
+				episode_rewards[j] += reward[j]
+			obs = next_obs
+			step += len(active)
+			episode_step += 1
+
+		if defer:
+			for j in range(num_envs):
+				env_obs = first_obs[j]
+				for t, (action, reward, env_next_obs, done_bool) in enumerate(transitions[j]):
+					replay_buffer.add(env_obs, action, reward, env_next_obs, done_bool, first=t == 0)
+					env_obs = env_next_obs
+
+		for episode_reward in episode_rewards:
+			L.log('train/episode_reward', episode_reward, step)
+		L.log('train/duration', time.time() - start_time, step)
+		start_time = time.time()
+		L.dump(step)
+
+
 def main(args):
 	# Initialize environment
 	utils.set_seed_everywhere(args.seed)
@@ -48,16 +146,32 @@ def main(args):
 	utils.make_dir(args.work_dir)
 	model_dir = utils.make_dir(os.path.join(args.work_dir, 'model'))
 	video_dir = utils.make_dir(os.path.join(args.work_dir, 'video'))
-	video = VideoRecorder(video_dir if args.save_video else None)
+	buffer_dir = os.path.join(args.work_dir, 'buffer')
+	recorder_cls = StateRecorder if args.video_states else VideoRecorder
+	video = recorder_cls(video_dir if args.save_video else None, every=args.video_every)
 
 	# Prepare agent
-	assert torch.cuda.is_available(), 'must have cuda enabled'
-	replay_buffer = utils.ReplayBuffer(
-		obs_shape=env.observation_space.shape,
-		action_shape=env.action_space.shape,
-		capacity=args.train_steps,
-		batch_size=args.batch_size
-	)
+	utils.setup_device(args.device, args.num_threads)
+	if args.replay_storage == 'frames':
+		replay_buffer = utils.FrameReplayBuffer(
+			obs_shape=env.observation_space.shape,
+			action_shape=env.action_space.shape,
+			capacity=args.train_steps,
+			batch_size=args.batch_size,
+			frame_stack=args.frame_stack,
+			mmap_dir=os.path.join(args.work_dir, 'buffer_mmap') if args.replay_mmap else None,
+			device=args.device
+		)
+	else:
+		replay_buffer = utils.ReplayBuffer(
+			obs_shape=env.observation_space.shape,
+			action_shape=env.action_space.shape,
+			capacity=args.train_steps,
+			batch_size=args.batch_size,
+			device=args.device
+		)
+	if args.prefetch_batches > 0:
+		replay_buffer = utils.PrefetchSampler(replay_buffer, num_batches=args.prefetch_batches, seed=args.seed)
 	cropped_obs_shape = (3*args.frame_stack, 84, 84)
 	agent = make_agent(
 		obs_shape=cropped_obs_shape,
@@ -67,8 +181,20 @@ def main(args):
 
 	if args.pad_checkpoint is not None :
 		agent.load(model_dir, args.pad_checkpoint) # To keep on training...
+		if args.save_buffer and replay_buffer.can_load(buffer_dir):
+			replay_buffer.load(buffer_dir)
+			print('Resuming with replay buffer of size', replay_buffer.capacity if replay_buffer.full else replay_buffer.idx)
+
+	L = Logger(args.work_dir, use_tb=True, log_interval=args.log_interval)
+	if args.num_envs > 1:
+		envs = make_collection_envs(args)
+		train_vec(args, envs, env, agent, replay_buffer, L, video, model_dir, buffer_dir)
+		envs.close()
+		if args.prefetch_batches > 0:
+			replay_buffer.close()
+		L.close()
+		return
 
-	L = Logger(args.work_dir, use_tb=True)
 	episode, episode_reward, done = 0, 0, True
 	rewards = []
 	start_time = time.time()
@@ -89,6 +215,8 @@ def main(args):
 			if step % args.save_freq == 0 and step > 0:
 				if args.save_model:
 					agent.save(model_dir, step + args.pad_checkpoint if args.pad_checkpoint is not None else step)
+				if args.save_buffer:
+					replay_buffer.save(buffer_dir)
 
 			L.log('train/episode_reward', episode_reward, step)
 
@@ -117,12 +245,16 @@ def main(args):
 		# Take step
 		next_obs, reward, done, _, _, _ = env.step(action, rewards)
 		done_bool = 0 if episode_step + 1 == env._max_episode_steps else float(done)
-		replay_buffer.add(obs, action, reward, next_obs, done_bool)
+		replay_buffer.add(obs, action, reward, next_obs, done_bool, first=episode_step == 0)
 		episode_reward += reward
 		obs = next_obs
 
 		episode_step += 1
 
+	if args.prefetch_batches > 0:
+		replay_buffer.close()
+	L.close()
+
 
 if __name__ == '__main__':
 	args = parse_args()
@@ -0,0 +1,35 @@
+"""Tests for the environments that collect training data in train.py."""
+import tempfile
+
+from absl.testing import absltest
+from absl.testing import parameterized
+import numpy as np
+
+from arguments import parse_args
+from env.wrappers import make_pad_env
+from train import make_collection_envs
+
+
+class CollectionEnvsTest(parameterized.TestCase):
+
+    @parameterized.parameters(False, True)
+    def test_envs_have_consecutive_seeds(self, subproc_envs):
+        args = parse_args(['--seed', '0', '--work_dir', tempfile.mkdtemp(), '--num_envs', '3',
+                           '--domain_name', 'cartpole', '--task_name', 'swingup', '--action_repeat', '8']
+                          + (['--subproc_envs'] if subproc_envs else []))
+        envs = make_collection_envs(args)
+        obs = np.array(envs.reset())
+        envs.close()
+
+        # every env collects its own episodes, not those of the first env
+        for j in range(args.num_envs):
+            env = make_pad_env(domain_name=args.domain_name, task_name=args.task_name, seed=args.seed + j,
+                               episode_length=args.episode_length, action_repeat=args.action_repeat,
+                               mode=args.mode, force=args.force_walker)
+            np.testing.assert_array_equal(env.reset(), obs[j])
+            if j > 0:
+                self.assertFalse(np.array_equal(obs[0], obs[j]))
+
+
+if __name__ == '__main__':
+    absltest.main()
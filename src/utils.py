@@ -3,7 +3,12 @@ import torch
 import numpy as np
 from scipy.ndimage import convolve1d
 import cv2
+import glob
 import os
+import json
+import queue
+import threading
+from collections import deque
 from datetime import datetime
 import random
 
@@ -90,6 +95,116 @@ class AdaptRecorder(Recorder):
         self.changes_tot, self.rewards_tot, self.actions_tot = [], [], []
 
 
+class ColumnarRecorder(Recorder):
+    """Drop-in replacement of AdaptRecorder that appends every episode to fixed-dtype column files as it ends
+    Each column (reward, change and optionally action) is a raw binary file of all steps of all episodes, and
+    meta.json holds their dtypes and the episode lengths, rewritten after each episode so that an interrupted
+    run keeps its finished episodes. Episodes are written to a hidden directory, renamed at save like the csv
+    of AdaptRecorder. Load the results with load_results."""
+
+    def __init__(self, save_dir, type, action=False):
+        super().__init__(save_dir, type)
+        self._action = action
+        self._path = None
+        self._meta = None
+        self._num_runs = 0
+        self.reset()
+
+    def reset(self):
+        self.changes, self.rewards, self.actions = [], [], []
+
+    def update(self, change, reward, action=None):
+        self.changes.append(change)
+        self.rewards.append(reward)
+        if self._action:
+            self.actions.append(action)
+
+    def _start(self):
+        self._num_runs += 1
+        self._path = os.path.join(self._save_dir, f'.recording_{os.getpid()}_{id(self)}_{self._num_runs}')
+        os.makedirs(self._path)
+        self._meta = dict(type=self._type, columns={}, episode_lengths=[])
+
+    def end_episode(self):
+        if self._path is None:
+            self._start()
+        columns = dict(reward=np.asarray(self.rewards, dtype=np.float64),
+                       change=np.asarray(self.changes, dtype=np.float64))
+        if self._action:
+            columns['action'] = np.asarray(self.actions, dtype=np.float32)
+        for name, values in columns.items():
+            self._meta['columns'].setdefault(name, dict(dtype=values.dtype.str, shape=list(values.shape[1:])))
+            with open(os.path.join(self._path, name + '.bin'), 'ab') as f:
+                values.tofile(f)
+        self._meta['episode_lengths'].append(len(self.rewards))
+        tmp_path = os.path.join(self._path, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self._meta, f)
+        os.replace(tmp_path, os.path.join(self._path, 'meta.json'))
+        self.reset()
+
+    def save(self, file_name, adapt):
+        if self._path is None:
+            return
+        file_name += datetime.now().strftime("%H-%M-%S")
+        file_name += self._type
+        file_name += "_pad" if adapt else "_eval"
+        os.replace(self._path, os.path.join(self._save_dir, file_name))
+        self._path, self._meta = None, None
+
+
+class Results(object):
+    """Results saved by ColumnarRecorder, columns are memory-mapped and concatenate the steps of all episodes"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.type = meta['type']
+        self.episode_lengths = np.array(meta['episode_lengths'], dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(self.episode_lengths)))
+        num_steps = int(self.offsets[-1])
+        self.columns = {}
+        for name, column in meta['columns'].items():
+            # steps written after the last meta.json update are left out
+            self.columns[name] = np.memmap(os.path.join(path, name + '.bin'), dtype=np.dtype(column['dtype']),
+                                           mode='r', shape=(num_steps, *column['shape'])) if num_steps else \
+                np.empty((0, *column['shape']), dtype=np.dtype(column['dtype']))
+
+    def __len__(self):
+        return len(self.episode_lengths)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def episode(self, i, name='reward'):
+        return self.columns[name][self.offsets[i]:self.offsets[i + 1]]
+
+    def episode_rewards(self):
+        """Returns the total reward of every episode"""
+        if not len(self):
+            return np.zeros(0)
+        return np.add.reduceat(np.asarray(self.columns['reward']), self.offsets[:-1])
+
+    def to_frame(self):
+        """Returns the results as the DataFrame saved to csv by AdaptRecorder"""
+        def frame(name, suffix):
+            return pd.DataFrame({f'episode_{i}_{suffix}': pd.Series(list(self.episode(i, name)))
+                                 for i in range(len(self))})
+
+        df_tot = frame('reward', 'reward')
+        if 'action' in self.columns:
+            df_tot = df_tot.join(frame('action', 'action'))
+        return df_tot.join(frame('change', self.type))
+
+
+def load_results(*patterns):
+    """Returns the Results saved by ColumnarRecorder in the directories matching the glob patterns, by path"""
+    paths = sorted({p for pattern in patterns for p in glob.glob(pattern)
+                    if os.path.exists(os.path.join(p, 'meta.json'))})
+    return {path: Results(path) for path in paths}
+
+
 def moving_average_reward(rewards, current_ep=None, wind_lgth=15):
     # Causal convolutional filter
     w = np.concatenate((np.zeros(wind_lgth + 1), np.ones(wind_lgth))).astype(np.float64) / (wind_lgth)
@@ -100,11 +215,95 @@ def moving_average_reward(rewards, current_ep=None, wind_lgth=15):
         assert current_ep >= 0
         return avg[current_ep]
 
+
+class MovingAverageReward(object):
+    """Streaming version of moving_average_reward, updated in O(1) per reward
+    After update(rewards[i]), mean equals moving_average_reward(rewards, current_ep=i): the average of the
+    wind_lgth rewards preceding reward i, the first reward standing in for rewards before the episode.
+    std, min and max are statistics of the same window."""
+
+    def __init__(self, wind_lgth=15):
+        self.wind_lgth = wind_lgth
+        self.reset()
+
+    def reset(self):
+        self._window = deque()
+        self._sum = 0.
+        self._sq_sum = 0.
+        self._first = None
+        self._latest = None  # only enters the window with the next reward
+
+    def update(self, reward):
+        """Adds the latest reward, returns the moving average at its step"""
+        reward = float(reward)
+        if self._first is None:
+            self._first = reward
+        else:
+            if len(self._window) == self.wind_lgth:
+                old = self._window.popleft()
+                self._sum -= old
+                self._sq_sum -= old * old
+            self._window.append(self._latest)
+            self._sum += self._latest
+            self._sq_sum += self._latest * self._latest
+        self._latest = reward
+        return self.mean
+
+    @property
+    def _padding(self):
+        return self.wind_lgth - len(self._window)
+
+    @property
+    def mean(self):
+        assert self._first is not None, 'no reward added yet'
+        return (self._sum + self._padding * self._first) / self.wind_lgth
+
+    @property
+    def std(self):
+        sq_mean = (self._sq_sum + self._padding * self._first * self._first) / self.wind_lgth
+        return np.sqrt(max(sq_mean - self.mean ** 2, 0.))
+
+    def _values(self):
+        # distinct values of the window, O(wind_lgth)
+        return list(self._window) + ([self._first] if self._padding else [])
+
+    @property
+    def min(self):
+        return min(self._values())
+
+    @property
+    def max(self):
+        return max(self._values())
+
+
 def soft_update_params(net, target_net, tau):
-    for param, target_param in zip(net.parameters(), target_net.parameters()):
-        target_param.data.copy_(
-            tau * param.data + (1 - tau) * target_param.data
-        )
+    """Moves the parameters of target_net towards the ones of net by tau, in place with foreach kernels
+    net and target_net can also be lists of modules updated together. A parameter tied in several modules
+    is updated once, tied parameters stay shared."""
+    nets = net if isinstance(net, (list, tuple)) else [net]
+    target_nets = target_net if isinstance(target_net, (list, tuple)) else [target_net]
+    pairs = {}
+    for net, target_net in zip(nets, target_nets):
+        for param, target_param in zip(net.parameters(), target_net.parameters()):
+            pairs[id(target_param)] = (param, target_param)
+    params = [param for param, _ in pairs.values()]
+    target_params = [target_param for _, target_param in pairs.values()]
+    with torch.no_grad():
+        torch._foreach_lerp_(target_params, params, tau)
+
+
+def get_device(device=None):
+    """Returns the torch device to run on, cuda when available unless a device is given"""
+    if device is None:
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    return torch.device(device)
+
+
+def setup_device(device=None, num_threads=0):
+    """Resolves the device of an experiment and sets the number of CPU threads used by torch (0 keeps the default)"""
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    return get_device(device)
 
 
 def set_seed_everywhere(seed):
@@ -124,7 +323,8 @@ def make_dir(dir_path):
 
 class SimpleBuffer(object):
 
-    def __init__(self, obs_shape, action_shape, capacity, batch_size, label=None):
+    def __init__(self, obs_shape, action_shape, capacity, batch_size, label=None, device=None):
+        self.device = get_device(device)
         self.capacity = capacity
         self.batch_size = batch_size
 
@@ -165,12 +365,13 @@ class SimpleBuffer(object):
                 0, self.capacity if self.full else self.idx, size=self.batch_size
             )
 
-        obses = torch.as_tensor(self.obses[idxs]).float().cuda()
-        actions = torch.as_tensor(self.actions[idxs]).float().cuda()
-        next_obses = torch.as_tensor(self.next_obses[idxs]).float().cuda()
+        # pixel obs are moved and cropped as uint8, before the conversion to float
+        obses = torch.as_tensor(self.obses[idxs]).to(self.device)
+        actions = torch.as_tensor(self.actions[idxs]).float().to(self.device)
+        next_obses = torch.as_tensor(self.next_obses[idxs]).to(self.device)
 
-        obses = random_crop(obses)
-        next_obses = random_crop(next_obses)
+        obses = random_crop(obses).float()
+        next_obses = random_crop(next_obses).float()
 
         return obses, actions, next_obses
 
@@ -181,11 +382,11 @@ class TrajectoryBuffer(SimpleBuffer):
        that's why observations and actions are stored this way
     """
 
-    def __init__(self, obs_shape, action_shape, capacity, batch_size, label=None):
+    def __init__(self, obs_shape, action_shape, capacity, batch_size, label=None, device=None):
         self.capacity = capacity
         self.batch_size = batch_size
 
-        super().__init__(obs_shape, action_shape, capacity, batch_size, label=label)
+        super().__init__(obs_shape, action_shape, capacity, batch_size, label=label, device=device)
 
         # the proprioceptive obs is stored as float32, pixels obs as uint8
         obs_dtype = np.float32 if len(obs_shape) == 1 else np.uint8
@@ -217,10 +418,10 @@ class TrajectoryBuffer(SimpleBuffer):
                 0, self.capacity if self.full else self.idx, size=self.batch_size
             )
         obses_0, actions_0, obses_1 = super().sample(idxs = idxs)
-        actions_1 = torch.as_tensor(self.actions_1[idxs]).float().cuda()
-        obses_2 = torch.as_tensor(self.obses_2[idxs]).float().cuda()
+        actions_1 = torch.as_tensor(self.actions_1[idxs]).float().to(self.device)
+        obses_2 = torch.as_tensor(self.obses_2[idxs]).to(self.device)
 
-        obses_2 = random_crop(obses_2)
+        obses_2 = random_crop(obses_2).float()
 
         return [obses_0, actions_0, obses_1, actions_1, obses_2]
 
@@ -229,10 +430,10 @@ class TrajectoryBuffer(SimpleBuffer):
 
         ix = np.random.randint(0, self.capacity if self.full else self.idx, size=1)
         obs_0, action_0, obs_1 = super().sample(idxs=ix)
-        action_1 = torch.as_tensor(self.actions_1[ix]).float().cuda()
-        obs_2 = torch.as_tensor(self.obses_2[ix]).float().cuda()
+        action_1 = torch.as_tensor(self.actions_1[ix]).float().to(self.device)
+        obs_2 = torch.as_tensor(self.obses_2[ix]).to(self.device)
 
-        obs_2 = random_crop(obs_2)
+        obs_2 = random_crop(obs_2).float()
 
         return [obs_0, action_0, obs_1, action_1, obs_2]
 
@@ -242,11 +443,11 @@ class ExtendedTrajectoryBuffer(TrajectoryBuffer):
            that's why observations and actions are stored this way
         """
 
-    def __init__(self, obs_shape, action_shape, capacity, batch_size, label=None):
+    def __init__(self, obs_shape, action_shape, capacity, batch_size, label=None, device=None):
         self.capacity = capacity
         self.batch_size = batch_size
 
-        super().__init__(obs_shape, action_shape, capacity, batch_size, label=label)
+        super().__init__(obs_shape, action_shape, capacity, batch_size, label=label, device=device)
 
         # the proprioceptive obs is stored as float32, pixels obs as uint8
         obs_dtype = np.float32 if len(obs_shape) == 1 else np.uint8
@@ -281,10 +482,10 @@ class ExtendedTrajectoryBuffer(TrajectoryBuffer):
             )
 
         obses_0, actions_0, obses_1, actions_1, obses_2 = super().sample(idxs = idxs)
-        actions_2 = torch.as_tensor(self.actions_2[idxs]).float().cuda()
-        obses_3 = torch.as_tensor(self.obses_3[idxs]).float().cuda()
+        actions_2 = torch.as_tensor(self.actions_2[idxs]).float().to(self.device)
+        obses_3 = torch.as_tensor(self.obses_3[idxs]).to(self.device)
 
-        obses_3 = random_crop(obses_3)
+        obses_3 = random_crop(obses_3).float()
 
         return obses_0, actions_0, obses_1, [obses_0, actions_0, obses_1, actions_1, obses_2, actions_2, obses_3 ]
 
@@ -293,17 +494,18 @@ class ExtendedTrajectoryBuffer(TrajectoryBuffer):
 
         ix = np.random.randint(0, self.capacity if self.full else self.idx, size=1)
         obs_0, action_0, obs_1, action_1, obs_2 = super().sample(idxs=ix)
-        action_2 = torch.as_tensor(self.actions_2[ix]).float().cuda()
-        obs_3 = torch.as_tensor(self.obses_3[ix]).float().cuda()
+        action_2 = torch.as_tensor(self.actions_2[ix]).float().to(self.device)
+        obs_3 = torch.as_tensor(self.obses_3[ix]).to(self.device)
 
-        obs_3 = random_crop(obs_3)
+        obs_3 = random_crop(obs_3).float()
 
         return [obs_0, action_0, obs_1, action_1, obs_2, action_2, obs_3]
 
 class ReplayBuffer(object):
     """Buffer to store environment transitions"""
 
-    def __init__(self, obs_shape, action_shape, capacity, batch_size, label=None):
+    def __init__(self, obs_shape, action_shape, capacity, batch_size, label=None, device=None):
+        self.device = get_device(device)
         self.capacity = capacity
         self.batch_size = batch_size
 
@@ -319,7 +521,8 @@ class ReplayBuffer(object):
         self.idx = 0
         self.full = False
 
-    def add(self, obs, action, reward, next_obs, done):
+    def add(self, obs, action, reward, next_obs, done, first=False):
+        """Adds a transition, first marks the first transition of an episode"""
         np.copyto(self.obses[self.idx], obs)
         np.copyto(self.actions[self.idx], action)
         np.copyto(self.next_obses[self.idx], next_obs)
@@ -329,51 +532,282 @@ class ReplayBuffer(object):
         self.idx = (self.idx + 1) % self.capacity
         self.full = self.full or self.idx == 0
 
-
-    def sample(self):
-        idxs = np.random.randint(
+    def _sample_idxs(self, rng=np.random):
+        return rng.randint(
             0, self.capacity if self.full else self.idx, size=self.batch_size
         )
 
-        rewards = torch.as_tensor(self.rewards[idxs]).cuda()
-        not_dones = torch.as_tensor(self.not_dones[idxs]).cuda()
-        obses = torch.as_tensor(self.obses[idxs]).float().cuda()
-        actions = torch.as_tensor(self.actions[idxs]).cuda()
-        next_obses = torch.as_tensor(self.next_obses[idxs]).float().cuda()
+    def _get_obses(self, idxs):
+        return self.obses[idxs], self.next_obses[idxs]
+
+    def _arrays(self):
+        return dict(obses=self.obses, actions=self.actions, next_obses=self.next_obses,
+                    rewards=self.rewards, not_dones=self.not_dones)
+
+    def _state(self):
+        return dict(idx=self.idx, full=self.full)
+
+    def save(self, save_dir):
+        """Writes a snapshot of the buffer content to save_dir, so that a preempted run can be resumed"""
+        make_dir(save_dir)
+        # the state is removed first and written last, a buffer interrupted while saving is never picked up by load
+        state_path = os.path.join(save_dir, 'state.json')
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        for name, array in self._arrays().items():
+            np.save(os.path.join(save_dir, f'{name}.npy'), array)
+        with open(state_path, 'w') as f:
+            json.dump(self._state(), f)
+
+    def load(self, save_dir):
+        """Restores the buffer content written by save"""
+        with open(os.path.join(save_dir, 'state.json'), 'r') as f:
+            state = json.load(f)
+        for name, array in self._arrays().items():
+            path = os.path.join(save_dir, f'{name}.npy')
+            saved = np.load(path, mmap_mode='r')
+            assert saved.shape == array.shape, f'buffer {name} has shape {saved.shape}, expected {array.shape}'
+            np.copyto(array, saved)
+        self.idx = state['idx']
+        self.full = state['full']
+
+    @staticmethod
+    def can_load(save_dir):
+        return os.path.exists(os.path.join(save_dir, 'state.json'))
+
+    def _gather(self, rng=np.random):
+        """Samples a batch on the host: uint8 obs and next_obs before cropping, actions, rewards, not_dones"""
+        idxs = self._sample_idxs(rng)
+        obses, next_obses = self._get_obses(idxs)
+        return obses, self.actions[idxs], self.rewards[idxs], next_obses, self.not_dones[idxs]
+
+    @staticmethod
+    def _process(batch, curl=False):
+        """Crops the observations of a gathered batch on device
+        Observations stay uint8, the encoders convert them to float when normalizing the 84x84 crops."""
+        obses, actions, rewards, next_obses, not_dones = batch
+
+        if curl:
+            pos = obses.clone()
 
         obses = random_crop(obses)
         next_obses = random_crop(next_obses)
 
-        return obses, actions, rewards, next_obses, not_dones
+        if not curl:
+            return obses, actions, rewards, next_obses, not_dones
 
+        pos = random_crop(pos)
+        curl_kwargs = dict(obs_anchor=obses, obs_pos=pos,
+                           time_anchor=None, time_pos=None)
 
-    def sample_curl(self):
-        idxs = np.random.randint(
-            0, self.capacity if self.full else self.idx, size=self.batch_size
-        )
+        return obses, actions, rewards, next_obses, not_dones, curl_kwargs
 
-        obses = torch.as_tensor(self.obses[idxs]).float().cuda()
-        actions = torch.as_tensor(self.actions[idxs]).cuda()
-        rewards = torch.as_tensor(self.rewards[idxs]).cuda()
-        next_obses = torch.as_tensor(self.next_obses[idxs]).float().cuda()
-        not_dones = torch.as_tensor(self.not_dones[idxs]).cuda()
+    def sample(self):
+        batch = [torch.as_tensor(x).to(self.device) for x in self._gather()]
+        return self._process(batch)
 
-        pos = obses.clone()
+    def sample_curl(self):
+        batch = [torch.as_tensor(x).to(self.device) for x in self._gather()]
+        return self._process(batch, curl=True)
+
+
+class FrameReplayBuffer(ReplayBuffer):
+    """Buffer to store environment transitions of frame-stacked pixel observations
+    Every rendered frame is stored once and stacks are rebuilt at sample time, instead of storing
+    obs and next_obs stacks which overlap in all but one frame (~2*k times less memory).
+    Slot j holds the newest frame of a next_obs together with the transition that led to it; the
+    frames of a new episode take k extra slots that are never sampled. Transitions must be added in the
+    order of their episode, the first one of each episode with first set.
+    With mmap_dir, the frame store is memory-mapped to mmap_dir/frames.npy and spills to disk. It is a working
+    store written at every add, mmap_dir must not be the directory of save, which snapshots it."""
+
+    def __init__(self, obs_shape, action_shape, capacity, batch_size, frame_stack=3, label=None, mmap_dir=None, device=None):
+        self.device = get_device(device)
+        assert len(obs_shape) == 3 and obs_shape[0] % frame_stack == 0, 'expected frame-stacked pixel obs'
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.frame_stack = frame_stack
+        self.obs_shape = obs_shape
+        frame_shape = (obs_shape[0] // frame_stack, *obs_shape[1:])
+
+        if mmap_dir is None:
+            self.frames = np.empty((capacity, *frame_shape), dtype=np.uint8)
+        else:
+            self.frames = self._open_frames(os.path.join(make_dir(mmap_dir), 'frames.npy'), (capacity, *frame_shape))
+        self.actions = np.empty((capacity, *action_shape), dtype=np.float32)
+        self.rewards = np.empty((capacity, 1), dtype=np.float32)
+        self.not_dones = np.empty((capacity, 1), dtype=np.float32)
+        self.ep_steps = np.zeros(capacity, dtype=np.int64) # slots since the first frame of the episode
+        self.valid = np.zeros(capacity, dtype=bool) # slot holds a transition that can be sampled
 
-        obses = random_crop(obses)
-        next_obses = random_crop(next_obses)
-        pos = random_crop(pos)
+        self.idx = 0
+        self.full = False
+        self._episode_open = False  # the last transition added can be continued
+        self._frame_offsets = np.arange(frame_stack - 1, -1, -1)
+
+    @staticmethod
+    def _open_frames(path, shape):
+        # an existing store is reused as is, its frames are overwritten by load or by add before being sampled
+        if os.path.exists(path):
+            frames = np.load(path, mmap_mode='r+')
+            if frames.shape == shape and frames.dtype == np.uint8:
+                return frames
+        return np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=shape)
+
+    def _add_frame(self, frame, ep_step, valid):
+        np.copyto(self.frames[self.idx], frame)
+        self.ep_steps[self.idx] = ep_step
+        self.valid[self.idx] = valid
+        # slots whose stack reaches back into the slot that was just overwritten can no longer be sampled
+        self.valid[(self.idx + np.arange(1, self.frame_stack + 1)) % self.capacity] = False
+        self.idx = (self.idx + 1) % self.capacity
+        self.full = self.full or self.idx == 0
 
-        curl_kwargs = dict(obs_anchor=obses, obs_pos=pos,
-                           time_anchor=None, time_pos=None)
+    def add(self, obs, action, reward, next_obs, done, first=False):
+        """Adds a transition, first marks the first transition of an episode"""
+        assert first or self._episode_open, 'transition does not continue an episode, first must be set'
+        frames = next_obs.reshape(self.frame_stack, -1, *next_obs.shape[1:])
+        if first:
+            # store all frames of obs, later transitions only add the newest frame of next_obs
+            for i, frame in enumerate(obs.reshape(frames.shape)):
+                self._add_frame(frame, i, False)
+        ep_step = self.ep_steps[self.idx - 1] + 1
+        np.copyto(self.actions[self.idx], action)
+        np.copyto(self.rewards[self.idx], reward)
+        np.copyto(self.not_dones[self.idx], not done)
+        self._add_frame(frames[-1], ep_step, True)
+        self._episode_open = not done
+
+    def _sample_idxs(self, rng=np.random):
+        valid_idxs = np.flatnonzero(self.valid[:self.capacity if self.full else self.idx])
+        assert len(valid_idxs) > 0, 'no transition to sample'
+        return valid_idxs[rng.randint(0, len(valid_idxs), size=self.batch_size)]
+
+    def _get_stacks(self, idxs):
+        """Gathers the frame stacks ending at slots idxs, repeating the first frame of the episode if needed"""
+        offsets = np.minimum(self._frame_offsets[None], self.ep_steps[idxs][:, None])
+        stacks = self.frames[(idxs[:, None] - offsets) % self.capacity]
+        return stacks.reshape(len(idxs), *self.obs_shape)
+
+    def _get_obses(self, idxs):
+        return self._get_stacks((idxs - 1) % self.capacity), self._get_stacks(idxs)
+
+    def _arrays(self):
+        return dict(frames=self.frames, actions=self.actions, rewards=self.rewards,
+                    not_dones=self.not_dones, ep_steps=self.ep_steps, valid=self.valid)
+
+    def load(self, save_dir):
+        super().load(save_dir)
+        # the next add starts a new episode, as the env is reset on resume
+        self._episode_open = False
+
+
+class PrefetchSampler(object):
+    """Samples batches of a replay buffer ahead of time in a background thread
+    Up to num_batches batches are gathered from the buffer into pinned memory and copied to device as
+    uint8 on a side stream, so that sampling overlaps with the updates. The random crops happen on device
+    when a batch is taken by sample or sample_curl. A batch waiting in
+    the queue does not contain the transitions added after it was gathered.
+    Other attributes are forwarded to the buffer, add and the sampling thread are serialized by a lock.
+    The thread draws indices from its own generator seeded with seed, the global one is left to the main thread."""
+
+    def __init__(self, replay_buffer, num_batches=2, seed=None, device=None):
+        self.replay_buffer = replay_buffer
+        self._rng = np.random.RandomState(seed)
+        self.num_batches = num_batches
+        self.device = replay_buffer.device if device is None else torch.device(device)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=num_batches)
+        self._stop = threading.Event()
+        self._thread = None
+        self._use_cuda = self.device.type == 'cuda'
+        if self._use_cuda:
+            self._stream = torch.cuda.Stream(self.device)
+            # a pinned staging slot is reused once the copy that last read it has completed
+            self._pinned = [None] * (num_batches + 2)
+            self._copied = [None] * (num_batches + 2)
+
+    def __getattr__(self, name):
+        # only called for missing attributes, replay_buffer is missing before __init__ sets it (e.g. on copy)
+        if name == 'replay_buffer':
+            raise AttributeError(name)
+        return getattr(self.replay_buffer, name)
+
+    def add(self, *args, **kwargs):
+        with self._lock:
+            self.replay_buffer.add(*args, **kwargs)
+
+    def save(self, save_dir):
+        with self._lock:
+            self.replay_buffer.save(save_dir)
+
+    def load(self, save_dir):
+        with self._lock:
+            self.replay_buffer.load(save_dir)
+
+    def _to_device(self, batch, slot):
+        if not self._use_cuda:
+            return [torch.as_tensor(x).to(self.device) for x in batch], None
+        if self._copied[slot] is not None:
+            self._copied[slot].synchronize()
+        if self._pinned[slot] is None:
+            self._pinned[slot] = [torch.empty(x.shape, dtype=torch.from_numpy(x).dtype).pin_memory() for x in batch]
+        pinned = self._pinned[slot]
+        for buf, x in zip(pinned, batch):
+            buf.copy_(torch.from_numpy(x))
+        with torch.cuda.stream(self._stream):
+            batch = [buf.to(self.device, non_blocking=True) for buf in pinned]
+            self._copied[slot] = torch.cuda.Event()
+            self._copied[slot].record(self._stream)
+        return batch, self._copied[slot]
+
+    def _prefetch(self):
+        slot = 0
+        try:
+            while not self._stop.is_set():
+                with self._lock:
+                    batch = self.replay_buffer._gather(self._rng)
+                batch = self._to_device(batch, slot)
+                slot = (slot + 1) % (self.num_batches + 2)
+                while not self._stop.is_set():
+                    try:
+                        self._queue.put(batch, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+        except Exception as e:
+            self._queue.put((e, None))
+
+    def _next(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._prefetch, daemon=True)
+            self._thread.start()
+        batch, copied = self._queue.get()
+        if isinstance(batch, Exception):
+            raise batch
+        if copied is not None:
+            stream = torch.cuda.current_stream(self.device)
+            stream.wait_event(copied)
+            for x in batch:
+                x.record_stream(stream)
+        return batch
 
-        return obses, actions, rewards, next_obses, not_dones, curl_kwargs
+    def sample(self):
+        return self.replay_buffer._process(self._next())
+
+    def sample_curl(self):
+        return self.replay_buffer._process(self._next(), curl=True)
 
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
 
 
 def get_curl_pos_neg(obs, replay_buffer):
     """Returns one positive pair + batch of negative samples from buffer"""
-    obs = torch.as_tensor(obs).cuda().float().unsqueeze(0)
+    obs = torch.as_tensor(obs).to(replay_buffer.device).float().unsqueeze(0)
     pos = obs.clone()
 
     obs = random_crop(obs)
@@ -386,8 +820,10 @@ def get_curl_pos_neg(obs, replay_buffer):
     return obs, obs_pos
 
 
-def batch_from_obs(obs, batch_size=32):
-    """Converts a pixel obs (C,H,W) to a batch (B,C,H,W) of given size"""
+def batch_from_obs(obs, batch_size=32, device=None):
+    """Converts a pixel obs (C,H,W) to a batch (B,C,H,W) of given size, a float tensor on device if given"""
+    if device is not None:
+        obs = torch.as_tensor(obs, device=device).float()
     if isinstance(obs, torch.Tensor):
         if len(obs.shape) == 3:
             obs = obs.unsqueeze(0)
@@ -409,21 +845,34 @@ def _rotate_single_with_label(x, label):
     return x
 
 
-def rotate(x):
-    """Randomly rotate a batch of images and return labels"""
-    images = []
-    labels = torch.randint(4, (x.size(0),), dtype=torch.long).to(x.device)
-    for img, label in zip(x, labels):
-        img = _rotate_single_with_label(img, label)
-        images.append(img.unsqueeze(0))
+_ROTATION_INDICES = {}
+
+
+def _rotation_indices(size, device):
+    """Returns for each label the flat pixel indices of an image of given size rotated by _rotate_single_with_label"""
+    key = (size, str(device))
+    if key not in _ROTATION_INDICES:
+        pixels = torch.arange(size * size).view(1, size, size)
+        _ROTATION_INDICES[key] = torch.stack(
+            [_rotate_single_with_label(pixels, label).reshape(-1) for label in range(4)]).to(device)
+    return _ROTATION_INDICES[key]
+
 
-    return torch.cat(images), labels
+def rotate(x, labels=None):
+    """Randomly rotate a batch of square images and return labels
+    Rotates the whole batch with a single gather of precomputed pixel indices, on the device of x."""
+    n, c, h, w = x.shape
+    assert h == w, 'images must be square'
+    if labels is None:
+        labels = torch.randint(4, (n,), dtype=torch.long).to(x.device)
+    index = _rotation_indices(h, x.device)[labels]
+    rotated = x.reshape(n, c, h * w).gather(2, index.unsqueeze(1).expand(n, c, h * w))
+    return rotated.view(n, c, h, w), labels
 
 
 def random_crop_cuda(x, size=84, w1=None, h1=None, return_w1_h1=False):
-    """Vectorized CUDA implementation of random crop"""
-    assert isinstance(x, torch.Tensor) and x.is_cuda, \
-        'input must be CUDA tensor'
+    """Vectorized torch implementation of random crop, runs on the device of x"""
+    assert isinstance(x, torch.Tensor), 'input must be a tensor'
 
     n = x.shape[0]
     img_size = x.shape[-1]
@@ -475,7 +924,6 @@ def random_crop(imgs, size=84, w1=None, h1=None, return_w1_h1=False):
 
     is_tensor = isinstance(imgs, torch.Tensor)
     if is_tensor:
-        assert imgs.is_cuda, 'input images are tensors but not cuda!'
         return random_crop_cuda(imgs, size=size, w1=w1, h1=h1, return_w1_h1=return_w1_h1)
 
     n = imgs.shape[0]
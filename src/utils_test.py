@@ -0,0 +1,186 @@
+"""Tests for utils.py, against the straightforward implementations they replace."""
+import glob
+import os
+import tempfile
+
+from absl.testing import absltest
+from absl.testing import parameterized
+import numpy as np
+import pandas as pd
+import torch
+from torch import nn
+
+import utils
+from agent.encoder import make_encoder
+from references import rotate_reference, soft_update_params_reference
+
+
+class ReplayBufferTest(absltest.TestCase):
+
+    def test_uint8_crops_are_encoded_as_float_crops(self):
+        rng = np.random.RandomState(0)
+        replay_buffer = utils.ReplayBuffer((9, 100, 100), (6,), capacity=16, batch_size=8, device='cpu')
+        for _ in range(16):
+            obs = rng.randint(0, 256, size=(9, 100, 100)).astype(np.uint8)
+            replay_buffer.add(obs, rng.uniform(-1, 1, size=6), rng.rand(), obs, False)
+        encoder = make_encoder((9, 84, 84), 50, 4, 32, -1)
+        batch = [torch.as_tensor(x) for x in replay_buffer._gather()]
+
+        torch.manual_seed(0)
+        obses = replay_buffer._process(batch)[0]
+        self.assertEqual(obses.dtype, torch.uint8)
+        torch.manual_seed(0)
+        expected = utils.random_crop(batch[0].float())
+        with torch.no_grad():
+            torch.testing.assert_close(encoder(obses), encoder(expected), rtol=0, atol=0)
+
+
+class FrameReplayBufferTest(absltest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.replay_buffer = utils.FrameReplayBuffer((9, 8, 8), (1,), capacity=16, batch_size=32, device='cpu')
+        self.obs = np.zeros((9, 8, 8), dtype=np.uint8)
+
+    def test_samples_valid_slots(self):
+        for t in range(5):
+            self.replay_buffer.add(self.obs, np.zeros(1), 0., self.obs, t == 4, first=t == 0)
+        idxs = self.replay_buffer._sample_idxs(np.random.RandomState(0))
+        self.assertTrue(self.replay_buffer.valid[idxs].all())
+        self.assertCountEqual(np.unique(idxs), np.flatnonzero(self.replay_buffer.valid))
+
+    def test_no_valid_slot_raises(self):
+        self.replay_buffer.add(self.obs, np.zeros(1), 0., self.obs, False, first=True)
+        self.replay_buffer.valid[:] = False
+        with self.assertRaises(AssertionError):
+            self.replay_buffer._sample_idxs()
+
+
+class PrefetchSamplerTest(absltest.TestCase):
+
+    def test_forwards_attributes_to_buffer(self):
+        replay_buffer = utils.ReplayBuffer((9, 8, 8), (1,), capacity=16, batch_size=8, device='cpu')
+        sampler = utils.PrefetchSampler(replay_buffer, device='cpu')
+        self.assertEqual(sampler.capacity, 16)
+
+    def test_missing_buffer_raises_attribute_error(self):
+        sampler = utils.PrefetchSampler.__new__(utils.PrefetchSampler)
+        self.assertFalse(hasattr(sampler, 'replay_buffer'))
+        self.assertFalse(hasattr(sampler, 'capacity'))
+
+
+class ColumnarRecorderTest(absltest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        self.rewards = rng.rand(5, 20)
+        self.changes = rng.rand(5, 20)
+
+    def _record(self, recorder_cls, num_episodes=5):
+        save_dir = tempfile.mkdtemp()
+        recorder = recorder_cls(save_dir, 'color_hard')
+        for i in range(num_episodes):
+            for change, reward in zip(self.changes[i], self.rewards[i]):
+                recorder.update(change, reward)
+            recorder.end_episode()
+        return save_dir, recorder
+
+    def test_matches_csv(self):
+        csv_dir, recorder = self._record(utils.AdaptRecorder)
+        recorder.save('performance_', adapt=True)
+        columns_dir, recorder = self._record(utils.ColumnarRecorder)
+        recorder.save('performance_', adapt=True)
+
+        csv_path, = glob.glob(os.path.join(csv_dir, '*.csv'))
+        results, = utils.load_results(os.path.join(columns_dir, '*')).values()
+        pd.testing.assert_frame_equal(results.to_frame(), pd.read_csv(csv_path, index_col=0))
+        np.testing.assert_allclose(results.episode_rewards(), self.rewards.sum(1))
+        np.testing.assert_array_equal(results.episode(2, 'change'), self.changes[2])
+
+    def test_unsaved_episodes_are_loaded(self):
+        save_dir, _ = self._record(utils.ColumnarRecorder, num_episodes=3)
+        results, = utils.load_results(os.path.join(save_dir, '.*')).values()
+        self.assertLen(results, 3)
+        np.testing.assert_allclose(results.episode_rewards(), self.rewards[:3].sum(1))
+
+
+class MovingAverageRewardTest(parameterized.TestCase):
+
+    @parameterized.parameters(1, 15, 100)
+    def test_matches_moving_average_reward(self, wind_lgth):
+        rewards = list(np.random.RandomState(0).rand(250))
+        tracker = utils.MovingAverageReward(wind_lgth)
+        streamed = [tracker.update(r) for r in rewards]
+        np.testing.assert_allclose(streamed, utils.moving_average_reward(rewards, wind_lgth=wind_lgth))
+
+    def test_window_statistics(self):
+        rewards = np.random.RandomState(0).rand(40)
+        tracker = utils.MovingAverageReward(15)
+        for i, r in enumerate(rewards):
+            tracker.update(r)
+            # the wind_lgth rewards preceding reward i, padded with the first reward
+            window = np.concatenate([np.full(15, rewards[0]), rewards[:i]])[-15:]
+            self.assertAlmostEqual(tracker.std, window.std())
+            self.assertEqual(tracker.min, window.min())
+            self.assertEqual(tracker.max, window.max())
+
+
+def _nets(seed):
+    torch.manual_seed(seed)
+    return nn.Sequential(nn.Linear(8, 16), nn.ReLU(), nn.Linear(16, 2))
+
+
+class SoftUpdateParamsTest(absltest.TestCase):
+
+    def test_matches_reference(self):
+        net, target_net = _nets(0), _nets(1)
+        expected = _nets(1)
+        for _ in range(3):
+            soft_update_params_reference(net, expected, 0.05)
+            utils.soft_update_params(net, target_net, 0.05)
+        for param, expected_param in zip(target_net.parameters(), expected.parameters()):
+            torch.testing.assert_close(param, expected_param)
+
+    def test_lists_of_modules(self):
+        nets, target_nets, expected = [_nets(0), _nets(1)], [_nets(2), _nets(3)], [_nets(2), _nets(3)]
+        utils.soft_update_params(nets, target_nets, 0.01)
+        for net, expected_net in zip(nets, expected):
+            soft_update_params_reference(net, expected_net, 0.01)
+        for target_net, expected_net in zip(target_nets, expected):
+            for param, expected_param in zip(target_net.parameters(), expected_net.parameters()):
+                torch.testing.assert_close(param, expected_param)
+
+    def test_tied_parameters_are_updated_once(self):
+        net, target_net = _nets(0), _nets(1)
+        other, other_target = _nets(2), _nets(3)
+        other[0].weight, other_target[0].weight = net[0].weight, target_net[0].weight
+        expected = target_net[0].weight.detach().clone()
+        utils.soft_update_params([net, other], [target_net, other_target], 0.1)
+        torch.testing.assert_close(target_net[0].weight, expected.lerp(net[0].weight.detach(), 0.1))
+        self.assertIs(other_target[0].weight, target_net[0].weight)
+
+
+class RotateTest(parameterized.TestCase):
+
+    @parameterized.parameters(1, 32, 128)
+    def test_matches_reference(self, batch_size):
+        x = torch.rand(batch_size, 9, 84, 84)
+        torch.manual_seed(0)
+        expected, expected_labels = rotate_reference(x)
+        torch.manual_seed(0)
+        rotated, labels = utils.rotate(x)
+        torch.testing.assert_close(labels, expected_labels, rtol=0, atol=0)
+        torch.testing.assert_close(rotated, expected, rtol=0, atol=0)
+
+    def test_given_labels(self):
+        x = torch.rand(4, 3, 84, 84)
+        labels = torch.arange(4)
+        rotated, returned_labels = utils.rotate(x, labels)
+        self.assertIs(returned_labels, labels)
+        for img, label, expected in zip(x, labels, rotated):
+            torch.testing.assert_close(utils._rotate_single_with_label(img, label), expected, rtol=0, atol=0)
+
+
+if __name__ == '__main__':
+    absltest.main()
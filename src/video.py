@@ -1,36 +1,160 @@
 import imageio
+import json
+import numpy as np
 import os
+import queue
+import threading
 from datetime import datetime
 
 
 class VideoRecorder(object):
-    def __init__(self, dir_name, height=100, width=100, camera_id=0, fps=25):
+    """Records episodes rendered at height x width, every every-th step
+    Frames are rendered into a fixed pool of max_frames buffers and encoded to disk by a background thread
+    as they come, so memory does not grow with the episode length; record blocks when the pool is empty."""
+
+    def __init__(self, dir_name, height=100, width=100, camera_id=0, fps=25, every=1, max_frames=16):
+        self.dir_name = dir_name
+        self.height = height
+        self.width = width
+        self.camera_id = camera_id
+        self.fps = fps
+        self.every = every
+        self.max_frames = max_frames
+        self.enabled = False
+        self._free = None
+        self._frames = None
+        self._thread = None
+        self._path = None
+        self._error = None
+
+    def init(self, enabled=True):
+        self._stop(discard=True)
+        self._step = 0
+        self.enabled = self.dir_name is not None and enabled
+
+    def record(self, env, losses=[]):
+        if not self.enabled:
+            return
+        self._step += 1
+        if (self._step - 1) % self.every:
+            return
+        if self._thread is None:
+            self._start()
+        frame = self._free.get()
+        env.render(
+            mode='rgb_array',
+            height=self.height,
+            width=self.width,
+            camera_id=self.camera_id,
+            out=frame
+        )
+        if 'video' in env._mode:
+            greenscreen = env.env.env
+            np.copyto(frame, greenscreen.apply_to(frame))
+        self._frames.put(frame)
+
+    def save(self, file_name):
+        if self.enabled and self._thread is not None:
+            file_name = datetime.now().strftime("%H-%M-%S") + file_name
+            path = self._path
+            self._stop()
+            os.replace(path, os.path.join(self.dir_name, file_name))
+
+    def _start(self):
+        """Opens the writer of the current episode and starts its encoding thread"""
+        if self._free is None:
+            self._free = queue.Queue()
+            for _ in range(self.max_frames):
+                self._free.put(np.empty((self.height, self.width, 3), dtype=np.uint8))
+        self._frames = queue.Queue()
+        self._path = os.path.join(self.dir_name, f'.recording_{os.getpid()}_{id(self)}.mp4')
+        writer = imageio.get_writer(self._path, fps=self.fps)
+        self._error = None
+        self._thread = threading.Thread(target=self._encode, args=(writer,), daemon=True)
+        self._thread.start()
+
+    def _encode(self, writer):
+        try:
+            while True:
+                frame = self._frames.get()
+                if frame is None:
+                    break
+                try:
+                    writer.append_data(frame)
+                finally:
+                    self._free.put(frame)
+        except Exception as e:
+            self._error = e
+            # keep returning frames so that record never blocks
+            while frame is not None:
+                frame = self._frames.get()
+                if frame is not None:
+                    self._free.put(frame)
+        finally:
+            writer.close()
+
+    def _stop(self, discard=False):
+        """Waits for the encoding thread to write all queued frames, deletes the video if discard"""
+        if self._thread is None:
+            return
+        self._frames.put(None)
+        self._thread.join()
+        self._thread = None
+        if discard and os.path.exists(self._path):
+            os.remove(self._path)
+        if self._error is not None and not discard:
+            raise self._error
+
+
+class StateRecorder(object):
+    """Drop-in replacement of VideoRecorder that records the physics state of the env instead of rendering it
+    Saves for every recorded step the state, and the green screen frame index, along with the color setting of
+    the episode, so that render_videos.py renders the same video offline."""
+
+    def __init__(self, dir_name, height=100, width=100, camera_id=0, fps=25, every=1):
         self.dir_name = dir_name
         self.height = height
         self.width = width
         self.camera_id = camera_id
         self.fps = fps
-        self.frames = []
+        self.every = every
+        self.enabled = False
 
     def init(self, enabled=True):
-        self.frames = []
+        self.states = []
+        self.frame_idxs = []
+        self.meta = None
+        self._step = 0
         self.enabled = self.dir_name is not None and enabled
 
     def record(self, env, losses=[]):
-        if self.enabled:
-            frame = env.render(
-                mode='rgb_array',
+        if not self.enabled:
+            return
+        self._step += 1
+        if (self._step - 1) % self.every:
+            return
+        if self.meta is None:
+            dmc_env = env._get_dmc_wrapper()
+            setting = env.get_setting()
+            self.meta = dict(
+                domain_name=dmc_env._domain_name,
+                task_name=dmc_env._task_name,
+                mode=env._mode,
+                setting=None if setting is None else {k: np.asarray(v).tolist() for k, v in setting.items()},
                 height=self.height,
                 width=self.width,
-                camera_id=self.camera_id
+                camera_id=self.camera_id,
+                fps=self.fps
             )
-            if 'video' in env._mode:
-                greenscreen = env.env.env
-                frame = greenscreen.apply_to(frame)
-            self.frames.append(frame)
+        self.states.append(env.get_state())
+        self.frame_idxs.append(env.env.env._current_frame)
 
     def save(self, file_name):
-        if self.enabled:
-            file_name = datetime.now().strftime("%H-%M-%S") + file_name
-            path = os.path.join(self.dir_name, file_name)
-            imageio.mimsave(path, self.frames, fps=self.fps)
+        if self.enabled and self.states:
+            file_name = datetime.now().strftime("%H-%M-%S") + os.path.splitext(file_name)[0] + '.npz'
+            np.savez(
+                os.path.join(self.dir_name, file_name),
+                states=np.stack(self.states),
+                frame_idxs=np.array(self.frame_idxs),
+                meta=json.dumps(self.meta)
+            )